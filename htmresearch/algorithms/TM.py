@@ -20,7 +20,6 @@ import copy
 import nupic.math
 from nupic.support.consoleprinter import ConsolePrinterMixin
 from nupic.bindings.math import Random
-from nupic.bindings.algorithms import isSegmentActive, getSegmentActivityLevel
 
 # Default verbosity while running unit tests
 VERBOSITY = 0
@@ -175,6 +174,11 @@ class TM(ConsolePrinterMixin):
       for i in xrange(self.cellsPerColumn):
         self.cells[c].append([])
 
+    # The synapses of all the segments, stored in flat arrays so that segment
+    # activity can be computed for all segments at once.
+    self.segmentStorage = SegmentStorage(
+      synapsesPerSegment=max(1, 2 * self.newSynapseCount))
+
     # iteration index
     self.iterationIdx = 0
 
@@ -207,6 +211,7 @@ class TM(ConsolePrinterMixin):
       'segmentUpdates',
       '_internalStats',
       '_stats',
+      '_paddedStates',
       ]
 
   #############################################################################
@@ -223,6 +228,10 @@ class TM(ConsolePrinterMixin):
 
     self.sequenceSignatures = []
 
+    # Padded copies of the states read by the per-cell segment searches, see
+    # _getPaddedState.
+    self._paddedStates = {}
+
     # Allocate and reset all stats
     self.resetStats()
 
@@ -284,6 +293,63 @@ class TM(ConsolePrinterMixin):
   def __del__(self):
     pass
 
+  #############################################################################
+  def _addSegment(self, c, i, segment):
+    """
+    Append a segment to the list of segments of cell (c,i).
+    """
+    self.segmentStorage.cells[segment._slot] = c * self.cellsPerColumn + i
+    self.cells[c][i].append(segment)
+
+  #############################################################################
+  def _removeSegment(self, c, i, segment):
+    """
+    Remove a segment from cell (c,i) and free its row of the synapse arrays.
+    The segment keeps a copy of its synapses, so that it can still be printed
+    or compared.
+    """
+    self.cells[c][i].remove(segment)
+    segment._detach()
+
+  #############################################################################
+  def _padState(self, activeState):
+    """
+    Flatten a numberOfCols x cellsPerColumn state for _computeSegmentActivity.
+    The extra trailing 0 is picked by the -1 sources past segment ends.
+    """
+    paddedState = numpy.zeros(self._numberOfCells + 1, dtype="int32")
+    paddedState[:-1] = activeState.reshape(-1)
+    return paddedState
+
+  #############################################################################
+  def _getPaddedState(self, activeState):
+    """
+    Return _padState(activeState), building it only once per time step. The
+    cache is cleared whenever the TM updates its states, so activeState must
+    not be modified in between by the caller.
+    """
+    key = id(activeState)
+    if key not in self._paddedStates:
+      # The state is kept with its padded copy, so that its id isn't reused.
+      self._paddedStates[key] = (activeState, self._padState(activeState))
+    return self._paddedStates[key][1]
+
+  #############################################################################
+  def _computeSegmentActivity(self, paddedState, slots,
+                              connectedSynapsesOnly=False):
+    """
+    Compute the activity level of several segments given a state, see
+    getSegmentActivityLevel.
+
+    @param paddedState (numpy.ndarray) State padded by _padState
+    @param slots (slice or list) Rows of the synapse arrays
+    @returns (numpy.ndarray) Activity of each segment
+    """
+    activity = paddedState[self.segmentStorage.sources[slots]]
+    if connectedSynapsesOnly:
+      activity *= (self.segmentStorage.permanences[slots] >= self.connectedPerm)
+    return activity.sum(axis=1)
+
   #############################################################################
   def setRandomSeed(self, seed):
     """ Seed the random number generator.
@@ -323,6 +389,7 @@ class TM(ConsolePrinterMixin):
 
     # Flush the segment update queue
     self.segmentUpdates = {}
+    self._paddedStates.clear()
 
     self._internalStats['nInfersSinceReset'] = 0
 
@@ -977,6 +1044,7 @@ class TM(ConsolePrinterMixin):
 
       # Predicted state at "t-1" becomes the active state at "t"
       self.activeState['t'][:,:] = self.predictedState['t-1'][:,:]
+      self._paddedStates.clear()
 
       # Predicted state and confidence are set in phase2.
       self.predictedState['t'].fill(0)
@@ -1030,6 +1098,7 @@ class TM(ConsolePrinterMixin):
     """
     for variableName in self._getTPDynamicStateVariableNames():
       self.__dict__[variableName] = tpDynamicState.pop(variableName)
+    self._paddedStates.clear()
 
 
   #############################################################################
@@ -1051,32 +1120,41 @@ class TM(ConsolePrinterMixin):
     #   for reinforcement,
     # - if pooling is on, try to find the best weakly activated segment to
     #   reinforce it, else create a new pooling segment.
-    for c in xrange(self.numberOfCols):
+    # sum(connected synapses) >= activationThreshold? This is computed for all
+    # the segments at once, then only the cells with active segments are
+    # visited, in column and cell order.
+    slots = slice(0, self.segmentStorage.numSlots)
+    segmentCells = self.segmentStorage.cells[slots]
+    activeSegments = (
+      (self._computeSegmentActivity(self._padState(self.activeState['t']),
+                                    slots, connectedSynapsesOnly=True)
+       >= self.activationThreshold) &
+      (segmentCells >= 0))
+    self.confidence['t'].fill(0.0)
 
-      buPredicted = False # whether any cell in the column is predicted
-      for i in xrange(self.cellsPerColumn):
-        # Iterate over each of the segments of this cell
-        maxConfidence = 0
-        for s in self.cells[c][i]:
+    for cell in numpy.unique(segmentCells[activeSegments]):
+      c, i = divmod(int(cell), self.cellsPerColumn)
+
+      # Iterate over each of the segments of this cell
+      maxConfidence = 0
+      for s in self.cells[c][i]:
 
-          # sum(connected synapses) >= activationThreshold?
-          if self.isSegmentActive(s, self.activeState['t']):
+        if activeSegments[s._slot]:
 
-            self.predictedState['t'][c,i] = 1
-            buPredicted = True
-            maxConfidence = max(maxConfidence, s.dutyCycle(readOnly=True))
+          self.predictedState['t'][c,i] = 1
+          maxConfidence = max(maxConfidence, s.dutyCycle(readOnly=True))
 
-            if doLearn:
-              s.totalActivations += 1    # increment activationFrequency
-              s.lastActiveIteration = self.iterationIdx
-              # mark this segment for learning
-              activeUpdate = self.getSegmentActiveSynapses(c,i,s,'t')
-              activeUpdate.phase1Flag = False
-              self.addToSegmentUpdates(c, i, activeUpdate)
+          if doLearn:
+            s.totalActivations += 1    # increment activationFrequency
+            s.lastActiveIteration = self.iterationIdx
+            # mark this segment for learning
+            activeUpdate = self.getSegmentActiveSynapses(c,i,s,'t')
+            activeUpdate.phase1Flag = False
+            self.addToSegmentUpdates(c, i, activeUpdate)
 
-        # Store the max confidence seen among all the weak and strong segments
-        #  as the cell's confidence.
-        self.confidence['t'][c,i] = maxConfidence
+      # Store the max confidence seen among all the weak and strong segments
+      #  as the cell's confidence.
+      self.confidence['t'][c,i] = maxConfidence
 
 
   def compute(self, bottomUpInput, enableLearn, computeInfOutput=None):
@@ -1134,6 +1212,7 @@ class TM(ConsolePrinterMixin):
     self.activeState['t'].fill(0)
     self.predictedState['t'].fill(0)
     self.confidence['t'].fill(0.0)
+    self._paddedStates.clear()
 
     # Phase 1: calculate current state for each cell
     # For each column (winning in the SP):
@@ -1231,6 +1310,7 @@ class TM(ConsolePrinterMixin):
     self.learnState['t'][:,:] = 0
     self.confidence['t-1'][:,:] = self.confidence['t'][:,:]
     self.confidence['t'].fill(0.0)
+    self._paddedStates.clear()
 
     # Update segment duty cycles if we are crossing a "tier"
     # We determine if it's time to update the segment duty cycles. Since the
@@ -1329,33 +1409,7 @@ class TM(ConsolePrinterMixin):
     # it can be called in adaptSegments, in the case where we
     # do global decay only episodically.
     if self.globalDecay > 0.0 and ((self.iterationIdx % self.maxAge) == 0):
-      for c, i in product(xrange(self.numberOfCols), xrange(self.cellsPerColumn)):
-
-        segsToDel = [] # collect and remove outside the loop
-        for segment in self.cells[c][i]:
-          age = self.iterationIdx - segment[0][self.kSegLastActiveIteration]
-          if age <= self.maxAge:
-            continue
-
-          #print "Decrementing seg age %d:" % (age), c, i, segment
-          synsToDel = [] # collect and remove outside the loop
-          for synapse in segment.syns: # skip sequenceSegment flag
-
-            synapse[2] = synapse[2] - self.globalDecay # decrease permanence
-
-            if synapse[2] <= 0:
-              synsToDel.append(synapse) # add to list to delete
-
-          if len(synsToDel) == len(segment.syns): # 1 for sequenceSegment flag
-            segsToDel.append(segment) # will remove the whole segment
-          elif len(synsToDel) > 0:
-            for syn in synsToDel: # remove some synapses on segment
-              segment.syns.remove(syn)
-
-        for seg in segsToDel: # remove some segments of this cell
-          self.cleanUpdatesList(c,i,seg)
-          self.cells[c][i].remove(seg)
-
+      self.applyGlobalDecay()
 
     # Update the prediction score stats
     # Learning always includes inference
@@ -1374,6 +1428,35 @@ class TM(ConsolePrinterMixin):
 
     return self.computeOutput()
 
+  #############################################################################
+  def applyGlobalDecay(self):
+    """
+    Decrease the permanences of the segments that have not been active in the
+    last maxAge iterations by globalDecay. Synapses whose permanence reaches 0
+    are removed, and segments that lose all their synapses are destroyed.
+    """
+    for c, i in product(xrange(self.numberOfCols), xrange(self.cellsPerColumn)):
+
+      segsToDel = [] # collect and remove outside the loop
+      for segment in self.cells[c][i]:
+        age = self.iterationIdx - segment.lastActiveIteration
+        if age <= self.maxAge:
+          continue
+
+        #print "Decrementing seg age %d:" % (age), c, i, segment
+        perms = segment._getPermanences()
+        perms -= self.globalDecay # decrease permanence
+        synsToDel = numpy.flatnonzero(perms <= 0)
+
+        if len(synsToDel) == len(perms):
+          segsToDel.append(segment) # will remove the whole segment
+        elif len(synsToDel) > 0:
+          segment._removeSynapses(synsToDel) # remove some synapses
+
+      for seg in segsToDel: # remove some segments of this cell
+        self.cleanUpdatesList(c,i,seg)
+        self._removeSegment(c, i, seg)
+
   #############################################################################
   def columnConfidences(self, cellConfidences=None):
     """ Compute the column confidences given the cell confidences. If
@@ -1450,16 +1533,15 @@ class TM(ConsolePrinterMixin):
     for segment in segList:
 
       # List if synapses to delete
-      synsToDel = [syn for syn in segment.syns if syn[2] < minPermanence]
+      synsToDel = numpy.flatnonzero(segment._getPermanences() < minPermanence)
 
-      if len(synsToDel) == len(segment.syns):
+      if len(synsToDel) == segment.getNumSynapses():
         segsToDel.append(segment) # will remove the whole segment
       else:
         if len(synsToDel) > 0:
-          for syn in synsToDel: # remove some synapses on segment
-            segment.syns.remove(syn)
-            nSynsRemoved += 1
-        if len(segment.syns) < minNumSyns:
+          segment._removeSynapses(synsToDel) # remove some synapses on segment
+          nSynsRemoved += len(synsToDel)
+        if segment.getNumSynapses() < minNumSyns:
           segsToDel.append(segment)
 
     # Remove segments that don't have enough synapses and also take them
@@ -1467,8 +1549,8 @@ class TM(ConsolePrinterMixin):
     nSegsRemoved += len(segsToDel)
     for seg in segsToDel: # remove some segments of this cell
       self.cleanUpdatesList(colIdx, cellIdx, seg)
-      self.cells[colIdx][cellIdx].remove(seg)
-      nSynsRemoved += len(seg.syns)
+      nSynsRemoved += seg.getNumSynapses()
+      self._removeSegment(colIdx, cellIdx, seg)
 
     return nSegsRemoved, nSynsRemoved
 
@@ -1675,9 +1757,12 @@ class TM(ConsolePrinterMixin):
     all the synapses of the segment, at either t or t-1.
     """
 
-    # todo: Computing in C, use function getSegmentActivityLevel
-    return getSegmentActivityLevel(seg.syns, activeState, connectedSynapsesOnly,
-                                   self.connectedPerm)
+    # The synapses are read through the segment, so that this also works for
+    # segments that were destroyed and no longer own a row of the TM storage.
+    activity = activeState.reshape(-1)[seg._getSources()] != 0
+    if connectedSynapsesOnly:
+      activity &= seg._getPermanences() >= self.connectedPerm
+    return int(numpy.count_nonzero(activity))
 
   #############################################################################
   def isSegmentActive(self, seg, activeState):
@@ -1688,9 +1773,9 @@ class TM(ConsolePrinterMixin):
     Notes: studied various cutoffs, none of which seem to be worthwhile
            list comprehension didn't help either
     """
-    # Computing in C - *much* faster
-    return isSegmentActive(seg.syns, activeState,
-                           self.connectedPerm, self.activationThreshold)
+    return (self.getSegmentActivityLevel(seg, activeState,
+                                         connectedSynapsesOnly=True)
+            >= self.activationThreshold)
 
 
   ##############################################################################
@@ -1711,8 +1796,8 @@ class TM(ConsolePrinterMixin):
     if s is not None: # s can be None, if adding a new segment
 
       # Here we add *integers* to activeSynapses
-      activeSynapses = [idx for idx, syn in enumerate(s.syns) \
-                        if activeState[syn[0], syn[1]]]
+      activeSynapses = numpy.flatnonzero(
+        activeState.reshape(-1)[s._getSources()]).tolist()
 
     if newSynapses: # add a few more synapses
 
@@ -1748,9 +1833,11 @@ class TM(ConsolePrinterMixin):
     bestActivation = self.activationThreshold
     which = -1
 
-    for j,s in enumerate(self.cells[c][i]):
+    activities = self._computeSegmentActivity(
+      self._getPaddedState(self.activeState[timeStep]),
+      [s._slot for s in self.cells[c][i]], connectedSynapsesOnly=True)
 
-      activity = self.getSegmentActivityLevel(s, self.activeState[timeStep], connectedSynapsesOnly = True)
+    for j, activity in enumerate(activities):
 
       if activity >= bestActivation:
         bestActivation = activity
@@ -1789,9 +1876,11 @@ class TM(ConsolePrinterMixin):
       cands = [syn for syn in zip(tmpCandidates[0], tmpCandidates[1])]
     else:
       # We exclude any synapse that is already in this segment.
-      synapsesAlreadyInSegment = set((syn[0], syn[1]) for syn in s.syns)
-      cands = [syn for syn in zip(tmpCandidates[0], tmpCandidates[1]) \
-               if (syn[0], syn[1]) not in synapsesAlreadyInSegment]
+      notInSegment = ~numpy.in1d(
+        tmpCandidates[0] * self.cellsPerColumn + tmpCandidates[1],
+        s._getSources())
+      cands = zip(tmpCandidates[0][notInSegment],
+                  tmpCandidates[1][notInSegment])
 
     if n == 1: # so that we don't shuffle if only one is needed
       idx = self._random.getUInt32(len(cands))
@@ -1815,14 +1904,24 @@ class TM(ConsolePrinterMixin):
     bestSegIdxInCol = -1
     bestCellInCol = -1
 
+    # The activities of all the segments of the column, cell after cell
+    slots = [s._slot for cellSegments in self.cells[c] for s in cellSegments]
+    if len(slots) == 0:
+      return (None, None)
+    activities = self._computeSegmentActivity(
+      self._getPaddedState(activeState), slots).tolist()
+    pos = 0
+
     for i in xrange(self.cellsPerColumn):
 
       maxSegActivity = 0
       maxSegIdx = 0
 
-      for j,s in enumerate(self.cells[c][i]):
+      numSegments = len(self.cells[c][i])
+      cellActivities = activities[pos:pos+numSegments]
+      pos += numSegments
 
-        activity = self.getSegmentActivityLevel(s, activeState, connectedSynapsesOnly =False)
+      for j, activity in enumerate(cellActivities):
 
         if self.verbosity >= 6:
           print " Segment Activity for column ", c, " cell ", i, " segment ", " j is ", activity
@@ -1854,9 +1953,10 @@ class TM(ConsolePrinterMixin):
     """
     maxActivity, which = self.minThreshold, -1
 
-    for j,s in enumerate(self.cells[c][i]):
-      activity = self.getSegmentActivityLevel(s, activeState,
-                                              connectedSynapsesOnly=False)
+    activities = self._computeSegmentActivity(
+      self._getPaddedState(activeState), [s._slot for s in self.cells[c][i]])
+
+    for j, activity in enumerate(activities):
 
       if activity >= maxActivity:
         maxActivity, which = activity, j
@@ -1887,27 +1987,7 @@ class TM(ConsolePrinterMixin):
 
     retval:   True if synapse reached 0
     """
-
-    reached0 = False
-
-    if delta > 0:
-      for synapse in synapses:
-        segment[synapse][2] = newValue = segment[synapse][2] + delta
-
-        # Cap synapse permanence at permanenceMax
-        if newValue > self.permanenceMax:
-          segment[synapse][2] = self.permanenceMax
-
-    else:
-      for synapse in synapses:
-        segment[synapse][2] = newValue = segment[synapse][2] + delta
-
-        # Cap min synapse permanence to 0 in case there is no global decay
-        if newValue < 0:
-          segment[synapse][2] = 0
-          reached0 = True
-
-    return reached0
+    return segment.updateSynapses(synapses, delta)
 
 
   ################################################################################
@@ -2040,7 +2120,7 @@ class TM(ConsolePrinterMixin):
         # First, decrement synapses that are not active
         # s is a synapse *index*, with index 0 in the segment being the tuple
         # (segId, sequence segment flag). See below, creation of segments.
-        lastSynIndex = len(segment.syns) - 1
+        lastSynIndex = segment.getNumSynapses() - 1
         inactiveSynIndices = [s for s in xrange(0, lastSynIndex+1) \
                               if s not in synToUpdate]
         trimSegment = segment.updateSynapses(inactiveSynIndices,
@@ -2094,7 +2174,7 @@ class TM(ConsolePrinterMixin):
         print "New segment for cell[%d,%d]" %(c,i),
         newSegment.printSegment()
 
-      self.cells[c][i].append(newSegment)
+      self._addSegment(c, i, newSegment)
 
 
     return trimSegment
@@ -2178,6 +2258,108 @@ class TM(ConsolePrinterMixin):
 ################################################################################
 
 
+class SegmentStorage(object):
+  """
+  Flat storage for the synapses of segments. Each segment owns a row of the
+  arrays, its "slot":
+
+  - sources[slot, k] is the flat index (column * cellsPerColumn + cell) of the
+    presynaptic cell of the k'th synapse of the segment, or -1 past the end of
+    the segment.
+  - permanences[slot, k] is the permanence of that synapse.
+  - numSynapses[slot] is the number of synapses of the segment.
+  - cells[slot] is the flat index of the cell owning the segment, or -1 if the
+    segment isn't on a cell.
+
+  Rows are reused after their segment is destroyed. Both dimensions grow as
+  needed.
+  """
+
+  def __init__(self, numSlots=64, synapsesPerSegment=20):
+    self.sources = -numpy.ones((numSlots, synapsesPerSegment), dtype="int32")
+    self.permanences = numpy.zeros((numSlots, synapsesPerSegment),
+                                   dtype="float32")
+    self.numSynapses = numpy.zeros(numSlots, dtype="int32")
+    self.cells = -numpy.ones(numSlots, dtype="int32")
+
+    # Number of slots that were ever used, and slots available for reuse
+    self.numSlots = 0
+    self.freeSlots = []
+
+
+  def allocateSlot(self):
+    """
+    Return the slot of a new segment without synapses.
+    """
+    if len(self.freeSlots) > 0:
+      return self.freeSlots.pop()
+
+    if self.numSlots == len(self.numSynapses):
+      self.sources = numpy.vstack((self.sources,
+                                   -numpy.ones_like(self.sources)))
+      self.permanences = numpy.vstack((self.permanences,
+                                       numpy.zeros_like(self.permanences)))
+      self.numSynapses = numpy.append(self.numSynapses,
+                                      numpy.zeros_like(self.numSynapses))
+      self.cells = numpy.append(self.cells, -numpy.ones_like(self.cells))
+
+    self.numSlots += 1
+    return self.numSlots - 1
+
+
+  def freeSlot(self, slot):
+    """
+    Clear a slot and make it available for a new segment.
+    """
+    self.sources[slot] = -1
+    self.permanences[slot] = 0
+    self.numSynapses[slot] = 0
+    self.cells[slot] = -1
+    self.freeSlots.append(slot)
+
+
+  def getSources(self, slot):
+    return self.sources[slot, :self.numSynapses[slot]]
+
+
+  def getPermanences(self, slot):
+    return self.permanences[slot, :self.numSynapses[slot]]
+
+
+  def appendSynapse(self, slot, source, permanence):
+    numSynapses = self.numSynapses[slot]
+    width = self.sources.shape[1]
+    if numSynapses == width:
+      self.sources = numpy.hstack((self.sources,
+                                   -numpy.ones_like(self.sources)))
+      self.permanences = numpy.hstack((self.permanences,
+                                       numpy.zeros_like(self.permanences)))
+
+    self.sources[slot, numSynapses] = source
+    self.permanences[slot, numSynapses] = permanence
+    self.numSynapses[slot] = numSynapses + 1
+
+
+  def removeSynapses(self, slot, synapses):
+    """
+    Remove synapses from a segment, keeping the order of the other ones.
+
+    @param synapses (list) Indices of the synapses within the segment
+    """
+    numSynapses = self.numSynapses[slot]
+    keep = numpy.ones(numSynapses, dtype="bool")
+    keep[numpy.asarray(synapses, dtype="int")] = False
+    numKept = numpy.count_nonzero(keep)
+
+    self.sources[slot, :numKept] = self.sources[slot, :numSynapses][keep]
+    self.permanences[slot, :numKept] = (
+      self.permanences[slot, :numSynapses][keep])
+    self.sources[slot, numKept:numSynapses] = -1
+    self.permanences[slot, numKept:numSynapses] = 0
+    self.numSynapses[slot] = numKept
+
+
+
 class Segment(object):
   """
   The Segment class is a container for all of the segment variables and
@@ -2213,8 +2395,59 @@ class Segment(object):
     self._lastPosDutyCycle = 1.0 / tp.lrnIterationIdx
     self._lastPosDutyCycleIteration = tp.lrnIterationIdx
 
-    # Each synapse is a tuple (srcCellCol, srcCellIdx, permanence)
-    self.syns = []
+    # The synapses are stored in a row of the TM's segment storage.
+    self._storage = tp.segmentStorage
+    self._slot = self._storage.allocateSlot()
+
+
+  @property
+  def syns(self):
+    """
+    The synapses of the segment, as a list of tuples
+    (srcCellCol, srcCellIdx, permanence). Use the Segment methods to modify
+    them.
+    """
+    srcCellCols, srcCellIdxs = divmod(self._getSources(),
+                                      self.tp.cellsPerColumn)
+    return zip(srcCellCols.tolist(), srcCellIdxs.tolist(),
+               self._getPermanences())
+
+
+  def _getSources(self):
+    """
+    Flat indices of the presynaptic cells, see SegmentStorage.
+    """
+    return self._storage.getSources(self._slot)
+
+
+  def _getPermanences(self):
+    """
+    Permanences of the synapses. This is a view, so it can be modified.
+    """
+    return self._storage.getPermanences(self._slot)
+
+
+  def _removeSynapses(self, synapses):
+    """
+    Remove the synapses with the specified indices.
+    """
+    self._storage.removeSynapses(self._slot, synapses)
+
+
+  def _detach(self):
+    """
+    Move the synapses of a destroyed segment out of the TM's storage, so that
+    its row can be reused while this object remains valid.
+    """
+    storage = SegmentStorage(numSlots=1,
+                             synapsesPerSegment=max(1, self.getNumSynapses()))
+    slot = storage.allocateSlot()
+    for source, permanence in zip(self._getSources(), self._getPermanences()):
+      storage.appendSynapse(slot, source, permanence)
+
+    self._storage.freeSlot(self._slot)
+    self._storage = storage
+    self._slot = slot
 
 
   def __ne__(self, s):
@@ -2227,11 +2460,11 @@ class Segment(object):
     if set(d1) != set(d2):
       return False
     for k, v in d1.iteritems():
-      if k in ('tp',):
+      if k in ('tp', '_storage', '_slot'):
         continue
       elif v != d2[k]:
         return False
-    return True
+    return self.syns == s.syns
 
 
   def dutyCycle(self, active=False, readOnly=False):
@@ -2357,7 +2590,7 @@ class Segment(object):
 
 
   def getNumSynapses(self):
-    return len(self.syns)
+    return int(self._storage.numSynapses[self._slot])
 
 
   def freeNSynapses(self, numToFree, inactiveSynapseIndices, verbosity= 0):
@@ -2369,7 +2602,7 @@ class Segment(object):
     @param inactiveSynapseIndices list of the inactive synapse indices.
     """
     # Make sure numToFree isn't larger than the total number of syns we have
-    assert (numToFree <= len(self.syns))
+    assert (numToFree <= self.getNumSynapses())
 
     if (verbosity >= 4):
       print "\nIn PY freeNSynapses with numToFree =", numToFree,
@@ -2378,9 +2611,11 @@ class Segment(object):
         print self.syns[i][0:2],
       print
 
+    allPerms = self._getPermanences()
+
     # Remove the lowest perm inactive synapses first
     if len(inactiveSynapseIndices) > 0:
-      perms = numpy.array([self.syns[i][2] for i in inactiveSynapseIndices])
+      perms = allPerms[numpy.asarray(inactiveSynapseIndices, dtype="int")]
       candidates = numpy.array(inactiveSynapseIndices)[
           perms.argsort()[0:numToFree]]
       candidates = list(candidates)
@@ -2389,9 +2624,9 @@ class Segment(object):
 
     # Do we need more? if so, remove the lowest perm active synapses too
     if len(candidates) < numToFree:
-      activeSynIndices = [i for i in xrange(len(self.syns))
+      activeSynIndices = [i for i in xrange(len(allPerms))
                           if i not in inactiveSynapseIndices]
-      perms = numpy.array([self.syns[i][2] for i in activeSynIndices])
+      perms = allPerms[numpy.asarray(activeSynIndices, dtype="int")]
       moreToFree = numToFree - len(candidates)
       moreCandidates = numpy.array(activeSynIndices)[
           perms.argsort()[0:moreToFree]]
@@ -2404,9 +2639,7 @@ class Segment(object):
       self.printSegment()
 
     # Free up all the candidates now
-    synsToDelete = [self.syns[i] for i in candidates]
-    for syn in synsToDelete:
-      self.syns.remove(syn)
+    self._removeSynapses(candidates)
 
     if verbosity >= 4:
       print "AFTER:",
@@ -2420,7 +2653,9 @@ class Segment(object):
     @param srcCellIdx source cell index within the column
     @param perm       initial permanence
     """
-    self.syns.append([int(srcCellCol), int(srcCellIdx), numpy.float32(perm)])
+    self._storage.appendSynapse(
+      self._slot, int(srcCellCol) * self.tp.cellsPerColumn + int(srcCellIdx),
+      numpy.float32(perm))
 
 
   def updateSynapses(self, synapses, delta):
@@ -2433,22 +2668,22 @@ class Segment(object):
     @returns   True if synapse reached 0
     """
     reached0 = False
+    synapses = numpy.fromiter(synapses, dtype="int")
+    if len(synapses) == 0:
+      return reached0
 
-    if delta > 0:
-      for synapse in synapses:
-        self.syns[synapse][2] = newValue = self.syns[synapse][2] + delta
+    perms = self._getPermanences()
+    newValues = perms[synapses] + delta
 
-        # Cap synapse permanence at permanenceMax
-        if newValue > self.tp.permanenceMax:
-          self.syns[synapse][2] = self.tp.permanenceMax
+    if delta > 0:
+      # Cap synapse permanence at permanenceMax
+      newValues[newValues > self.tp.permanenceMax] = self.tp.permanenceMax
 
     else:
-      for synapse in synapses:
-        self.syns[synapse][2] = newValue = self.syns[synapse][2] + delta
-
-        # Cap min synapse permanence to 0 in case there is no global decay
-        if newValue <= 0:
-          self.syns[synapse][2] = 0
-          reached0 = True
+      # Cap min synapse permanence to 0 in case there is no global decay
+      reachedZero = newValues <= 0
+      newValues[reachedZero] = 0
+      reached0 = bool(reachedZero.any())
 
+    perms[synapses] = newValues
     return reached0
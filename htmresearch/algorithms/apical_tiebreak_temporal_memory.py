@@ -24,6 +24,8 @@
 import numpy as np
 
 from htmresearch.support import numpy_helpers as np2
+from htmresearch.support.connections_pickling import (
+  getConnectionsState, createConnectionsFromState)
 from nupic.bindings.math import Random, SparseMatrixConnections
 
 
@@ -158,6 +160,21 @@ class ApicalTiebreakTemporalMemory(object):
     self.useApicalModulationBasalThreshold=True
 
 
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state["basalConnections"] = getConnectionsState(self.basalConnections)
+    state["apicalConnections"] = getConnectionsState(self.apicalConnections)
+    return state
+
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self.basalConnections = createConnectionsFromState(
+      state["basalConnections"])
+    self.apicalConnections = createConnectionsFromState(
+      state["apicalConnections"])
+
+
   def reset(self):
     """
     Clear all cell and segment activity.
@@ -498,12 +515,15 @@ class ApicalTiebreakTemporalMemory(object):
       Includes counts for active, matching, and nonmatching segments.
     """
 
+    (candidateSegments,
+     candidateOverlaps,
+     potentialOverlaps) = ApicalTiebreakTemporalMemory._computeOverlaps(
+       connections, activeInput, connectedPermanence, activationThreshold)
+
     # Active
-    overlaps = connections.computeActivity(activeInput, connectedPermanence)
-    activeSegments = np.flatnonzero(overlaps >= activationThreshold)
+    activeSegments = candidateSegments[candidateOverlaps >= activationThreshold]
 
     # Matching
-    potentialOverlaps = connections.computeActivity(activeInput)
     matchingSegments = np.flatnonzero(potentialOverlaps >= minThreshold)
 
     return (activeSegments,
@@ -539,12 +559,23 @@ class ApicalTiebreakTemporalMemory(object):
       The number of active potential synapses for each segment.
       Includes counts for active, matching, and nonmatching segments.
     """
+    useReducedThreshold = (reducedBasalThreshold != activationThreshold and
+                           len(reducedBasalThresholdCells) > 0)
+    if useReducedThreshold:
+      candidateThreshold = min(activationThreshold, reducedBasalThreshold)
+    else:
+      candidateThreshold = activationThreshold
+
+    (candidateSegments,
+     overlaps,
+     potentialOverlaps) = ApicalTiebreakTemporalMemory._computeOverlaps(
+       connections, activeInput, connectedPermanence, candidateThreshold)
+
     # Active apical segments lower the activation threshold for basal (lateral) segments
-    overlaps = connections.computeActivity(activeInput, connectedPermanence)
-    outrightActiveSegments = np.flatnonzero(overlaps >= activationThreshold)
-    if reducedBasalThreshold != activationThreshold and len(reducedBasalThresholdCells) > 0:
-        potentiallyActiveSegments = np.flatnonzero((overlaps < activationThreshold)
-                                        & (overlaps >= reducedBasalThreshold))
+    outrightActiveSegments = candidateSegments[overlaps >= activationThreshold]
+    if useReducedThreshold:
+        potentiallyActiveSegments = candidateSegments[
+          (overlaps < activationThreshold) & (overlaps >= reducedBasalThreshold)]
         cellsOfCASegments = connections.mapSegmentsToCells(potentiallyActiveSegments)
         # apically active segments are condit. active segments from apically active cells
         conditionallyActiveSegments = potentiallyActiveSegments[np.in1d(cellsOfCASegments,
@@ -553,10 +584,7 @@ class ApicalTiebreakTemporalMemory(object):
     else:
         activeSegments = outrightActiveSegments
 
-
-
     # Matching
-    potentialOverlaps = connections.computeActivity(activeInput)
     matchingSegments = np.flatnonzero(potentialOverlaps >= minThreshold)
 
     return (activeSegments,
@@ -564,6 +592,60 @@ class ApicalTiebreakTemporalMemory(object):
             potentialOverlaps)
 
 
+  @staticmethod
+  def _computeOverlaps(connections, activeInput, connectedPermanence,
+                       candidateThreshold):
+    """
+    Calculate the potential overlaps of every segment and the connected
+    overlaps of the segments that might be active, walking the full synapse
+    matrix only once.
+
+    A segment's connected overlap can never exceed its potential overlap, so
+    only segments with at least 'candidateThreshold' active potential synapses
+    can reach that many active connected synapses. Their connected overlaps are
+    counted on the submatrix of their rows and the active input columns. When
+    that submatrix isn't much smaller than the full matrix, the connected
+    overlaps are computed with a second full pass instead.
+
+    @param connections (SparseMatrixConnections)
+    @param activeInput (numpy array)
+    @param connectedPermanence (float)
+    @param candidateThreshold (int)
+
+    @return (tuple)
+    - candidateSegments (numpy array)
+      Segments with at least 'candidateThreshold' active potential synapses
+
+    - candidateOverlaps (numpy array)
+      The number of active connected synapses for each candidate segment.
+
+    - potentialOverlaps (numpy array)
+      The number of active potential synapses for each segment.
+      Includes counts for active, matching, and nonmatching segments.
+    """
+    activeInput = np.asarray(activeInput, dtype="uint32")
+
+    potentialOverlaps = connections.computeActivity(activeInput)
+    candidateSegments = np.flatnonzero(
+      potentialOverlaps >= candidateThreshold).astype("uint32")
+
+    if len(candidateSegments) == 0:
+      candidateOverlaps = np.empty(0, dtype="int32")
+    elif (len(candidateSegments) * len(activeInput) * 8 <
+          connections.matrix.nNonZeros()):
+      candidatePermanences = connections.matrix.getOuter(candidateSegments,
+                                                         activeInput)
+      candidateOverlaps = candidatePermanences.rightVecSumAtNZGteThreshold(
+        np.ones(len(activeInput), dtype="float32"), connectedPermanence)
+    else:
+      candidateOverlaps = connections.computeActivity(
+        activeInput, connectedPermanence)[candidateSegments]
+
+    return (candidateSegments,
+            candidateOverlaps,
+            potentialOverlaps)
+
+
   def _calculatePredictedCells(self, activeBasalSegments, activeApicalSegments):
     """
     Calculate the predicted cells, given the set of active segments.
@@ -20,6 +20,8 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
+import multiprocessing
+
 import matplotlib.pyplot as plt
 import numpy
 import scipy.cluster.hierarchy
@@ -63,14 +65,18 @@ class HierarchicalClustering(object):
   """
 
 
-  def __init__(self, knn):
+  def __init__(self, knn, numWorkers=1):
     """
     Initialization for HierarchicalClustering object.
     
     @param knn (nupic.algorithms.KNNClassifier) Populated instance of KNN
         classifer from which to draw training vectors.
+
+    @param numWorkers (int) Number of processes used to compute the pairwise
+        overlaps. Optional, defaults to 1.
     """
     self._knn = knn
+    self._numWorkers = numWorkers
     self._overlaps = None
     self._linkage = None
 
@@ -257,34 +263,44 @@ class HierarchicalClustering(object):
 
   def _populateOverlaps(self):
     sparseDataMatrix = HierarchicalClustering._extractVectorsFromKNN(self._knn)
-    self._overlaps = HierarchicalClustering._computeOverlaps(sparseDataMatrix)
+    self._overlaps = HierarchicalClustering._computeOverlaps(
+      sparseDataMatrix, numWorkers=self._numWorkers)
 
 
   @staticmethod
   def _extractVectorsFromKNN(knn):
     dim = len(knn.getPattern(0, sparseBinaryForm=False))
-    sparseRowList = []
-
-    for i in xrange(knn._numPatterns):
-      nzIndices = knn.getPattern(i, sparseBinaryForm=True)
-      sparseRow = scipy.sparse.csr_matrix(
-        (numpy.ones(len(nzIndices), dtype=bool),
-        (numpy.zeros(len(nzIndices)), nzIndices)),
-        shape=(1,dim))
-      sparseRowList.append(sparseRow)
-    
-    sparseDataMatrix = scipy.sparse.vstack(sparseRowList)
+    patterns = [numpy.asarray(knn.getPattern(i, sparseBinaryForm=True),
+                              dtype=int)
+                for i in xrange(knn._numPatterns)]
+
+    indptr = numpy.zeros(len(patterns) + 1, dtype=int)
+    numpy.cumsum([len(nzIndices) for nzIndices in patterns], out=indptr[1:])
+    indices = (numpy.concatenate(patterns) if patterns
+               else numpy.empty(0, dtype=int))
+
+    sparseDataMatrix = scipy.sparse.csr_matrix(
+      (numpy.ones(len(indices), dtype=bool), indices, indptr),
+      shape=(len(patterns), dim))
+    sparseDataMatrix.sum_duplicates()
 
     return sparseDataMatrix
 
 
   @staticmethod
-  def _computeOverlaps(data, selfOverlaps=False, dtype="int16"):
+  def _computeOverlaps(data, selfOverlaps=False, dtype="int16",
+                       maxBlockSize=2**24, numWorkers=1):
     """
     Calculates all pairwise overlaps between the rows of the input. Returns an
     array of all n(n-1)/2 values in the upper triangular portion of the
     pairwise overlap matrix. Values are returned in row-major order.
 
+    The overlaps are computed for blocks of consecutive rows with one sparse
+    matrix product per block. The upper triangular portion of a block of rows
+    is a contiguous range of the returned array, so each block is written
+    directly into it, row by row. With several workers, the blocks computed
+    by the workers are copied into it.
+
     @param data (scipy.sparse.csr_matrix) A CSR sparse matrix with one vector
         per row. Any non-zero value is considered an active bit.
 
@@ -294,23 +310,114 @@ class HierarchicalClustering(object):
     
     @param dtype (string) Data type of returned array in numpy dtype format.
         Optional, defaults to 'int16'.
+
+    @param maxBlockSize (int) Maximum number of overlaps computed in a block,
+        which bounds the temporary memory. Optional, defaults to 2**24.
+
+    @param numWorkers (int) Number of processes computing blocks in parallel.
+        Optional, defaults to 1.
     
     @returns (numpy.ndarray) A vector of pairwise overlaps as described above.
     """
+    data = scipy.sparse.csr_matrix(data, dtype=bool).astype("int32")
     nVectors = data.shape[0]
-    nDims = data.shape[1]
     nPairs = (nVectors+1)*nVectors/2 if selfOverlaps else (
       nVectors*(nVectors-1)/2)
     overlaps = numpy.ndarray(nPairs, dtype=dtype)
-    pos = 0
-
-    for i in xrange(nVectors):
-      start = i if selfOverlaps else i+1
-      a = data[i]
-      b = data[start:]
-      newOverlaps = a.multiply(b).getnnz(1)
-      run = newOverlaps.shape[0]
-      overlaps[pos:pos+run] = newOverlaps
-      pos += run
+
+    rowsPerBlock = max(1, maxBlockSize / max(nVectors, 1))
+    blocks = [(start, min(start + rowsPerBlock, nVectors))
+              for start in xrange(0, nVectors, rowsPerBlock)]
+
+    if numWorkers > 1 and len(blocks) > 1:
+      pool = multiprocessing.Pool(numWorkers, _initOverlapWorker,
+                                  (data, selfOverlaps))
+      try:
+        blockOverlaps = pool.imap(_computeBlockOverlapsInWorker, blocks)
+        pos = 0
+        for newOverlaps in blockOverlaps:
+          overlaps[pos:pos+len(newOverlaps)] = newOverlaps
+          pos += len(newOverlaps)
+      finally:
+        pool.terminate()
+    else:
+      dataT = data.T.tocsc()
+      buf = numpy.empty(min(rowsPerBlock, nVectors) * nVectors, dtype="int32")
+      pos = 0
+      for start, end in blocks:
+        numValues = _numBlockOverlaps(nVectors, start, end, selfOverlaps)
+        _computeBlockOverlaps(data, dataT, start, end, selfOverlaps, buf,
+                              out=overlaps[pos:pos+numValues])
+        pos += numValues
+
     return overlaps
 
+
+
+def _numBlockOverlaps(nVectors, start, end, selfOverlaps):
+  """
+  Number of condensed overlaps of rows start to end - 1.
+  """
+  numRows = end - start
+  numValues = numRows * (nVectors - start) - numRows * (numRows - 1) / 2
+  if not selfOverlaps:
+    numValues -= numRows
+  return numValues
+
+
+
+def _computeBlockOverlaps(data, dataT, start, end, selfOverlaps, buf=None,
+                          out=None):
+  """
+  Compute the overlaps of rows start to end - 1 with the rows after them (and
+  with themselves if selfOverlaps is True), in condensed row-major order.
+
+  @param data (scipy.sparse.csr_matrix) Binary int32 data matrix
+
+  @param dataT (scipy.sparse.csc_matrix) Transpose of data
+
+  @param buf (numpy.ndarray) Optional int32 buffer reused between blocks for
+      the dense block of overlaps
+
+  @param out (numpy.ndarray) Optional slice of the condensed overlap vector
+      the overlaps are written to. A new array is returned otherwise.
+  """
+  nVectors = data.shape[0]
+  nCols = nVectors - start
+  product = data[start:end].dot(dataT[:, start:])
+
+  if buf is None:
+    dense = product.toarray()
+  else:
+    dense = buf[:(end - start) * nCols].reshape(end - start, nCols)
+    dense.fill(0)
+    product.toarray(out=dense)
+
+  if out is None:
+    out = numpy.empty(_numBlockOverlaps(nVectors, start, end, selfOverlaps),
+                      dtype=dense.dtype)
+
+  # Row i of the block keeps the columns j > i, or j >= i with self overlaps.
+  firstColumn = 0 if selfOverlaps else 1
+  pos = 0
+  for i in xrange(end - start):
+    rowOverlaps = dense[i, i + firstColumn:]
+    out[pos:pos+len(rowOverlaps)] = rowOverlaps
+    pos += len(rowOverlaps)
+
+  return out
+
+
+
+_workerData = None
+
+
+def _initOverlapWorker(data, selfOverlaps):
+  global _workerData
+  _workerData = (data, data.T.tocsc(), selfOverlaps)
+
+
+def _computeBlockOverlapsInWorker(block):
+  data, dataT, selfOverlaps = _workerData
+  start, end = block
+  return _computeBlockOverlaps(data, dataT, start, end, selfOverlaps)
@@ -28,10 +28,22 @@ import copy
 import numpy as np
 
 from htmresearch.support import numpy_helpers as np2
+from htmresearch.support.connections_pickling import (
+  getConnectionsState, createConnectionsFromState)
 from htmresearch.algorithms.multiconnections import Multiconnections
 from nupic.bindings.math import SparseMatrixConnections, Random
 
 
+# A bump only excites the cells where its excitation is at least this value.
+# The skipped excitations are accounted for when thresholding, so this only
+# affects performance.
+BUMP_EXCITATION_EPSILON = 1e-12
+
+# Tolerance for floating point differences between excitations computed by
+# getCellExcitations and by getCellExcitationsNearBumps.
+EXCITATION_TOLERANCE = 1e-9
+
+
 class ThresholdedGaussian2DLocationModule(object):
   """
   A model of a grid cell module. The module has one or more Gaussian activity
@@ -155,8 +167,22 @@ class ThresholdedGaussian2DLocationModule(object):
     # meaningful impact, but it makes visualizations easier to understand.
     self.cellPhases += [[0.5/self.cellsPerAxis], [0.5/self.cellsPerAxis]]
 
+    self.maxBumpDistance = bumpSigma * math.sqrt(
+      -2. * math.log(BUMP_EXCITATION_EPSILON))
+    self.cellExcitations = np.empty(self.cellsPerAxis * self.cellsPerAxis,
+                                    dtype="float")
+
     self.rng = Random(seed)
 
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state["connections"] = getConnectionsState(self.connections)
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self.connections = createConnectionsFromState(state["connections"])
+
   def reset(self):
     """
     Clear the active cells.
@@ -170,13 +196,53 @@ class ThresholdedGaussian2DLocationModule(object):
 
 
   def _computeActiveCells(self):
-    cellExcitations = ThresholdedGaussian2DLocationModule.getCellExcitations(
-      self.cellPhases, self.bumpPhases, self.bumpSigma, self.bumpOverlapMethod)
+    cellExcitations = self._computeCellExcitations()
 
     self.activeCells = np.where(cellExcitations >= self.activeFiringRate)[0]
     self.learningCells = np.where(cellExcitations == cellExcitations.max())[0]
 
 
+  def _computeCellExcitations(self, maxPairs=2**16):
+    """
+    Compute the excitation of each cell, only evaluating the cells near each
+    bump. Skipping the other cells makes the excitations slightly too small, by
+    at most BUMP_EXCITATION_EPSILON per bump, so the cells that are close
+    enough to the activation threshold or to the maximum excitation for this
+    to matter are recomputed with getCellExcitations. The active cells and the
+    learning cells are identical to those computed from getCellExcitations.
+
+    @param maxPairs (int)
+    The number of cell/bump pairs that are evaluated at once
+
+    @return (numpy array)
+    The excitation of each cell, in a buffer that is reused on every call
+    """
+    cellExcitations = (
+      ThresholdedGaussian2DLocationModule.getCellExcitationsNearBumps(
+        self.cellPhases, self.cellsPerAxis, self.bumpPhases, self.bumpSigma,
+        self.bumpOverlapMethod, self.maxBumpDistance,
+        out=self.cellExcitations, maxPairs=maxPairs))
+
+    numBumps = self.bumpPhases.shape[1]
+    maxError = numBumps * BUMP_EXCITATION_EPSILON + EXCITATION_TOLERANCE
+    nearThreshold = ((cellExcitations >= self.activeFiringRate - maxError) &
+                     (cellExcitations <= self.activeFiringRate +
+                      EXCITATION_TOLERANCE))
+    nearMax = (cellExcitations >= cellExcitations.max() - maxError -
+               EXCITATION_TOLERANCE)
+    uncertainCells = np.flatnonzero(nearThreshold | nearMax)
+
+    cellsPerChunk = max(1, maxPairs // max(1, 4 * numBumps))
+    for i in xrange(0, len(uncertainCells), cellsPerChunk):
+      cells = uncertainCells[i:i + cellsPerChunk]
+      cellExcitations[cells] = (
+        ThresholdedGaussian2DLocationModule.getCellExcitations(
+          self.cellPhases[:, cells], self.bumpPhases, self.bumpSigma,
+          self.bumpOverlapMethod))
+
+    return cellExcitations
+
+
   def activateRandomLocation(self):
     """
     Set the location to a random point.
@@ -480,6 +546,111 @@ class ThresholdedGaussian2DLocationModule(object):
     return cellExcitations
 
 
+  @staticmethod
+  def getCellExcitationsNearBumps(cellPhases, cellsPerAxis, bumpPhases,
+                                  bumpSigma, bumpOverlapMethod, maxDistance,
+                                  out=None, maxPairs=2**16):
+    """
+    Like getCellExcitations, but each bump only excites the cells within
+    maxDistance of it. The cells are on a cellsPerAxis x cellsPerAxis lattice
+    in phase space, so the candidate cells of a bump are a fixed window of
+    lattice offsets around it, wrapping around the rhombus.
+
+    @param cellPhases (numpy array)
+    The phases of the cells, ordered row by row on the lattice
+
+    @param maxDistance (float)
+    In units of rhombus edges, like bumpSigma
+
+    @param out (numpy array or None)
+    A buffer for the excitations
+
+    @param maxPairs (int)
+    The number of cell/bump pairs that are evaluated at once. This bounds the
+    memory used by this method.
+
+    @return (numpy array)
+    The excitation of each cell
+    """
+    if bumpOverlapMethod not in ("probabilistic", "sum"):
+      raise ValueError("Unrecognized bump overlap strategy", bumpOverlapMethod)
+
+    numCells = cellsPerAxis * cellsPerAxis
+    if out is None:
+      out = np.empty(numCells, dtype="float")
+
+    # See getCellExcitations.
+    B = np.array([[np.cos(np.radians(0.)), np.cos(np.radians(60.))],
+                  [np.sin(np.radians(0.)), np.sin(np.radians(60.))]])
+
+    # A world displacement of length maxDistance can't move further than this
+    # along each phase axis.
+    phaseRadius = maxDistance * np.linalg.norm(np.linalg.inv(B), axis=1)
+
+    # For each axis, the lattice offsets of the candidate cells, relative to
+    # the cell below the bump. If the window covers the whole axis, use every
+    # cell instead so that no cell is visited twice.
+    offsetsByAxis = []
+    for axis in xrange(2):
+      radius = int(math.ceil(phaseRadius[axis] * cellsPerAxis)) + 1
+      if 2 * radius + 1 >= cellsPerAxis:
+        offsetsByAxis.append(None)
+      else:
+        offsetsByAxis.append(np.arange(-radius, radius + 1))
+
+    numCandidates = np.prod([cellsPerAxis if offsets is None else len(offsets)
+                             for offsets in offsetsByAxis])
+    bumpsPerChunk = max(1, maxPairs // numCandidates)
+
+    # For "probabilistic", accumulate log(1 - excitation) and convert it at the
+    # end. For "sum", accumulate the excitations.
+    out.fill(0.)
+    for i in xrange(0, bumpPhases.shape[1], bumpsPerChunk):
+      bumps = bumpPhases[:, i:i + bumpsPerChunk]
+
+      axisCells = []
+      for axis, offsets in enumerate(offsetsByAxis):
+        if offsets is None:
+          axisCells.append(np.tile(np.arange(cellsPerAxis), (bumps.shape[1], 1)))
+        else:
+          base = np.floor(bumps[axis] * cellsPerAxis).astype("int")
+          axisCells.append(np.mod(base[:, np.newaxis] + offsets, cellsPerAxis))
+      bump_cell = (axisCells[0][:, :, np.newaxis] * cellsPerAxis +
+                   axisCells[1][:, np.newaxis, :]).reshape(bumps.shape[1], -1)
+
+      bump_cell_positivePhaseDisplacement = np.mod(
+        cellPhases[:, bump_cell] - bumps[:, :, np.newaxis], 1.0)
+
+      # Choose the shortest of the 4 displacements, as in getCellExcitations.
+      bump_cell_squaredDistance = None
+      for offset in ([0, 0], [0, 1], [1, 0], [1, 1]):
+        worldDisplacement = np.tensordot(
+          B, bump_cell_positivePhaseDisplacement - np.array(offset)[:, np.newaxis,
+                                                                    np.newaxis],
+          axes=1)
+        squaredDistance = np.sum(worldDisplacement**2, axis=0)
+        if bump_cell_squaredDistance is None:
+          bump_cell_squaredDistance = squaredDistance
+        else:
+          np.minimum(bump_cell_squaredDistance, squaredDistance,
+                     out=bump_cell_squaredDistance)
+
+      excitations = np.exp(-bump_cell_squaredDistance /
+                           (2 * np.power(bumpSigma, 2.)))
+
+      if bumpOverlapMethod == "probabilistic":
+        with np.errstate(divide="ignore"):
+          excitations = np.log1p(-excitations)
+      out += np.bincount(bump_cell.ravel(), weights=excitations.ravel(),
+                         minlength=numCells)
+
+    if bumpOverlapMethod == "probabilistic":
+      np.expm1(out, out=out)
+      np.negative(out, out=out)
+
+    return out
+
+
 
 class Superficial2DLocationModule(object):
   """
@@ -628,6 +799,17 @@ class Superficial2DLocationModule(object):
     self.rng = Random(seed)
 
 
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state["connections"] = getConnectionsState(self.connections)
+    return state
+
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self.connections = createConnectionsFromState(state["connections"])
+
+
   def reset(self):
     """
     Clear the active cells.
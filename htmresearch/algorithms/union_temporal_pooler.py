@@ -20,7 +20,6 @@
 # ----------------------------------------------------------------------
 
 import random
-import copy
 import numpy
 from nupic.bindings.algorithms import SpatialPooler
 # Uncomment below line to use python SP
@@ -146,15 +145,24 @@ class UnionTemporalPooler(SpatialPooler):
     # Current union SDR; the output of the union pooler algorithm
     self._unionSDR = numpy.array([], dtype=UINT_DTYPE)
 
+    # Most active cells found by the last _getMostActiveCells call, even when
+    # the union SDR is empty because of minHistory, and the pooling
+    # activation array and union size they were selected with
+    self._mostActiveCells = None
+    self._mostActiveCellsSource = None
+
     # Indices of active cells from spatial pooler
     self._activeCells = numpy.array([], dtype=UINT_DTYPE)
 
     # lowest possible pooling activation level
     self._poolingActivationlowerBound = 0.1
 
-    self._preActiveInput = numpy.zeros(self.getNumInputs(), dtype=REAL_DTYPE)
-    # predicted inputs from the last n steps
-    self._prePredictedActiveInput = numpy.zeros((self.getNumInputs(), self._historyLength), dtype=REAL_DTYPE)
+    # indices of the active inputs at the previous time step
+    self._preActiveInput = numpy.array([], dtype=UINT_DTYPE)
+    # indices of the predicted inputs from the last n steps, in a circular
+    # buffer where the most recent input is at _historyHead
+    self._prePredictedActiveInput = [numpy.array([], dtype=UINT_DTYPE)] * self._historyLength
+    self._historyHead = 0
 
 
   def reset(self):
@@ -165,10 +173,13 @@ class UnionTemporalPooler(SpatialPooler):
     # Reset Union Temporal Pooler fields
     self._poolingActivation = numpy.zeros(self.getNumColumns(), dtype=REAL_DTYPE)
     self._unionSDR = numpy.array([], dtype=UINT_DTYPE)
+    self._mostActiveCells = None
+    self._mostActiveCellsSource = None
     self._poolingTimer = numpy.ones(self.getNumColumns(), dtype=REAL_DTYPE) * 1000
     self._poolingActivationInitLevel = numpy.zeros(self.getNumColumns(), dtype=REAL_DTYPE)
-    self._preActiveInput = numpy.zeros(self.getNumInputs(), dtype=REAL_DTYPE)
-    self._prePredictedActiveInput = numpy.zeros((self.getNumInputs(), self._historyLength), dtype=REAL_DTYPE)
+    self._preActiveInput = numpy.array([], dtype=UINT_DTYPE)
+    self._prePredictedActiveInput = [numpy.array([], dtype=UINT_DTYPE)] * self._historyLength
+    self._historyHead = 0
 
     # Reset Spatial Pooler fields
     self.setOverlapDutyCycles(numpy.zeros(self.getNumColumns(), dtype=REAL_DTYPE))
@@ -212,22 +223,31 @@ class UnionTemporalPooler(SpatialPooler):
     self._addToPoolingActivation(activeCells, overlapsPredictedActive)
 
     # update union SDR
-    self._getMostActiveCells()
-
-    if learn:
-      # adapt permanence of connections from predicted active inputs to newly active cell
-      # This step is the spatial pooler learning rule, applied only to the predictedActiveInput
-      # Todo: should we also include unpredicted active input in this step?
-      self._adaptSynapses(predictedActiveInput, activeCells, self.getSynPermActiveInc(), self.getSynPermInactiveDec())
+    if (self._decayFunctionType == 'NoDecay' and
+        self._exciteNeverLowersActivation()):
+      # Only the activation of the active cells changed, and it didn't decrease
+      self._getMostActiveCells(activeCells)
+    else:
+      self._getMostActiveCells()
 
-      # Increase permanence of connections from predicted active inputs to cells in the union SDR
-      # This is Hebbian learning applied to the current time step
-      self._adaptSynapses(predictedActiveInput, self._unionSDR, self._synPermPredActiveInc, 0.0)
+    predictedActiveIndices = numpy.where(predictedActiveInput > 0)[0].astype(UINT_DTYPE)
 
-      # adapt permenence of connections from previously predicted inputs to newly active cells
-      # This is a reinforcement learning rule that considers previous input to the current cell
-      for i in xrange(self._historyLength):
-        self._adaptSynapses(self._prePredictedActiveInput[:,i], activeCells, self._synPermPreviousPredActiveInc, 0.0)
+    if learn:
+      # The learning rules are applied in one pass, in this order
+      self._adaptSynapsesBatch(
+        # adapt permanence of connections from predicted active inputs to newly active cell
+        # This step is the spatial pooler learning rule, applied only to the predictedActiveInput
+        # Todo: should we also include unpredicted active input in this step?
+        [(predictedActiveIndices, activeCells, self.getSynPermActiveInc(), self.getSynPermInactiveDec()),
+
+         # Increase permanence of connections from predicted active inputs to cells in the union SDR
+         # This is Hebbian learning applied to the current time step
+         (predictedActiveIndices, self._unionSDR, self._synPermPredActiveInc, 0.0)] +
+
+        # adapt permenence of connections from previously predicted inputs to newly active cells
+        # This is a reinforcement learning rule that considers previous input to the current cell
+        [(previousPredictedActiveIndices, activeCells, self._synPermPreviousPredActiveInc, 0.0)
+         for previousPredictedActiveIndices in self._getPredictedActiveInputHistory()])
 
       # Homeostasis learning inherited from the spatial pooler
       self._updateDutyCycles(totalOverlap.astype(UINT_DTYPE), activeCells)
@@ -238,14 +258,24 @@ class UnionTemporalPooler(SpatialPooler):
         self._updateMinDutyCycles()
 
     # save inputs from the previous time step
-    self._preActiveInput = copy.copy(activeInput)
-    self._prePredictedActiveInput = numpy.roll(self._prePredictedActiveInput,1,1)
+    self._preActiveInput = numpy.where(activeInput > 0)[0].astype(UINT_DTYPE)
     if self._historyLength > 0:
-      self._prePredictedActiveInput[:, 0] = predictedActiveInput
+      # overwrite the oldest input
+      self._historyHead = (self._historyHead - 1) % self._historyLength
+      self._prePredictedActiveInput[self._historyHead] = predictedActiveIndices
 
     return self._unionSDR
 
 
+  def _getPredictedActiveInputHistory(self):
+    """
+    Gets the indices of the predicted active inputs of the previous time steps.
+    @return: a list of historyLength index arrays, most recent first
+    """
+    return [self._prePredictedActiveInput[(self._historyHead + i) % self._historyLength]
+            for i in xrange(self._historyLength)]
+
+
   def _decayPoolingActivation(self):
     """
     Decrements pooling activation of all cells
@@ -280,24 +310,60 @@ class UnionTemporalPooler(SpatialPooler):
     return self._poolingActivation
 
 
-  def _getMostActiveCells(self):
+  def _exciteNeverLowersActivation(self):
+    """
+    Whether the excite function only ever adds a non-negative amount to the
+    activation, as _getMostActiveCells requires of changed cells.
+    """
+    exciteFunction = self._exciteFunction
+    if isinstance(exciteFunction, FixedExciteFunction):
+      return exciteFunction._targetExcLevel >= 0
+    if isinstance(exciteFunction, LogisticExciteFunction):
+      # The added amount is between minValue and maxValue
+      return min(exciteFunction._minValue, exciteFunction._maxValue) >= 0
+    return False
+
+
+  def _getMostActiveCells(self, changedCells=None):
     """
     Gets the most active cells in the Union SDR having at least non-zero
     activation in sorted order.
+
+    If only a few cells changed since the last call, and their activation
+    didn't decrease, the previous most active cells can only be displaced by
+    the changed cells, so only those are compared.
+
+    @param changedCells: Indices of the cells whose activation changed since
+        the last call, or None to select among all cells
     @return: a list of cell indices
     """
     poolingActivation = self._poolingActivation
-    nonZeroCells = numpy.argwhere(poolingActivation > 0)[:,0]
 
-    # include a tie-breaker before sorting
-    poolingActivationSubset = poolingActivation[nonZeroCells] + \
-                              self._poolingActivation_tieBreaker[nonZeroCells]
-    potentialUnionSDR = nonZeroCells[numpy.argsort(poolingActivationSubset)[::-1]]
+    if (changedCells is not None and self._mostActiveCellsSource is not None and
+        self._mostActiveCellsSource[0] is poolingActivation and
+        self._mostActiveCellsSource[1] == self._maxUnionCells):
+      candidates = numpy.union1d(self._mostActiveCells, changedCells)
+    else:
+      candidates = numpy.arange(len(poolingActivation))
+    nonZeroCells = candidates[poolingActivation[candidates] > 0]
+
+    if len(nonZeroCells) > self._maxUnionCells:
+      # include a tie-breaker before selecting
+      poolingActivationSubset = poolingActivation[nonZeroCells] + \
+                                self._poolingActivation_tieBreaker[nonZeroCells]
+      if self._maxUnionCells > 0:
+        topCells = nonZeroCells[numpy.argpartition(
+          -poolingActivationSubset, self._maxUnionCells - 1)[:self._maxUnionCells]]
+      else:
+        topCells = nonZeroCells[:0]
+    else:
+      topCells = nonZeroCells
 
-    topCells = potentialUnionSDR[0: self._maxUnionCells]
+    self._mostActiveCells = numpy.sort(topCells).astype(UINT_DTYPE)
+    self._mostActiveCellsSource = (poolingActivation, self._maxUnionCells)
 
-    if max(self._poolingTimer) > self._minHistory:
-      self._unionSDR = numpy.sort(topCells).astype(UINT_DTYPE)
+    if self._poolingTimer.max() > self._minHistory:
+      self._unionSDR = self._mostActiveCells
     else:
       self._unionSDR = []
 
@@ -328,20 +394,83 @@ class UnionTemporalPooler(SpatialPooler):
     @param synPermInactiveDec:
                     Permanence decrement for inactive inputs
     """
-    inputIndices = numpy.where(inputVector > 0)[0]
-    permChanges = numpy.zeros(self.getNumInputs(), dtype=REAL_DTYPE)
-    permChanges.fill(-1 * synPermInactiveDec)
-    permChanges[inputIndices] = synPermActiveInc
-    perm = numpy.zeros(self.getNumInputs(), dtype=REAL_DTYPE)
-    potential = numpy.zeros(self.getNumInputs(), dtype=REAL_DTYPE)
-    for i in activeColumns:
-      self.getPermanence(i, perm)
-      self.getPotential(i, potential)
-      maskPotential = numpy.where(potential > 0)[0]
-      perm[maskPotential] += permChanges[maskPotential]
-      self._updatePermanencesForColumn(perm, i, raisePerm=False)
+    self._adaptSynapsesBatch([(numpy.where(inputVector > 0)[0], activeColumns,
+                               synPermActiveInc, synPermInactiveDec)])
+
+
+  def _adaptSynapsesBatch(self, updates):
+    """
+    Applies several _adaptSynapses updates in order, reading and writing the
+    permanences of each touched column only once.
+
+    Each update changes the permanences of the potential synapses of its
+    columns, then trims and clips them like _updatePermanencesForColumn, so
+    the result is the same as calling _adaptSynapses for each update. Updates
+    without a decrement only touch the synapses of active input bits, and
+    updates without any increment or decrement are skipped.
+
+    Parameters:
+    ----------------------------
+    @param updates:
+                    A list of (inputIndices, activeColumns, synPermActiveInc,
+                    synPermInactiveDec) tuples, where inputIndices are the
+                    indices of the active input bits. See _adaptSynapses.
+    """
+    updates = [(numpy.asarray(inputIndices, dtype="int64"),
+                numpy.asarray(activeColumns, dtype="int64"),
+                synPermActiveInc, synPermInactiveDec)
+               for inputIndices, activeColumns, synPermActiveInc, synPermInactiveDec
+               in updates
+               if len(activeColumns) > 0 and
+               (synPermActiveInc != 0 or synPermInactiveDec != 0)]
+    if len(updates) == 0:
+      return
+
+    touchedColumns = numpy.unique(numpy.concatenate(
+      [activeColumns for _, activeColumns, _, _ in updates]))
+    numInputs = self.getNumInputs()
+    perms = numpy.zeros((len(touchedColumns), numInputs), dtype=REAL_DTYPE)
+    potentials = numpy.zeros((len(touchedColumns), numInputs), dtype=REAL_DTYPE)
+    for row, column in enumerate(touchedColumns):
+      self.getPermanence(column, perms[row])
+      self.getPotential(column, potentials[row])
+    potentials = potentials > 0
+
+    synPermTrimThreshold = self.getSynPermTrimThreshold()
+    synPermMax = self.getSynPermMax()
+
+    for inputIndices, activeColumns, synPermActiveInc, synPermInactiveDec in updates:
+      rows = numpy.searchsorted(touchedColumns, activeColumns)
+
+      if synPermInactiveDec != 0:
+        permChanges = numpy.empty(numInputs, dtype=REAL_DTYPE)
+        permChanges.fill(-1 * synPermInactiveDec)
+        permChanges[inputIndices] = synPermActiveInc
+        columnPerms = perms[rows]
+        columnPerms += potentials[rows] * permChanges
+        _trimAndClip(columnPerms, synPermTrimThreshold, synPermMax)
+        perms[rows] = columnPerms
+      elif len(inputIndices) > 0:
+        # Only the synapses of active input bits change
+        block = numpy.ix_(rows, inputIndices)
+        columnPerms = perms[block]
+        columnPerms += potentials[block] * REAL_DTYPE(synPermActiveInc)
+        _trimAndClip(columnPerms, synPermTrimThreshold, synPermMax)
+        perms[block] = columnPerms
+
+    for row, column in enumerate(touchedColumns):
+      self._updatePermanencesForColumn(perms[row], column, raisePerm=False)
 
 
   def getUnionSDR(self):
     return self._unionSDR
 
+
+
+def _trimAndClip(perms, synPermTrimThreshold, synPermMax):
+  """
+  Sets permanences below the trim threshold to zero and caps them at
+  synPermMax, like the spatial pooler does when it stores them.
+  """
+  perms[perms < synPermTrimThreshold] = 0
+  numpy.minimum(perms, synPermMax, out=perms)
@@ -20,10 +20,10 @@
 # ----------------------------------------------------------------------
 
 import numpy as np
-from collections import deque
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import copy
+import hashlib
 import os
 from compute_hardwired_weights import compute_hardwired_weights
 
@@ -99,6 +99,93 @@ def placeSTDPKernel(placeActivation, otherActivation, dt):
 
 
 
+def stdpTimeFactors(kernel, dts, *kernelArgs):
+  """
+  Evaluates the time dependence of an STDP kernel.  Kernels scale the outer
+  product of the pre- and post-synaptic activations by a factor that only
+  depends on dt, so that factor is the update for a single pair of cells with
+  unit activations.
+  :param kernel: The STDP kernel, e.g. defaultSTDPKernel.
+  :param dts: Array of time differences (in seconds).
+  :param kernelArgs: Extra arguments for the kernel.
+  :return: An array of factors with the same shape as dts.
+  """
+  unit = np.ones(1)
+  factors = [kernel(unit, unit, dt, *kernelArgs)[0, 0] for dt in np.ravel(dts)]
+  return np.reshape(factors, np.shape(dts))
+
+
+
+class ActivationBuffer(object):
+  """
+  Fixed-size history of the activations of several populations, used for
+  STDP.  The last 'size' time steps are kept in preallocated arrays, and the
+  oldest time step is overwritten when the buffer is full.
+  """
+
+  def __init__(self, size, populationSizes):
+    """
+    :param size: Number of time steps to keep.
+    :param populationSizes: Dict mapping each population name to its number of
+            cells.
+    """
+    self.size = int(size)
+    self.activations = dict((name, np.zeros((self.size, numCells)))
+                            for name, numCells in populationSizes.iteritems())
+    self.times = np.zeros((self.size,))
+    self.numSteps = 0
+    self.nextIndex = 0
+
+
+  def __len__(self):
+    return self.numSteps
+
+
+  def append(self, time, activations):
+    """
+    Stores the activations of one time step.
+    :param time: The time of this step.
+    :param activations: Dict mapping each population name to its activations.
+    """
+    if self.size == 0:
+      return
+
+    for name, activation in activations.iteritems():
+      self.activations[name][self.nextIndex] = activation
+    self.times[self.nextIndex] = time
+
+    self.nextIndex = (self.nextIndex + 1) % self.size
+    self.numSteps = min(self.numSteps + 1, self.size)
+
+
+  def clear(self, keepLast=False):
+    """
+    Removes the stored time steps.
+    :param keepLast: Set as True to keep the most recent time step.
+    """
+    self.numSteps = min(self.numSteps, 1) if keepLast else 0
+
+
+  def getTimes(self):
+    """
+    :return: The times of the stored steps, oldest first.
+    """
+    return self.times[self._getOrder()]
+
+
+  def getActivations(self, name):
+    """
+    :return: A (steps x cells) array of a population's activations, oldest
+            first.
+    """
+    return self.activations[name][self._getOrder()]
+
+
+  def _getOrder(self):
+    return (self.nextIndex - self.numSteps + np.arange(self.numSteps)) % self.size
+
+
+
 class Dynamic1DCAN(object):
   """
   This class provides a framework for learning a continuous attractor model of
@@ -166,7 +253,9 @@ class Dynamic1DCAN(object):
     :param placeGainI: Multiplier scaling impact of place code on I cells.
     :param sigmaLoc: Multiplier scaling width of place code bump.
     :param stdpKernel: The STDP kernel to be used.  See the function
-            defaultSTDPKernel for an example.
+            defaultSTDPKernel for an example.  Updates must be the outer
+            product of the pre-synaptic activations, scaled by a function of
+            dt, with the post-synaptic activations.
     :param tonicMagnitude: The magnitude of the global tonic input
             during training.
     :param learnFactorII: Extra learning rate for II connections.
@@ -245,7 +334,11 @@ class Dynamic1DCAN(object):
     self.stdpWindow = stdpWindow
     self.stdpKernel = stdpKernel
 
-    self.activationBuffer = deque(maxlen=int(self.stdpWindow))
+    self.activationBuffer = ActivationBuffer(self.stdpWindow,
+                                             {"I": numInhibitory,
+                                              "EL": numExcitatory,
+                                              "ER": numExcitatory,
+                                              "P": numPlaces})
 
     self.tonicMagnitude = tonicMagnitude
 
@@ -905,114 +998,87 @@ class Dynamic1DCAN(object):
             This should be done at the end of training.
     :param onlyPlace: Only learn place connections.
     """
+    connections = self.getSTDPConnections(onlyPlace)
+    activations = self.getSTDPActivations()
+    buffered = dict((name, self.activationBuffer.getActivations(name))
+                    for name in activations)
+
     if clearBuffer:
-      while len(self.activationBuffer) > 1:
-        baseI, baseEL, baseER, baseP, t = self.activationBuffer.popleft()
-        for (I, EL, ER, P, i) in self.activationBuffer:
-          t = (i - t) * self.dt
-          self.weightsPI += placeSTDPKernel(self.learningRate *\
-                                            self.learnFactorP *\
-                                            self.dt *\
-                                            baseP, I, t,
-                                            )
-
-          self.weightsPEL += placeSTDPKernel(self.learningRate *\
-                                             self.learnFactorP *\
-                                             self.dt *\
-                                             baseP, EL, t,
-                                             )
-
-          self.weightsPER += placeSTDPKernel(self.learningRate *\
-                                             self.learnFactorP *\
-                                             self.dt *\
-                                             baseP, ER, t,
-                                             )
-
-          if not onlyPlace:
-            self.weightsELI += self.stdpKernel(self.learningRate *\
-                                               self.learnFactorEI *\
-                                               self.dt *\
-                                               baseEL, I, t,
-                                               False, True)
-
-            self.weightsERI += self.stdpKernel(self.learningRate *\
-                                               self.learnFactorEI *\
-                                               self.dt *\
-                                               baseER, I, t,
-                                               False, True)
+      # Learn from every pair of buffered steps.  dts[j, i] is the time from
+      # step j to step i, and only the pairs with j before i are used.
+      if len(self.activationBuffer) > 1:
+        times = self.activationBuffer.getTimes()
+        dts = (times[np.newaxis, :] - times[:, np.newaxis]) * self.dt
+        pairs = np.triu(np.ones(dts.shape), 1)
+
+        factors = {}
+        for weights, pre, post, rate, kernel, kernelArgs in connections:
+          key = (kernel,) + kernelArgs
+          if key not in factors:
+            factors[key] = pairs * stdpTimeFactors(kernel, dts, *kernelArgs)
+          weights += np.dot(rate * np.dot(buffered[pre].T, factors[key]),
+                            buffered[post])
+
+        self.activationBuffer.clear(keepLast=True)
 
     else:
-      for I, EL, ER, P, i in reversed(self.activationBuffer):
-        t = (i - time) * self.dt
-        self.weightsPI +=  placeSTDPKernel(self.learningRate *\
-                                           self.learnFactorP *\
-                                           self.dt *\
-                                           self.activationsP, I, t,
-                                           )
-
-        self.weightsPEL += placeSTDPKernel(self.learningRate *\
-                                           self.learnFactorP *\
-                                           self.dt *\
-                                           self.activationsP, EL, t,
-                                           )
-
-        self.weightsPER += placeSTDPKernel(self.learningRate *\
-                                           self.learnFactorP *\
-                                           self.dt *\
-                                           self.activationsP, ER, t,
-                                           )
-
-        if not onlyPlace:
-          self.weightsELI += self.stdpKernel(self.learningRate *\
-                                             self.learnFactorEI *\
-                                             self.dt *\
-                                             self.instantaneousEL, I, t,
-                                             False, True)
-
-          self.weightsERI += self.stdpKernel(self.learningRate *\
-                                             self.learnFactorEI *\
-                                             self.dt *\
-                                             self.instantaneousER, I, t,
-                                             False, True)
-
-      for I, EL, ER, P, i in self.activationBuffer:
-        t = (time - i) * self.dt
-        self.weightsPI +=  placeSTDPKernel(self.learningRate *\
-                                           self.learnFactorP *\
-                                           self.dt *\
-                                           P, self.instantaneousI, t,
-                                           )
-
-        self.weightsPEL += placeSTDPKernel(self.learningRate *\
-                                           self.learnFactorP *\
-                                           self.dt *\
-                                           P, self.instantaneousEL, t,
-                                           )
-
-        self.weightsPER += placeSTDPKernel(self.learningRate *\
-                                           self.learnFactorP *\
-                                           self.dt *\
-                                           P, self.instantaneousER, t,
-                                           )
-
-        if not onlyPlace:
-          self.weightsELI += self.stdpKernel(self.learningRate *\
-                                             self.learnFactorEI *\
-                                             self.dt *\
-                                             EL, self.instantaneousI, t,
-                                             False, True)
-
-          self.weightsERI += self.stdpKernel(self.learningRate *\
-                                             self.learnFactorEI *\
-                                             self.dt *\
-                                             ER, self.instantaneousI, t,
-                                             False, True)
-
-      self.activationBuffer.append((np.copy(self.instantaneousI),
-                                    np.copy(self.instantaneousEL),
-                                    np.copy(self.instantaneousER),
-                                    np.copy(self.activationsP),
-                                    time))
+      # Learn from the pairs of the current step with each buffered step, in
+      # both directions.  Summing the buffered activations weighted by the
+      # kernel's time factors gives the whole window in one product.
+      if len(self.activationBuffer) > 0:
+        dts = (self.activationBuffer.getTimes() - time) * self.dt
+
+        factors = {}
+        for weights, pre, post, rate, kernel, kernelArgs in connections:
+          key = (kernel,) + kernelArgs
+          if key not in factors:
+            factors[key] = (stdpTimeFactors(kernel, dts, *kernelArgs),
+                            stdpTimeFactors(kernel, -dts, *kernelArgs))
+          postFactors, preFactors = factors[key]
+          weights += np.outer(rate * activations[pre],
+                              np.dot(postFactors, buffered[post]))
+          weights += np.outer(rate * np.dot(preFactors, buffered[pre]),
+                              activations[post])
+
+      self.activationBuffer.append(time, activations)
+
+
+  def getSTDPConnections(self, onlyPlace=False):
+    """
+    Lists the connections learned by stdpUpdate.
+    :param onlyPlace: Only include place connections.
+    :return: A list of tuples (weights, pre, post, rate, kernel, kernelArgs)
+            where weights is a (pre-synaptic x post-synaptic) array that is
+            updated in place, pre and post are population names from
+            getSTDPActivations, and kernel is called as
+            kernel(pre, post, dt, *kernelArgs).
+    """
+    placeRate = self.learningRate * self.learnFactorP * self.dt
+    connections = [
+      (self.weightsPI, "P", "I", placeRate, placeSTDPKernel, ()),
+      (self.weightsPEL, "P", "EL", placeRate, placeSTDPKernel, ()),
+      (self.weightsPER, "P", "ER", placeRate, placeSTDPKernel, ()),
+    ]
+
+    if not onlyPlace:
+      rate = self.learningRate * self.learnFactorEI * self.dt
+      connections += [
+        (self.weightsELI, "EL", "I", rate, self.stdpKernel, (False, True)),
+        (self.weightsERI, "ER", "I", rate, self.stdpKernel, (False, True)),
+      ]
+
+    return connections
+
+
+  def getSTDPActivations(self):
+    """
+    :return: A dict mapping each population name to its current activations,
+            as used for STDP.
+    """
+    return {"I": self.instantaneousI,
+            "EL": self.instantaneousEL,
+            "ER": self.instantaneousER,
+            "P": self.activationsP}
 
 
 
@@ -1031,6 +1097,75 @@ def w_0(x):
 
 
 
+# Version of the hardwired 2D weights, part of their cache key.  Increment it
+# when computeHardwiredWeights2D changes.
+HARDWIRED_WEIGHTS_VERSION = 1
+
+# Cells further apart than this (in Manhattan distance) aren't connected on a
+# non-periodic sheet.
+HARDWIRED_WEIGHTS_CUTOFF = 20
+
+
+
+def computeHardwiredWeights2D(dimensions, periodic):
+  """
+  Computes the hardwired inhibitory weights of a 2D sheet of cells, a
+  difference of Gaussians of the distance between each pair of cells.
+  :param dimensions: The number of cells in each direction on the sheet.
+  :param periodic: Whether or not distances wrap around the edges of the
+          sheet.  If not, cells further apart than HARDWIRED_WEIGHTS_CUTOFF
+          aren't connected.
+  :return: A (cells x cells) array, with cells in np.unravel_index order.
+  """
+  coords = np.indices(dimensions).reshape((2, -1))
+  distanceComponents = []
+  for axis in xrange(2):
+    distance = np.abs(coords[axis][:, np.newaxis] - coords[axis][np.newaxis, :])
+    if periodic:
+      # The two points might be closer by wrapping around the edge.
+      distance = np.minimum(distance, dimensions[axis] - distance)
+    distanceComponents.append(distance)
+
+  weights = 1000*w_0([2*distanceComponents[0], 2*distanceComponents[1]])
+  if not periodic:
+    weights[distanceComponents[0] + distanceComponents[1] >
+            HARDWIRED_WEIGHTS_CUTOFF] = 0
+
+  return weights
+
+
+
+def getHardwiredWeights2D(dimensions, periodic, cacheDir=None):
+  """
+  Returns the weights of computeHardwiredWeights2D, cached on disk.  Cache
+  files are named after a hash of every parameter of the weights, and they
+  are memory-mapped when read.
+  :param cacheDir: The cache directory, or None to always compute the weights.
+  :return: A read-only (cells x cells) array.
+  """
+  if cacheDir is None:
+    return computeHardwiredWeights2D(dimensions, periodic)
+
+  key = repr((HARDWIRED_WEIGHTS_VERSION, tuple(int(d) for d in dimensions),
+              bool(periodic), HARDWIRED_WEIGHTS_CUTOFF))
+  filename = os.path.join(
+    cacheDir,
+    "hardwiredWeights2D-{}.npy".format(hashlib.sha1(key).hexdigest()))
+
+  if not os.path.isfile(filename):
+    weights = computeHardwiredWeights2D(dimensions, periodic)
+
+    # Write to a temporary file first so that concurrent runs never read a
+    # partially written cache.
+    tmpFilename = "{}.{}.tmp".format(filename, os.getpid())
+    with open(tmpFilename, "wb") as f:
+      np.save(f, weights)
+    os.rename(tmpFilename, filename)
+
+  return np.load(filename, mmap_mode="r")
+
+
+
 class Dynamic2DCAN(Dynamic1DCAN):
 
 
@@ -1061,7 +1196,8 @@ class Dynamic2DCAN(Dynamic1DCAN):
                boostEffect=10,
                boostTarget=0.1,
                periodic=True,
-               hardwireEnvelope=False,):
+               hardwireEnvelope=False,
+               weightCacheDir=".",):
     """
     :param dimensions: The number of neuron groups in each direction
             on the sheet.  2-tuple.  Will have the product as number of groups.
@@ -1077,7 +1213,9 @@ class Dynamic2DCAN(Dynamic1DCAN):
     :param placeGainI: Multiplier scaling impact of place code on I cells.
     :param sigmaLoc: Multiplier scaling width of place code bump.
     :param stdpKernel: The STDP kernel to be used.  See the function
-            defaultSTDPKernel for an example.
+            defaultSTDPKernel for an example.  Updates must be the outer
+            product of the pre-synaptic activations, scaled by a function of
+            dt, with the post-synaptic activations.
     :param tonicMagnitude: The magnitude of the global tonic input
             during training.
     :param learnFactorII: Extra learning rate for II connections.
@@ -1098,6 +1236,8 @@ class Dynamic2DCAN(Dynamic1DCAN):
     :param periodic: Whether or not to use toroidal weight structures.
     :param hardwireEnvelope: Whether or not to weaken connections to enveloped
             cells instead of suppressing them.
+    :param weightCacheDir: Directory where hardwired inhibitory weights are
+            cached, or None to disable the cache.
 
     """
 
@@ -1156,7 +1296,11 @@ class Dynamic2DCAN(Dynamic1DCAN):
     self.stdpWindow = stdpWindow
     self.stdpKernel = stdpKernel
 
-    self.activationBuffer = deque(maxlen=int(self.stdpWindow))
+    populationSizes = dict((k, self.numExcitatory)
+                           for k in self.directions.iterkeys())
+    populationSizes["I"] = self.numInhibitory
+    populationSizes["P"] = self.numPlaces
+    self.activationBuffer = ActivationBuffer(self.stdpWindow, populationSizes)
 
     self.tonicMagnitude = tonicMagnitude
 
@@ -1174,63 +1318,10 @@ class Dynamic2DCAN(Dynamic1DCAN):
     self.envelope = self.computeEnvelope()
 
     if hardwireI:
-      # Calculate it once
-      if periodic:
-        jCoord0 = np.unravel_index(0, self.dimensions)
-
-        jTargetCoord = np.mod(jCoord0, self.dimensions[0])
-
-        weights = np.zeros(self.dimensions, dtype="float")
-
-        for i in xrange(self.numInhibitory):
-          iCoord = np.unravel_index(i, self.dimensions)
-
-
-          distanceComponents1 = np.abs(iCoord - jTargetCoord)
-
-          # The two points might actually be closer by wrapping around one/two of the edges.
-          # For each dimension, consider what the alternate distance would have been,
-          # and choose the lowest.
-          distanceComponents2 = float(self.dimensions[0]) - distanceComponents1
-          distanceComponents = np.where(distanceComponents1 < distanceComponents2,
-                                        distanceComponents1, distanceComponents2)
-
-        weights[iCoord, jCoord0] = 1000*w_0(distanceComponents*2)
-
-        for j in xrange(self.numInhibitory):
-          jCoord = np.unravel_index(j, self.dimensions)
-
-          for k, preferredDirection in self.directions.iteritems():
-            self.weightsIE[k][:, j] = np.roll(np.roll(weights, jCoord[0], axis=0),
-                                              jCoord[1], axis=1).flatten()
-
-          self.weightsII[:, j] = np.roll(np.roll(weights, jCoord[0], axis=0),
-                                         jCoord[1], axis=1).flatten()
-
-      else:
-        if os.path.isfile(str(self.dimensions)+"weightCache.npz"):
-          weights = np.load(str(self.dimensions)+"weightCache.npz")
-          self.weightsII = np.copy(weights)
-          for k, w in self.weightsIE.items():
-            w = np.copy(weights)
-        else:
-          for j in range(self.numInhibitory):
-            jCoord = np.unravel_index(j, self.dimensions)
-
-            for i in xrange(self.numInhibitory):
-              iCoord = np.unravel_index(i, self.dimensions)
-              distanceComponents = np.abs(np.asarray(iCoord) - np.asarray(jCoord))
-              if distanceComponents[0] + distanceComponents[1] > 20:
-                continue
-
-              weights = 1000*w_0(distanceComponents*2)
-
-              for k, preferredDirection in self.directions.iteritems():
-                self.weightsIE[k][i, j] = weights
-
-              self.weightsII[i, j] = weights
-
-        np.save(str(self.dimensions)+"weightCache.npz", self.weightsII)
+      weights = getHardwiredWeights2D(self.dimensions, periodic, weightCacheDir)
+      self.weightsII = np.array(weights)
+      for k in self.directions.iterkeys():
+        self.weightsIE[k] = np.array(weights)
 
     if hardwireEnvelope:
       self.weightsII *= self.envelope
@@ -1604,30 +1695,32 @@ class Dynamic2DCAN(Dynamic1DCAN):
     self.fig.canvas.draw()
 
 
-  def stdpKernels(self, t, I, E, baseI, baseE, baseP, onlyPlace=False):
-    self.weightsPI += placeSTDPKernel(self.learningRate * \
-                                      self.learnFactorP * \
-                                      self.dt * \
-                                      baseP, I, t,
-                                      )
-    for k, a in E.items():
-      self.weightsPE[k] += placeSTDPKernel(self.learningRate * \
-                                           self.learnFactorP * \
-                                           self.dt * \
-                                           baseP, E[k], t,
-                                           )
+  def getSTDPConnections(self, onlyPlace=False):
+    """
+    Lists the connections learned by stdpUpdate, see Dynamic1DCAN.  The 2D
+    weights are stored as (post-synaptic x pre-synaptic), so they are updated
+    through their transposes.
+    """
+    rate = self.learningRate * self.learnFactorP * self.dt
+    connections = [(self.weightsPI.T, "P", "I", rate, placeSTDPKernel, ())]
+    for k in self.directions.iterkeys():
+      connections.append(
+        (self.weightsPE[k].T, "P", k, rate, placeSTDPKernel, ()))
 
       if not onlyPlace:
-        self.weightsEI[k] += self.stdpKernel(self.learningRate * \
-                                             self.learnFactorP * \
-                                             self.dt * \
-                                             baseE[k], I, t,
-                                             )
-        self.weightsIE[k] += self.stdpKernel(self.learningRate * \
-                                             self.learnFactorP * \
-                                             self.dt * \
-                                             baseI, E[k], t,
-                                             )
+        connections += [
+          (self.weightsEI[k].T, k, "I", rate, self.stdpKernel, ()),
+          (self.weightsIE[k].T, "I", k, rate, self.stdpKernel, ()),
+        ]
+
+    return connections
+
+
+  def getSTDPActivations(self):
+    activations = dict(self.instantaneous)
+    activations["I"] = self.instantaneousI
+    activations["P"] = self.activationsP
+    return activations
 
 
   def createMovie(self, data, name, nx, ny):
@@ -1642,47 +1735,3 @@ class Dynamic2DCAN(Dynamic1DCAN):
                                   interval=10, blit=True)
 
     ani.save('name.mp4')
-
-
-  def stdpUpdate(self, time, clearBuffer=False, onlyPlace=False):
-    """
-    Adds the current activations to the tracking queue, and then performs an
-    STDP update if possible.
-    :param time: The current time.  Must be provided.
-    :param clearBuffer: Set as True to clear the activation buffer.
-            This should be done at the end of training.
-    :param onlyPlace: Only learn place connections.
-    """
-    if clearBuffer:
-      while len(self.activationBuffer) > 1:
-        baseI, baseE, baseP, t = self.activationBuffer.popleft()
-        for (I, E, P, i) in self.activationBuffer:
-          t = (i - t) * self.dt
-          self.sdtpKernels(t, I, E, baseI, baseE, baseP, onlyPlace=onlyPlace)
-
-    else:
-      for I, E, P, i in reversed(self.activationBuffer):
-        t = (i - time) * self.dt
-        self.sdtpKernels(t,
-                         I,
-                         E,
-                         self.instantaneousI,
-                         self.instantaneous,
-                         self.activationsP,
-                         onlyPlace=onlyPlace)
-
-      for I, E, P, i in self.activationBuffer:
-        t = (time - i) * self.dt
-        self.sdtpKernels(t,
-                         self.instantaneousI,
-                         self.instantaneous,
-                         I,
-                         E,
-                         P,
-                         onlyPlace=onlyPlace)
-
-      self.activationBuffer.append((np.copy(self.instantaneousI),
-                                    {k: np.copy(self.instantaneous[k])
-                                    for k in self.instantaneous},
-                                    np.copy(self.activationsP),
-                                    time))
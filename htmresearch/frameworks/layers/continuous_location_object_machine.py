@@ -21,6 +21,7 @@
 
 import math
 import random
+from collections import OrderedDict
 
 import numpy as np
 import matplotlib.pyplot as plt
@@ -46,7 +47,8 @@ class ContinuousLocationObjectMachine(ObjectMachineBase):
                numCorticalColumns=1,
                numFeatures=400,
                dimension=3,
-               seed=42):
+               seed=42,
+               locationCacheSize=65536):
     """
     At creation, the SimpleObjectMachine creates a pool of locations and
     features SDR's.
@@ -77,6 +79,10 @@ class ContinuousLocationObjectMachine(ObjectMachineBase):
     @param   seed (int)
              Seed to be used in the machine
 
+    @param   locationCacheSize (int)
+             Maximum number of location encodings to keep, reusing the least
+             recently used ones' slots. Set to 0 to always encode.
+
     """
     super(ContinuousLocationObjectMachine, self).__init__(numInputBits,
                                                           sensorInputSize,
@@ -95,6 +101,13 @@ class ContinuousLocationObjectMachine(ObjectMachineBase):
       name="locationEncoder"
     )
 
+    # Encodings are a pure function of (location, radius), so the active bits
+    # of recently encoded locations are kept, least recently used first.
+    self.locationCacheSize = locationCacheSize
+    self.locationCache = OrderedDict()
+    self.locationCacheHits = 0
+    self.locationCacheMisses = 0
+
 
   def provideObjectsToLearn(self, learningConfig, plot=False):
     """
@@ -300,11 +313,7 @@ class ContinuousLocationObjectMachine(ObjectMachineBase):
     for col in xrange(self.numColumns):
       location, featureID = pairs[col]
       location = [int(coord) for coord in location]
-
-      location = self.locationEncoder.encode(
-        (np.array(location, dtype="int32"), self._getRadius(location))
-      )
-      location = set(location.nonzero()[0])
+      location = set(self._encodeLocation(location, self._getRadius(location)))
 
       # generate empty feature if requested
       if featureID == -1:
@@ -326,6 +335,54 @@ class ContinuousLocationObjectMachine(ObjectMachineBase):
     return sensations
 
 
+  def _encodeLocation(self, location, radius):
+    """
+    Returns the active bits of the encoding of an integer location, as a
+    frozenset, using the location cache.
+    """
+    key = (tuple(location), radius)
+    bits = self.locationCache.pop(key, None)
+    if bits is None:
+      self.locationCacheMisses += 1
+      bits = frozenset(self.locationEncoder.encode(
+        (np.array(location, dtype="int32"), radius)
+      ).nonzero()[0])
+      if self.locationCacheSize > 0:
+        while len(self.locationCache) >= self.locationCacheSize:
+          self.locationCache.popitem(last=False)
+    else:
+      self.locationCacheHits += 1
+
+    if self.locationCacheSize > 0:
+      self.locationCache[key] = bits
+    return bits
+
+
+  def getLocationCacheStatistics(self):
+    """
+    Returns the number of location encodings that were found in the cache
+    ("hits") and that had to be computed ("misses"), the hit rate and the
+    number of cached encodings.
+    """
+    lookups = self.locationCacheHits + self.locationCacheMisses
+    return {
+      "hits": self.locationCacheHits,
+      "misses": self.locationCacheMisses,
+      "hitRate": (float(self.locationCacheHits) / lookups
+                  if lookups > 0 else 0.0),
+      "size": len(self.locationCache),
+    }
+
+
+  def clearLocationCache(self):
+    """
+    Forgets the cached location encodings and resets the statistics.
+    """
+    self.locationCache.clear()
+    self.locationCacheHits = 0
+    self.locationCacheMisses = 0
+
+
   def _getRadius(self, location):
     """
     Returns the radius associated with the given location.
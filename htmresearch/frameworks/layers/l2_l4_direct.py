@@ -0,0 +1,194 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Runs the L4 and L2 layers of an L4-L2 network by calling the algorithms
+directly, without the Network API.
+
+The network created by createMultipleL4L2Columns spends much of each timestep
+on plumbing: sensations are converted to lists and queued in RawSensors, every
+link converts between dense arrays and index lists and every region is
+dispatched by the network engine. DirectL4L2Columns keeps the L4 and L2
+algorithm instances of every column and passes index arrays between them,
+reproducing the network's links:
+
+  - sensor input -> L4 active columns
+  - external input -> L4 basal input and basal growth candidates
+  - L4 active cells -> L2 feedforward input
+  - L4 predicted active cells -> L2 feedforward growth candidates
+  - L2 active cells -> L4 apical input (previous timestep)
+  - L2 active cells -> lateral input of every other L2 (previous timestep)
+
+The algorithms are created by the L4 and L2 region classes, so they are
+constructed with exactly the same parameters and seeds as in the network.
+"""
+
+import copy
+
+import numpy as np
+
+from htmresearch.regions.ApicalTMPairRegion import ApicalTMPairRegion
+from htmresearch.regions.ColumnPoolerRegion import ColumnPoolerRegion
+
+
+
+class DirectL4L2Columns(object):
+  """
+  Multiple L4-L2 columns, stepped together without the Network API.
+  """
+
+  def __init__(self, networkConfig):
+    """
+    @param networkConfig (dict)
+    A network configuration for createL4L2Column or createMultipleL4L2Columns.
+    Only the L4 and L2 layers are simulated, so configurations with spatial
+    poolers, topology or another L4 region type are rejected.
+    """
+    networkType = networkConfig["networkType"]
+    if networkType == "L4L2Column":
+      self.numColumns = 1
+    elif networkType == "MultipleL4L2Columns":
+      self.numColumns = networkConfig["numCorticalColumns"]
+    else:
+      raise ValueError("Unsupported network type: " + networkType)
+
+    if networkConfig.get("L4RegionType",
+                         "py.ApicalTMPairRegion") != "py.ApicalTMPairRegion":
+      raise ValueError("Unsupported L4 region type: " +
+                       networkConfig["L4RegionType"])
+
+    if (networkConfig.get("lateralSPParams") or
+        networkConfig.get("feedForwardSPParams")):
+      raise ValueError("Spatial poolers are only supported by the Network API")
+
+    self.enableFeedback = networkConfig.get("enableFeedback", True)
+
+    # Create the regions only to reuse their parameter handling.
+    self.L4Columns = []
+    self.L2Columns = []
+    for i in xrange(self.numColumns):
+      L4Params = copy.deepcopy(networkConfig["L4Params"])
+      L4Params["basalInputWidth"] = networkConfig["externalInputSize"]
+      L4Params["apicalInputWidth"] = networkConfig["L2Params"]["cellCount"]
+      L4Params.pop("sparseLinks", None)
+
+      L2Params = copy.deepcopy(networkConfig["L2Params"])
+      L2Params.pop("sparseLinks", None)
+      if networkType == "MultipleL4L2Columns":
+        L2Params["seed"] = L2Params.get("seed", 42) + i
+        L2Params["numOtherCorticalColumns"] = self.numColumns - 1
+
+      L4Column = ApicalTMPairRegion(**L4Params)
+      L4Column.initialize()
+      self.L4Columns.append(L4Column)
+
+      L2Column = ColumnPoolerRegion(**L2Params)
+      L2Column.initialize()
+      self.L2Columns.append(L2Column)
+
+    self.L4 = [column.getAlgorithmInstance() for column in self.L4Columns]
+    self.L2 = [column.getAlgorithmInstance() for column in self.L2Columns]
+
+    self.learn = True
+    self.reset()
+
+
+  def reset(self):
+    """
+    Reset every layer, like a reset signal sent through the sensors.
+    """
+    for tm in self.L4:
+      tm.reset()
+    for pooler in self.L2:
+      pooler.reset()
+
+    empty = np.empty(0, dtype="uint32")
+    self.L4ActiveCells = [empty] * self.numColumns
+    self.L4PredictedCells = [empty] * self.numColumns
+    self.L4PredictedActiveCells = [empty] * self.numColumns
+    self.L2ActiveCells = [empty] * self.numColumns
+
+
+  def setLearning(self, learn):
+    """
+    Enable or disable learning in every L4 and L2.
+    """
+    self.learn = learn
+    for column in self.L4Columns:
+      column.learn = learn
+    for column in self.L2Columns:
+      column.learningMode = learn
+
+
+  def compute(self, sensations):
+    """
+    Run one timestep in every column.
+
+    @param sensations (dict or list)
+    For each column, a tuple (location, feature) of active bits, in the format
+    used by L4L2Experiment.learnObjects and infer
+    """
+    previousL2ActiveCells = self.L2ActiveCells
+
+    for col in xrange(self.numColumns):
+      location, feature = sensations[col]
+      activeColumns = _toIndices(feature)
+      basalInput = _toIndices(location)
+      if self.enableFeedback:
+        apicalInput = previousL2ActiveCells[col]
+      else:
+        apicalInput = np.empty(0, dtype="uint32")
+
+      tm = self.L4[col]
+      tm.compute(activeColumns, basalInput, apicalInput, basalInput,
+                 apicalInput, self.learn)
+
+      activeCells = np.sort(tm.getActiveCells())
+      predictedCells = np.sort(tm.getPredictedCells())
+      self.L4ActiveCells[col] = activeCells
+      self.L4PredictedCells[col] = predictedCells
+      self.L4PredictedActiveCells[col] = np.intersect1d(activeCells,
+                                                        predictedCells)
+
+    L2ActiveCells = []
+    for col in xrange(self.numColumns):
+      lateralInputs = tuple(previousL2ActiveCells[i]
+                            for i in xrange(self.numColumns)
+                            if i != col)
+      self.L2[col].compute(
+        np.asarray(self.L4ActiveCells[col], dtype="uint32"), lateralInputs,
+        np.asarray(self.L4PredictedActiveCells[col], dtype="uint32"),
+        learn=self.learn)
+      L2ActiveCells.append(
+        np.sort(self.L2[col].getActiveCells()).astype("uint32"))
+
+    self.L2ActiveCells = L2ActiveCells
+
+
+
+def _toIndices(bits):
+  """
+  Convert a set or list of active bits into a sorted array of unique indices,
+  as a RawSensor and a dense link would.
+  """
+  if isinstance(bits, (set, frozenset)):
+    bits = list(bits)
+  return np.unique(np.asarray(bits, dtype="uint32"))
@@ -93,7 +93,9 @@ from nupic.bindings.math import SparseMatrix
 
 from htmresearch.support.logging_decorator import LoggingDecorator
 from htmresearch.support.register_regions import registerAllResearchRegions
+from htmresearch.support.sparse_links import getSparseInput
 from htmresearch.frameworks.layers.laminar_network import createNetwork
+from htmresearch.frameworks.layers.l2_l4_direct import DirectL4L2Columns
 
 
 
@@ -151,7 +153,9 @@ class L4L2Experiment(object):
                enableFeedForwardSP=False,
                feedForwardSPOverrides=None,
                objectNamesAreIndices=False,
-               enableFeedback=True
+               enableFeedback=True,
+               sparseLinks=False,
+               useNetworkAPI=True
                ):
     """
     Creates the network.
@@ -228,6 +232,16 @@ class L4L2Experiment(object):
     @param   enableFeedback (bool)
              If True, enable feedback between L2 and L4
 
+    @param   sparseLinks (bool)
+             If True, regions exchange sorted lists of active cells instead
+             of dense 0/1 arrays. Can't be combined with the SP options.
+
+    @param   useNetworkAPI (bool)
+             If False, the L4 and L2 algorithms are stepped directly instead of
+             through the Network API, with identical results. Only supported
+             for networks without SPs or topology. The sensor regions and
+             network profiling are unavailable in this mode.
+
     """
     # Handle logging - this has to be done first
     self.logCalls = logCalls
@@ -251,6 +265,7 @@ class L4L2Experiment(object):
       "networkType": networkType,
       "longDistanceConnections": longDistanceConnections,
       "enableFeedback": enableFeedback,
+      "sparseLinks": sparseLinks,
       "numCorticalColumns": numCorticalColumns,
       "externalInputSize": externalInputSize,
       "sensorInputSize": inputSize,
@@ -290,13 +305,35 @@ class L4L2Experiment(object):
     if L4Overrides is not None:
       self.config["L4Params"].update(L4Overrides)
 
-    # create network
-    self.network = createNetwork(self.config)
+    self.useNetworkAPI = useNetworkAPI
     self.sensorInputs = []
     self.externalInputs = []
     self.L4Regions = []
     self.L2Regions = []
 
+    if useNetworkAPI:
+      self._createNetwork()
+    else:
+      self.network = None
+      self.directColumns = DirectL4L2Columns(self.config)
+      self.L4Columns = self.directColumns.L4Columns
+      self.L2Columns = self.directColumns.L2Columns
+
+    # will be populated during training
+    self.objectL2Representations = {}
+    self.objectL2RepresentationsMatrices = [
+      SparseMatrix(0, self.config["L2Params"]["cellCount"])
+      for _ in xrange(self.numColumns)]
+    self.objectNameToIndex = {}
+    self.resetStatistics()
+
+
+  def _createNetwork(self):
+    """
+    Create the network and keep references to its regions.
+    """
+    self.network = createNetwork(self.config)
+
     for i in xrange(self.numColumns):
       self.sensorInputs.append(
         self.network.regions["sensorInput_" + str(i)].getSelf()
@@ -314,13 +351,54 @@ class L4L2Experiment(object):
     self.L4Columns = [region.getSelf() for region in self.L4Regions]
     self.L2Columns = [region.getSelf() for region in self.L2Regions]
 
-    # will be populated during training
-    self.objectL2Representations = {}
-    self.objectL2RepresentationsMatrices = [
-      SparseMatrix(0, self.config["L2Params"]["cellCount"])
-      for _ in xrange(self.numColumns)]
-    self.objectNameToIndex = {}
-    self.resetStatistics()
+
+  def __getstate__(self):
+    """
+    Pickle the experiment with its trained L4 and L2 algorithms, so that a
+    network can be trained once and then loaded by several inference processes.
+    The Network API network can't be pickled, so only the algorithm instances
+    are kept and the network is recreated when unpickling.
+    """
+    if (self.config.get("lateralSPParams") or
+        self.config.get("feedForwardSPParams")):
+      raise NotImplementedError(
+        "Experiments with spatial poolers can't be pickled")
+
+    state = self.__dict__.copy()
+    for name in ("network", "sensorInputs", "externalInputs", "L4Regions",
+                 "L2Regions", "L4Columns", "L2Columns"):
+      del state[name]
+
+    if self.useNetworkAPI:
+      state["L4Algorithms"] = [column._tm for column in self.L4Columns]
+      state["L2Algorithms"] = [column._pooler for column in self.L2Columns]
+
+    return state
+
+
+  def __setstate__(self, state):
+    L4Algorithms = state.pop("L4Algorithms", None)
+    L2Algorithms = state.pop("L2Algorithms", None)
+    self.__dict__.update(state)
+
+    self.sensorInputs = []
+    self.externalInputs = []
+    self.L4Regions = []
+    self.L2Regions = []
+
+    if self.useNetworkAPI:
+      self._createNetwork()
+
+      # The regions haven't been initialized yet, so they'll use these
+      # algorithms instead of creating new ones.
+      for column, tm in zip(self.L4Columns, L4Algorithms):
+        column._tm = tm
+      for column, pooler in zip(self.L2Columns, L2Algorithms):
+        column._pooler = pooler
+    else:
+      self.network = None
+      self.L4Columns = self.directColumns.L4Columns
+      self.L2Columns = self.directColumns.L2Columns
 
 
   @LoggingDecorator()
@@ -353,7 +431,8 @@ class L4L2Experiment(object):
 
     In many uses cases, this object can be created by implementations of
     ObjectMachines (cf htm.research.object_machine_factory), through their
-    method providedObjectsToLearn.
+    method providedObjectsToLearn. An ObjectBatch, as returned by
+    provideObjectsToLearnBatch, can be used instead of the dict.
 
     Parameters:
     ----------------------------
@@ -380,10 +459,15 @@ class L4L2Experiment(object):
         # learn each pattern multiple times
         for _ in xrange(self.numLearningPoints):
 
+          if not self.useNetworkAPI:
+            self.directColumns.compute(sensations)
+            continue
+
           for col in xrange(self.numColumns):
             location, feature = sensations[col]
-            self.sensorInputs[col].addDataToQueue(list(feature), 0, 0)
-            self.externalInputs[col].addDataToQueue(list(location), 0, 0)
+            self.sensorInputs[col].addDataToQueue(_toNonZeros(feature), 0, 0)
+            self.externalInputs[col].addDataToQueue(
+              _toNonZeros(location), 0, 0)
           iterations += 1
 
       # actually learn the objects
@@ -423,7 +507,8 @@ class L4L2Experiment(object):
 
     In many uses cases, this object can be created by implementations of
     ObjectMachines (cf htm.research.object_machine_factory), through their
-    method providedObjectsToInfer.
+    method providedObjectsToInfer. A SensationBatch can be used instead of the
+    list.
 
     If the object is known by the caller, an object name can be specified
     as an optional argument, and must match the objects given while learning.
@@ -447,11 +532,15 @@ class L4L2Experiment(object):
     for sensations in sensationList:
 
       # feed all columns with sensations
-      for col in xrange(self.numColumns):
-        location, feature = sensations[col]
-        self.sensorInputs[col].addDataToQueue(list(feature), 0, 0)
-        self.externalInputs[col].addDataToQueue(list(location), 0, 0)
-      self.network.run(1)
+      if self.useNetworkAPI:
+        for col in xrange(self.numColumns):
+          location, feature = sensations[col]
+          self.sensorInputs[col].addDataToQueue(_toNonZeros(feature), 0, 0)
+          self.externalInputs[col].addDataToQueue(
+            _toNonZeros(location), 0, 0)
+        self.network.run(1)
+      else:
+        self.directColumns.compute(sensations)
       self._updateInferenceStats(statistics, objectName)
 
     if reset:
@@ -497,6 +586,10 @@ class L4L2Experiment(object):
     """
     Sends a reset signal to the network.
     """
+    if not self.useNetworkAPI:
+      self.directColumns.reset()
+      return
+
     for col in xrange(self.numColumns):
       self.sensorInputs[col].addResetToQueue(sequenceId)
       self.externalInputs[col].addResetToQueue(sequenceId)
@@ -649,6 +742,10 @@ class L4L2Experiment(object):
              If set to True, the profiling will be reset.
 
     """
+    if not self.useNetworkAPI:
+      print "Profiling requires the Network API"
+      return
+
     print "Profiling information for {}".format(type(self).__name__)
     totalTime = 0.000001
     for region in self.network.regions.values():
@@ -695,14 +792,18 @@ class L4L2Experiment(object):
     """
     Resets the network profiling.
     """
-    self.network.resetProfiling()
+    if self.useNetworkAPI:
+      self.network.resetProfiling()
 
 
   def getL4Representations(self):
     """
     Returns the active representation in L4.
     """
-    return [set(column.getOutputData("activeCells").nonzero()[0])
+    if not self.useNetworkAPI:
+      return [set(cells) for cells in self.directColumns.L4ActiveCells]
+
+    return [set(self._getOutputIndices(column, "activeCells"))
             for column in self.L4Regions]
 
 
@@ -710,7 +811,10 @@ class L4L2Experiment(object):
     """
     Returns the cells in L4 that were predicted by the location input.
     """
-    return [set(column.getOutputData("predictedCells").nonzero()[0])
+    if not self.useNetworkAPI:
+      return [set(cells) for cells in self.directColumns.L4PredictedCells]
+
+    return [set(self._getOutputIndices(column, "predictedCells"))
             for column in self.L4Regions]
 
 
@@ -719,10 +823,24 @@ class L4L2Experiment(object):
     Returns the cells in L4 that were predicted by the location signal
     and are currently active.  Does not consider apical input.
     """
-    return [set(column.getOutputData("predictedActiveCells").nonzero()[0])
+    if not self.useNetworkAPI:
+      return [set(cells)
+              for cells in self.directColumns.L4PredictedActiveCells]
+
+    return [set(self._getOutputIndices(column, "predictedActiveCells"))
             for column in self.L4Regions]
 
 
+  def _getOutputIndices(self, region, outputName):
+    """
+    Returns the active indices of a region output, for dense or sparse links.
+    """
+    output = region.getOutputData(outputName)
+    if self.config.get("sparseLinks", False):
+      return getSparseInput(output)
+    return output.nonzero()[0]
+
+
   def getL2Representations(self):
     """
     Returns the active representation in L2.
@@ -968,6 +1086,9 @@ class L4L2Experiment(object):
     """
     Unsets the learning mode, to start inference.
     """
+    if not self.useNetworkAPI:
+      self.directColumns.setLearning(False)
+      return
 
     for region in self.L4Regions:
       region.setParameter("learn", False)
@@ -979,6 +1100,10 @@ class L4L2Experiment(object):
     """
     Sets the learning mode.
     """
+    if not self.useNetworkAPI:
+      self.directColumns.setLearning(True)
+      return
+
     for region in self.L4Regions:
       region.setParameter("learn", True)
     for region in self.L2Regions:
@@ -1031,3 +1156,14 @@ class L4L2Experiment(object):
         statistics["Correct classification"].append(1.0)
       else:
         statistics["Correct classification"].append(0.0)
+
+
+
+def _toNonZeros(sdr):
+  """
+  Convert an SDR to the nonZeros argument of RawSensor.addDataToQueue. Arrays,
+  e.g. the SDRs of an ObjectBatch, are passed without conversion.
+  """
+  if isinstance(sdr, np.ndarray):
+    return sdr
+  return list(sdr)
@@ -216,6 +216,11 @@ def createL4L2Column(network, networkConfig, suffix=""):
     "lateralSPParams" and "feedForwardSPParams" are optional. If included
     appropriate spatial pooler regions will be added to the network.
 
+    If "sparseLinks" is True, the sensors, L4 and L2 pass sparse link buffers
+    (see htmresearch.support.sparse_links) to each other instead of dense 0/1
+    arrays. SPRegions only understand dense inputs, so this can't be combined
+    with the spatial pooler options.
+
     If externalInputSize is 0, the externalInput sensor (and SP if appropriate)
     will NOT be created. In this case it is expected that L4 is a sequence
     memory region (e.g. ApicalTMSequenceRegion)
@@ -229,14 +234,26 @@ def createL4L2Column(network, networkConfig, suffix=""):
   L4Params = copy.deepcopy(networkConfig["L4Params"])
   L4Params["basalInputWidth"] = networkConfig["externalInputSize"]
   L4Params["apicalInputWidth"] = networkConfig["L2Params"]["cellCount"]
+  L2Params = copy.deepcopy(networkConfig["L2Params"])
+
+  sparseLinks = networkConfig.get("sparseLinks", False)
+  if sparseLinks:
+    if (networkConfig.get("lateralSPParams") or
+        networkConfig.get("feedForwardSPParams")):
+      raise ValueError("sparseLinks can't be used with SPRegions, which "
+                       "require dense inputs")
+    L4Params["sparseLinks"] = True
+    L2Params["sparseLinks"] = True
 
   if networkConfig["externalInputSize"] > 0:
     network.addRegion(
       externalInputName, "py.RawSensor",
-      json.dumps({"outputWidth": networkConfig["externalInputSize"]}))
+      json.dumps({"outputWidth": networkConfig["externalInputSize"],
+                  "sparseLinks": sparseLinks}))
   network.addRegion(
     sensorInputName, "py.RawSensor",
-    json.dumps({"outputWidth": networkConfig["sensorInputSize"]}))
+    json.dumps({"outputWidth": networkConfig["sensorInputSize"],
+                "sparseLinks": sparseLinks}))
 
   # Fixup network to include SP, if defined in networkConfig
   if networkConfig["externalInputSize"] > 0:
@@ -248,7 +265,7 @@ def createL4L2Column(network, networkConfig, suffix=""):
     json.dumps(L4Params))
   network.addRegion(
     L2ColumnName, "py.ColumnPoolerRegion",
-    json.dumps(networkConfig["L2Params"]))
+    json.dumps(L2Params))
 
   # Set phases appropriately so regions are executed in the proper sequence
   # This is required when we create multiple columns - the order of execution
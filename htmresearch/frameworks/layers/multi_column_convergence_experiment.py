@@ -34,6 +34,7 @@ from htmresearch.frameworks.layers.l2_l4_inference import L4L2Experiment
 from htmresearch.frameworks.layers.object_machine_factory import (
   createObjectMachine
 )
+from htmresearch.support.model_cache import ModelCache
 
 
 def runExperiment(args):
@@ -76,6 +77,11 @@ def runExperiment(args):
   @param numAmbiguousLocations (int) number of ambiguous locations. Ambiguous
                              locations will present during inference if this
                              parameter is set to be a positive number
+  @param modelCacheDir (str) Directory of a ModelCache for the trained
+                             networks, shared by runs that only differ by their
+                             inference parameters. Default: None (no cache)
+  @param modelCacheMaxBytes (int) Size limit of the model cache.
+                             Default: None (no limit)
 
   The method returns the args dict updated with multiple additional keys
   representing accuracy metrics.
@@ -98,6 +104,8 @@ def runExperiment(args):
   numInferenceRpts = args.get("numInferenceRpts", 1)
   l2Params = args.get("l2Params", None)
   l4Params = args.get("l4Params", None)
+  modelCacheDir = args.get("modelCacheDir", None)
+  modelCacheMaxBytes = args.get("modelCacheMaxBytes", None)
 
   # Create the objects
   objects = createObjectMachine(
@@ -130,8 +138,8 @@ def runExperiment(args):
   name = "convergence_O%03d_L%03d_F%03d_C%03d_T%03d" % (
     numObjects, numLocations, numFeatures, numColumns, trialNum
   )
-  exp = L4L2Experiment(
-    name,
+  experimentArgs = dict(
+    name=name,
     numCorticalColumns=numColumns,
     L2Overrides=l2Params,
     L4Overrides=l4Params,
@@ -143,8 +151,18 @@ def runExperiment(args):
     seed=trialNum,
     enableFeedback=enableFeedback,
   )
+  objectsToLearn = objects.provideObjectsToLearn()
 
-  exp.learnObjects(objects.provideObjectsToLearn())
+  def train():
+    exp = L4L2Experiment(**experimentArgs)
+    exp.learnObjects(objectsToLearn)
+    return exp
+
+  if modelCacheDir is None:
+    exp = train()
+  else:
+    exp = ModelCache(modelCacheDir, maxBytes=modelCacheMaxBytes).getOrTrain(
+      {"experiment": experimentArgs, "objects": objectsToLearn}, train)
 
   # For inference, we will check and plot convergence for each object. For each
   # object, we create a sequence of random sensations for each column.  We will
@@ -233,8 +251,8 @@ def runExperiment(args):
   args.update({"classificationAccuracy":classificationAccuracy})
   args.update({"classificationPerSensation":classificationPerSensation.tolist()})
 
-  # Can't pickle experiment so can't return it for batch multiprocessing runs.
-  # However this is very useful for debugging when running in a single thread.
+  # The pickled experiment holds the whole trained network, so it's only
+  # returned for debugging rather than with every batch multiprocessing result.
   if plotInferenceStats:
     args.update({"experiment": exp})
   return args
@@ -23,6 +23,9 @@ from abc import ABCMeta, abstractmethod
 import copy
 import random
 import numpy
+import scipy.sparse
+
+from htmresearch.support.sdr_batch import ObjectBatch
 
 
 class ObjectMachineBase(object):
@@ -98,6 +101,23 @@ class ObjectMachineBase(object):
     """
 
 
+  def provideObjectsToLearnBatch(self, *args, **kwargs):
+    """
+    Returns the objects of provideObjectsToLearn as an ObjectBatch, which
+    stores the SDRs of all sensations in a few flat arrays and can be sent to
+    experiments in place of the learning dict.
+
+    This default implementation converts the learning dict, so it still
+    creates every SDR set first. SimpleObjectMachine builds the batch
+    directly; SequenceObjectMachine and ContinuousLocationObjectMachine use
+    this conversion.
+    """
+    return ObjectBatch.fromObjects(self.provideObjectsToLearn(*args, **kwargs),
+                                   self.numColumns,
+                                   self.externalInputSize,
+                                   self.sensorInputSize)
+
+
   @abstractmethod
   def provideObjectToInfer(self, inferenceConfig):
     """
@@ -162,41 +182,29 @@ class ObjectMachineBase(object):
 
     Returns the tuple:
       (avg common pairs, avg common locations, avg common features)
+
+    or zeros if there are fewer than two objects, i.e. no pairs.
     """
     objects = self.getObjects()
 
-    if len(objects) == 0:
+    if len(objects) < 2:
       return 0.0, 0.0, 0.0
 
     sumCommonLocations = 0
     sumCommonFeatures = 0
     sumCommonPairs = 0
     numObjects = 0
-    commonPairHistogram = numpy.zeros(len(objects[0]), dtype=numpy.int32)
-    for o1, s1 in objects.iteritems():
-      for o2, s2 in objects.iteritems():
-        if o1 != o2:
-          # Count number of common locations id's and common feature id's
-          commonLocations = 0
-          commonFeatures = 0
-          for pair1 in s1:
-            for pair2 in s2:
-              if pair1[0] == pair2[0]: commonLocations += 1
-              if pair1[1] == pair2[1]: commonFeatures += 1
-
-          # print "Confusion",o1,o2,", common pairs=",len(set(s1)&set(s2)),
-          # print ", common locations=",commonLocations,"common features=",commonFeatures
-
-          if len(set(s1) & set(s2)) == len(s1):
-            raise RuntimeError("Two objects are identical!")
-
-          sumCommonPairs += len(set(s1) & set(s2))
-          sumCommonLocations += commonLocations
-          sumCommonFeatures += commonFeatures
-          commonPairHistogram[len(set(s1) & set(s2))] += 1
-          numObjects += 1
-
-    # print "Common pair histogram=", commonPairHistogram
+    for (rows,
+         commonPairs,
+         commonLocations,
+         commonFeatures) in self._iterObjectConfusionBlocks():
+      offDiagonal = numpy.ones(commonPairs.shape, dtype=bool)
+      offDiagonal[numpy.arange(len(rows)), rows] = False
+
+      sumCommonPairs += commonPairs[offDiagonal].sum()
+      sumCommonLocations += commonLocations[offDiagonal].sum()
+      sumCommonFeatures += commonFeatures[offDiagonal].sum()
+      numObjects += offDiagonal.sum()
 
     return (sumCommonPairs / float(numObjects),
             sumCommonLocations / float(numObjects),
@@ -204,6 +212,92 @@ class ObjectMachineBase(object):
             )
 
 
+  def objectConfusionMatrix(self):
+    """
+    Compute the overlap between every pair of objects, as counted by
+    objectConfusion.
+
+    This function will raise an exception if two objects are identical.
+
+    Returns the tuple:
+      (object names, common pairs, common locations, common features)
+
+    where each count is a numObjects x numObjects matrix whose rows and columns
+    follow the order of the object names. The diagonal holds the overlap of
+    each object with itself, so a single object gives 1 x 1 matrices and no
+    objects give empty ones.
+    """
+    objectNames = list(self.getObjects().keys())
+    numObjects = len(objectNames)
+
+    matrices = tuple(numpy.zeros((numObjects, numObjects), dtype=numpy.int64)
+                     for _ in xrange(3))
+    for block in self._iterObjectConfusionBlocks():
+      rows = block[0]
+      for matrix, counts in zip(matrices, block[1:]):
+        matrix[rows] = counts
+
+    return (objectNames,) + matrices
+
+
+  def _iterObjectConfusionBlocks(self, blockSize=256):
+    """
+    Yields the overlaps between blocks of objects and every object, as
+    (rows, common pairs, common locations, common features), where the counts
+    are dense len(rows) x numObjects arrays.
+
+    Locations, features and (location, feature) pairs are mapped to integer
+    ids and counted in sparse objects x ids matrices, so that each count is a
+    sparse matrix product. The location and feature counts are the number of
+    matching sensation pairs, i.e. the products of the per-object counts, and
+    the pair count is the number of distinct (location, feature) pairs both
+    objects share.
+    """
+    objects = self.getObjects()
+    numObjects = len(objects)
+
+    locationIDs = {}
+    featureIDs = {}
+    pairIDs = {}
+    objectIndices = []
+    locations = []
+    features = []
+    pairs = []
+    sizes = numpy.zeros(numObjects, dtype=numpy.int64)
+    for i, sensations in enumerate(objects.itervalues()):
+      sizes[i] = len(sensations)
+      objectIndices.extend([i] * len(sensations))
+      for pair in sensations:
+        locations.append(locationIDs.setdefault(pair[0], len(locationIDs)))
+        features.append(featureIDs.setdefault(pair[1], len(featureIDs)))
+        pairs.append(pairIDs.setdefault(pair, len(pairIDs)))
+
+    def countMatrix(ids, numIDs):
+      return scipy.sparse.csr_matrix(
+        (numpy.ones(len(ids), dtype=numpy.int64), (objectIndices, ids)),
+        shape=(numObjects, numIDs))
+
+    locationCounts = countMatrix(locations, len(locationIDs))
+    featureCounts = countMatrix(features, len(featureIDs))
+    pairCounts = countMatrix(pairs, len(pairIDs))
+    pairCounts.data[:] = 1
+
+    for start in xrange(0, numObjects, blockSize):
+      rows = numpy.arange(start, min(start + blockSize, numObjects))
+
+      commonPairs = (pairCounts[rows] * pairCounts.T).toarray()
+
+      identical = commonPairs == sizes[rows, numpy.newaxis]
+      identical[numpy.arange(len(rows)), rows] = False
+      if identical.any():
+        raise RuntimeError("Two objects are identical!")
+
+      yield (rows,
+             commonPairs,
+             (locationCounts[rows] * locationCounts.T).toarray(),
+             (featureCounts[rows] * featureCounts.T).toarray())
+
+
   def _checkObjectsToLearn(self, objects):
     """
     Checks that objects have the correct format before being sent to the
@@ -227,6 +321,28 @@ class ObjectMachineBase(object):
             raise ValueError("Invalid SDR's sent to experiment")
 
 
+  def _checkObjectBatchToLearn(self, batch):
+    """
+    Checks that an ObjectBatch has the correct format before being sent to
+    the experiment, like _checkObjectsToLearn.
+    """
+    for objectName in batch.keys():
+      if objectName not in self.objects:
+        raise ValueError(
+          "Invalid object name \"{}\" sent to experiment".format(objectName)
+        )
+
+    sensations = batch.sensations
+    if sensations.numColumns != self.numColumns:
+      raise ValueError(
+        "Invalid number of cortical column sensations sent to experiment"
+      )
+    if len(sensations) != batch.stepIndptr[-1] or \
+            sensations.locations.width != self.externalInputSize or \
+            sensations.features.width != self.sensorInputSize:
+      raise ValueError("Invalid SDR's sent to experiment")
+
+
   def _checkObjectToInfer(self, sensationList):
     """
     Checks that objects have the correct format before being sent to the
@@ -31,6 +31,7 @@ from math import pi, cos, sin, sqrt
 from itertools import combinations
 import numpy as np
 import matplotlib.pyplot as plt
+from scipy.spatial import cKDTree
 
 from htmresearch.frameworks.layers.physical_object_base import PhysicalObject
 
@@ -570,6 +571,14 @@ class Cube(Box):
     return template.format(self.width)
 
 
+def _normalize(vectors):
+  """
+  Divide each vector of the last axis by its length.
+  """
+  return vectors / np.power(np.sum(vectors*vectors, axis=-1),
+                            .5)[..., np.newaxis]
+
+
 class PlyModel(PhysicalObject):
   """
   A 3D .ply format model loader as a physical object.
@@ -589,6 +598,14 @@ class PlyModel(PhysicalObject):
 
   _FEATURES = ["face", "vertex", "edge", "surface"]
 
+  # The edge and face tests check that the cosine of an angle is 1, with this
+  # tolerance.
+  _ALIGNMENT_TOLERANCE = 0.0001
+
+  # Tolerances of the vertex test, as in np.allclose.
+  _VERTEX_RTOL = 1.e-3
+  _VERTEX_ATOL = 1.e-8
+
   def __init__(self, file=None, normalTolerance = 0., epsilon=None):
     """
     The only key parameter to provide is location of file.
@@ -622,6 +639,35 @@ class PlyModel(PhysicalObject):
     self.epsilon = self.DEFAULT_EPSILON if epsilon is None else epsilon
     self.sampledPoints = {i:[] for i in self._FEATURES}
     self.nTol = normalTolerance
+    self._buildIndex()
+
+  def _buildIndex(self):
+    """
+    Precompute the geometry used by contains: a KD-tree over the vertices, and
+    arrays with the unit direction of every face edge and the unit normal of
+    every face. Only the first three vertices of each face are used.
+    """
+    self._vertexCoordinates = np.array(
+      (self.vertices['x'], self.vertices['y'], self.vertices['z'])).T
+    self._vertexTree = cKDTree(self._vertexCoordinates)
+
+    faceVertices = np.array([indices[:3]
+                             for indices in self.faces['vertex_indices']],
+                            dtype="int").reshape(-1, 3)
+    corners = self._vertexCoordinates[faceVertices]
+
+    # The edges of each face go from vertex i to vertex j, for each (i, j) in
+    # combinations(range(3), 2).
+    edgeStarts, edgeEnds = np.array(list(combinations(range(3), 2))).T
+    self._edgeEnds = corners[:, edgeEnds]
+    self._faceOrigins = corners[:, 0]
+    self._faceEnds = corners[:, 2]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+      self._edgeDirections = _normalize(corners[:, edgeEnds] -
+                                        corners[:, edgeStarts])
+      self._faceNormals = _normalize(np.cross(corners[:, 2] - corners[:, 0],
+                                              corners[:, 1] - corners[:, 0]))
 
   def getFeatureID(self, location):
     """
@@ -629,7 +675,16 @@ class PlyModel(PhysicalObject):
 
     In the case of a sphere, it is always the same if the location is valid.
     """
-    truthyFeature = self.contains(location)
+    return self._getFeatureIDForFeature(self.contains(location))
+
+  def getFeatureIDs(self, locations):
+    """
+    Returns the feature index associated with each of the provided locations.
+    """
+    return [self._getFeatureIDForFeature(truthyFeature)
+            for truthyFeature in self.containsMany(locations)]
+
+  def _getFeatureIDForFeature(self, truthyFeature):
     if not truthyFeature:
       return self.EMPTY_FEATURE
     elif truthyFeature=='face':
@@ -643,50 +698,112 @@ class PlyModel(PhysicalObject):
     else:
       return self.EMPTY_FEATURE
 
-  def _containsOnFace(self, location, face):
-    vertices = self.vertices[face]
-    vertices = np.array((vertices['x'], vertices['y'], vertices['z'])).T
-    v0 = vertices[2] - vertices[0]
-    v1 = vertices[1] - vertices[0]
-    v2 = location - vertices[0]
-    v3 = vertices[2] - location
-    N1 = np.cross(v0,v1)
-    N1 = N1/(np.dot(N1,N1))**.5
-
-    N2 = np.cross(v2,v3)
-    N2 = N2/(np.dot(N2,N2))**.5
-    if self.almostEqual(abs(np.dot(N1,N2)), 1.0):
-      return True
-    return False
-  
-  def _containsOnEdge(self, location, edge):
-    edge = np.array((edge['x'], edge['y'], edge['z'])).T
-    v = edge[1] - location
-    av = v/(np.dot(v,v))**.5
-    d = edge[1] - edge[0]
-    ad = d/(np.dot(d,d))**.5
-    vd = np.dot(av,ad)
-    self.epsilon = 0.0001
-    if self.almostEqual(vd, 1.0):
-          self.epsilon = self.DEFAULT_EPSILON
-          return True
-
   def contains(self, location):
     """
     Checks that the provided point is on the model (object).
-    """
-    for vertex in self.vertices:
-      V = np.array((vertex['x'], vertex['y'], vertex['z'])).T
-      if np.allclose(location, V, rtol=1.e-3):
-        return "vertex"
-    for face in self.faces:
-      edges = np.choose(np.array(list(combinations(range(3),2))), self.vertices[face])
-      for edge in edges:
-        if self._containsOnEdge(location, edge):
-          return "edge"
-      if self._containsOnFace(location,face):
-        return "face"
-    return False
+
+    Returns "vertex" if it's close to a vertex. Otherwise, the faces are checked
+    in order, and the first face that has the point on the ray from one of its
+    edge's end vertices through its start vertex returns "edge", or that has it
+    in its plane returns "face". Returns False if no face has the point.
+    """
+    return self.containsMany([location])[0]
+
+  def containsMany(self, locations, maxPairs=2**16):
+    """
+    Vectorized contains.
+
+    @param    locations (sequence of 3D points)
+              The points to check
+
+    @param    maxPairs (int)
+              The maximum number of (point, face) pairs to test at once. Limits
+              the size of the temporary arrays.
+
+    @return   (list)
+              What contains would return for each point
+    """
+    locations = np.asarray(locations)
+    if locations.size == 0:
+      return []
+    locations = locations.reshape(-1, 3)
+
+    results = [False] * len(locations)
+    onVertex = self._getOnVertex(locations)
+    for i in np.flatnonzero(onVertex):
+      results[i] = "vertex"
+
+    # Test the faces in order, in chunks, until every point has a first face.
+    remaining = np.flatnonzero(~onVertex)
+    numFaces = len(self._faceNormals)
+    start = 0
+    while len(remaining) > 0 and start < numFaces:
+      stop = min(numFaces, start + max(1, maxPairs // len(remaining)))
+      onEdge, onFace = self._getOnEdgeAndFace(locations[remaining], start, stop)
+      onEdgeOrFace = onEdge | onFace
+      found = onEdgeOrFace.any(axis=1)
+      firstFaces = onEdgeOrFace.argmax(axis=1)
+      for i, iPoint, iFace in zip(np.flatnonzero(found), remaining[found],
+                                  firstFaces[found]):
+        results[iPoint] = "edge" if onEdge[i, iFace] else "face"
+      remaining = remaining[~found]
+      start = stop
+
+    return results
+
+  def _getOnVertex(self, locations):
+    """
+    Checks which points are np.allclose to a vertex, testing only the vertices
+    within the largest possible tolerance.
+    """
+    onVertex = np.zeros(len(locations), dtype="bool")
+    if len(self._vertexCoordinates) == 0:
+      return onVertex
+
+    maxTolerance = (self._VERTEX_ATOL +
+                    self._VERTEX_RTOL*np.abs(self._vertexCoordinates).max())
+    finite = np.isfinite(locations).all(axis=1)
+    candidates = [None] * len(locations)
+    if finite.any():
+      for i, neighbors in zip(np.flatnonzero(finite),
+                              self._vertexTree.query_ball_point(
+                                locations[finite], maxTolerance*(1 + 1e-6),
+                                p=np.inf)):
+        candidates[i] = neighbors
+
+    for i, location in enumerate(locations):
+      vertices = (self._vertexCoordinates if candidates[i] is None
+                  else self._vertexCoordinates[candidates[i]])
+      if len(vertices) > 0:
+        onVertex[i] = np.isclose(location, vertices, rtol=self._VERTEX_RTOL,
+                                 atol=self._VERTEX_ATOL).all(axis=1).any()
+
+    return onVertex
+
+  def _getOnEdgeAndFace(self, locations, start, stop):
+    """
+    Run the edge and face tests for every pair of point and face in
+    [start, stop).
+
+    @return   (tuple of 2D boolean arrays)
+              Whether each point is on an edge of each face, and whether it's
+              in the plane of each face
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+      towardsEdgeEnds = _normalize(self._edgeEnds[np.newaxis, start:stop] -
+                                   locations[:, np.newaxis, np.newaxis])
+      onEdge = (np.abs(
+        np.sum(towardsEdgeEnds*self._edgeDirections[np.newaxis, start:stop],
+               axis=-1) - 1.0) <= self._ALIGNMENT_TOLERANCE).any(axis=-1)
+
+      normals = _normalize(np.cross(
+        locations[:, np.newaxis] - self._faceOrigins[np.newaxis, start:stop],
+        self._faceEnds[np.newaxis, start:stop] - locations[:, np.newaxis]))
+      onFace = np.abs(np.abs(
+        np.sum(normals*self._faceNormals[np.newaxis, start:stop], axis=-1)) -
+                      1.0) <= self._ALIGNMENT_TOLERANCE
+
+    return onEdge, onFace
 
   def sampleLocation(self):
     """
@@ -23,6 +23,7 @@ import random
 import numpy
 
 from htmresearch.frameworks.layers.object_machine_base import ObjectMachineBase
+from htmresearch.support.sdr_batch import ObjectBatch, SDRBatch, SensationBatch
 
 
 
@@ -134,6 +135,51 @@ class SimpleObjectMachine(ObjectMachineBase):
     return objects
 
 
+  def provideObjectsToLearnBatch(self, objectNames=None):
+    """
+    Returns the objects of provideObjectsToLearn as an ObjectBatch, without
+    creating a set for each sensation.
+
+    Parameters:
+    ----------------------------
+    @param   objectNames (list)
+             List of object names to provide to the experiment
+
+    """
+    if objectNames is None:
+      objectNames = self.objects.keys()
+
+    # Each sensation SDR is a row of a pool of distinct SDRs, so the batch is
+    # gathered from the pools' rows.
+    locationPool = _SDRPool(self.locations)
+    featurePool = _SDRPool(self.features)
+
+    locationRows = []
+    featureRows = []
+    stepIndptr = numpy.zeros(len(objectNames) + 1, dtype="int64")
+    for i, name in enumerate(objectNames):
+      stepIndptr[i + 1] = stepIndptr[i] + len(self.objects[name])
+      for locationID, featureID in self.objects[name]:
+        for col in xrange(self.numColumns):
+          locationRows.append(locationPool.getRow(col, locationID))
+          featureRows.append(featurePool.getRow(col, featureID,
+                                                emptyIndex=-1))
+
+    sensations = SensationBatch(
+      locationPool.getBatch(self.externalInputSize).take(locationRows),
+      featurePool.getBatch(self.sensorInputSize).take(featureRows),
+      self.numColumns)
+    objects = ObjectBatch(objectNames, stepIndptr, sensations)
+
+    # provideObjectsToLearn reseeds numpy for each sensation in _getSDRPairs,
+    # so the random draws that follow don't depend on the format.
+    if stepIndptr[-1] > 0:
+      numpy.random.seed(self.seed)
+
+    self._checkObjectBatchToLearn(objects)
+    return objects
+
+
   def provideObjectToInfer(self, inferenceConfig):
     """
     Returns the sensations in a canonical format to be sent to an experiment.
@@ -381,3 +427,44 @@ class SimpleObjectMachine(ObjectMachineBase):
       self.features.append(
         [self._generatePattern(bits, size) for _ in xrange(self.numFeatures)]
     )
+
+
+
+class _SDRPool(object):
+  """
+  The SDRs of the location or feature pools of every column, as rows of an
+  SDRBatch. A row is added for each union of SDRs or empty SDR that is
+  requested.
+  """
+
+  def __init__(self, pools):
+    self.pools = pools
+    self.sdrs = []
+    self.rows = {}
+
+
+  def getRow(self, col, index, emptyIndex=None):
+    """
+    Returns the row for an index of a column's pool, like
+    SimpleObjectMachine._getSDRPairs: a tuple of indices is the union of their
+    SDRs and emptyIndex (if given) is an empty SDR.
+    """
+    key = (col, index)
+    row = self.rows.get(key)
+    if row is None:
+      if isinstance(index, tuple):
+        sdr = set()
+        for idx in index:
+          sdr = sdr | self.pools[col][idx]
+      elif index == emptyIndex:
+        sdr = set()
+      else:
+        sdr = self.pools[col][index]
+      row = len(self.sdrs)
+      self.rows[key] = row
+      self.sdrs.append(sdr)
+    return row
+
+
+  def getBatch(self, width):
+    return SDRBatch.fromSDRs(self.sdrs, width)
@@ -30,6 +30,7 @@ import random
 from collections import defaultdict
 
 import numpy as np
+import scipy.sparse
 
 from htmresearch.algorithms.apical_tiebreak_temporal_memory import (
   ApicalTiebreakPairMemory)
@@ -325,6 +326,343 @@ class PIUNCorticalColumn(object):
 
 
 
+class BatchedPIUNCorticalColumn(object):
+  """
+  Runs inference for several independent episodes at once through the learned
+  layers of a PIUNCorticalColumn, e.g. to infer many objects in one pass.
+
+  Each episode has its own input layer and location layer activity, exactly as
+  if it had its own copy of the column. The activity of all episodes is stored
+  in one array per population, as sorted keys (episode * numCells + cell), so
+  each episode's activity is a contiguous range, like a row of a CSR matrix.
+  The phases of each location module are likewise stored in one array, grouped
+  by episode. The segment overlaps of every episode are then computed with one
+  sparse matrix product per layer instead of one computeActivity per episode.
+
+  Only inference is supported. The connected synapses are copied when the batch
+  is created, so create a new batch after the column learns. Only "square"
+  location modules (Superficial2DLocationModule) are supported, and the L4
+  winner cells aren't computed since they're only used for learning.
+  """
+
+  def __init__(self, column, numEpisodes):
+    """
+    @param column (PIUNCorticalColumn)
+    A trained column. Its own activity isn't used or changed.
+
+    @param numEpisodes (int)
+    The number of independent inference episodes
+    """
+    for module in column.L6aModules:
+      if not isinstance(module, Superficial2DLocationModule):
+        raise ValueError("Batched inference only supports the square bumpType")
+
+    self.column = column
+    self.numEpisodes = numEpisodes
+
+    L4 = column.L4
+    self.numMinicolumns = L4.numberOfColumns()
+    self.cellsPerColumn = L4.getCellsPerColumn()
+    self.numL4Cells = L4.numberOfCells()
+    self.L4ActivationThreshold = L4.getActivationThreshold()
+    (self.L4BasalSynapses,
+     self.L4CellsForBasalSegments) = _getConnectedSynapses(
+       L4.basalConnections, L4.getConnectedPermanence())
+
+    self.moduleCellOffsets = np.cumsum(
+      [0] + [module.numberOfCells() for module in column.L6aModules])
+    self.numLocationCells = self.moduleCellOffsets[-1]
+    self.moduleSynapses = [
+      _getConnectedSynapses(module.connections, module.connectedPermanence)
+      for module in column.L6aModules]
+
+    self.reset()
+
+
+  def reset(self):
+    """
+    Clear all cell activity in every episode.
+    """
+    modules = self.column.L6aModules
+    self.activePhases = [np.empty((0,2), dtype="float") for _ in modules]
+    self.episodesForActivePhases = [np.empty(0, dtype="int64") for _ in modules]
+    self.cellKeysForActivePhases = [np.empty(0, dtype="int64") for _ in modules]
+    self.activeCellKeys = [np.empty(0, dtype="int64") for _ in modules]
+    self.sensoryAssociatedCellKeys = [np.empty(0, dtype="int64")
+                                      for _ in modules]
+
+    self.L4ActiveCellKeys = np.empty(0, dtype="int64")
+    self.L4PredictedCellKeys = np.empty(0, dtype="int64")
+
+
+  def movementCompute(self, displacements, episodes=None, noiseFactor=0,
+                      moduleNoiseFactor=0):
+    """
+    Shift the location layer of some of the episodes.
+
+    @param displacements (numpy array)
+    One [top, left] displacement per episode in 'episodes'
+
+    @param episodes (numpy array or None)
+    The episodes that move. Defaults to all of them.
+    """
+    if episodes is None:
+      episodes = np.arange(self.numEpisodes)
+
+    episodeDisplacements = np.zeros((self.numEpisodes, 2), dtype="float")
+    episodeDisplacements[episodes] = displacements
+    if noiseFactor != 0:
+      episodeDisplacements[episodes] += np.random.normal(
+        0, noiseFactor, (len(episodes), 2))
+
+    isMoving = np.zeros(self.numEpisodes, dtype="bool")
+    isMoving[episodes] = True
+
+    for iModule, module in enumerate(self.column.L6aModules):
+      moduleDisplacements = episodeDisplacements
+      if moduleNoiseFactor != 0:
+        moduleDisplacements = episodeDisplacements + np.random.normal(
+          0, moduleNoiseFactor, episodeDisplacements.shape)
+
+      # Calculate each episode's delta in the module's coordinates.
+      phaseDisplacements = (np.dot(moduleDisplacements,
+                                   module.rotationMatrix.T) *
+                            module.phasesPerUnitDistance)
+
+      phaseEpisodes = self.episodesForActivePhases[iModule]
+      movingPhases = isMoving[phaseEpisodes]
+      phases = (self.activePhases[iModule][movingPhases] +
+                phaseDisplacements[phaseEpisodes[movingPhases]])
+      np.round(phases, decimals=9, out=phases)
+      np.mod(phases, 1.0, out=phases)
+      self.activePhases[iModule][movingPhases] = phases
+
+      self._computeActiveCells(iModule)
+
+
+  def sensoryCompute(self, activeMinicolumns, episodes=None):
+    """
+    Send a sensory input into some of the episodes.
+
+    @param activeMinicolumns (sequence of numpy arrays)
+    The active minicolumns of each episode in 'episodes'
+
+    @param episodes (numpy array or None)
+    The episodes that sense. Defaults to all of them.
+    """
+    if episodes is None:
+      episodes = np.arange(self.numEpisodes)
+    episodes = np.asarray(episodes, dtype="int64")
+
+    isSensing = np.zeros(self.numEpisodes, dtype="bool")
+    isSensing[episodes] = True
+
+    activeColumnKeys = np.unique(np.concatenate(
+      [np.empty(0, dtype="int64")] +
+      [episode*self.numMinicolumns + np.asarray(columns, dtype="int64")
+       for episode, columns in zip(episodes, activeMinicolumns)]))
+
+    # Depolarize the L4 cells with an active basal segment.
+    locationCellKeys = np.concatenate(
+      [np.empty(0, dtype="int64")] +
+      [(keys // module.numberOfCells())*self.numLocationCells +
+       offset + keys % module.numberOfCells()
+       for module, offset, keys in zip(self.column.L6aModules,
+                                       self.moduleCellOffsets,
+                                       self.activeCellKeys)])
+    locationCellKeys = locationCellKeys[
+      isSensing[locationCellKeys // self.numLocationCells]]
+    predictedCellKeys = _getCellKeysWithActiveSegments(
+      _getInputMatrix(locationCellKeys, self.numLocationCells,
+                      self.numEpisodes),
+      self.L4BasalSynapses, self.L4CellsForBasalSegments,
+      self.L4ActivationThreshold, self.numL4Cells)
+
+    # Activate the predicted cells in active minicolumns and burst the rest.
+    predictedColumnKeys = predictedCellKeys // self.cellsPerColumn
+    correctPredictedCellKeys = predictedCellKeys[
+      np.in1d(predictedColumnKeys, activeColumnKeys)]
+    burstingColumnKeys = np.setdiff1d(activeColumnKeys, predictedColumnKeys)
+    activeCellKeys = np.union1d(
+      correctPredictedCellKeys,
+      (burstingColumnKeys[:, np.newaxis]*self.cellsPerColumn +
+       np.arange(self.cellsPerColumn)).ravel())
+
+    self.L4ActiveCellKeys = np.union1d(
+      self.L4ActiveCellKeys[
+        ~isSensing[self.L4ActiveCellKeys // self.numL4Cells]],
+      activeCellKeys)
+    self.L4PredictedCellKeys = np.union1d(
+      self.L4PredictedCellKeys[
+        ~isSensing[self.L4PredictedCellKeys // self.numL4Cells]],
+      predictedCellKeys)
+
+    # Anchor the location modules of the episodes with an active input.
+    hasInput = np.zeros(self.numEpisodes, dtype="bool")
+    hasInput[activeCellKeys // self.numL4Cells] = True
+    anchorInput = _getInputMatrix(activeCellKeys, self.numL4Cells,
+                                  self.numEpisodes)
+
+    for iModule, module in enumerate(self.column.L6aModules):
+      self._anchorModule(iModule, module, anchorInput, hasInput)
+
+
+  def _anchorModule(self, iModule, module, anchorInput, hasInput):
+    """
+    The batched equivalent of
+    Superficial2DLocationModule._sensoryComputeInferenceMode.
+    """
+    numCells = module.numberOfCells()
+    synapses, cellsForSegments = self.moduleSynapses[iModule]
+    sensorySupportedCellKeys = _getCellKeysWithActiveSegments(
+      anchorInput, synapses, cellsForSegments, module.activationThreshold,
+      numCells)
+
+    phaseEpisodes = self.episodesForActivePhases[iModule]
+    if "corners" in module.anchoringMethod:
+      keptPhases = ~hasInput[phaseEpisodes]
+      activatedCellKeys = sensorySupportedCellKeys
+    else:
+      keptPhases = (~hasInput[phaseEpisodes] |
+                    np.in1d(self.cellKeysForActivePhases[iModule],
+                            sensorySupportedCellKeys))
+      activatedCellKeys = np.setdiff1d(sensorySupportedCellKeys,
+                                       self.activeCellKeys[iModule])
+
+    # Add phases for the activated cells, keeping each episode's phases in the
+    # same order as a single module would.
+    activatedCoordsBase = np.transpose(
+      np.unravel_index(activatedCellKeys % numCells,
+                       module.cellDimensions)).astype("float")
+    activatedCoords = np.concatenate(
+      [np.empty((0,2), dtype="float")] +
+      [activatedCoordsBase + [iOffset, jOffset]
+       for iOffset in module.cellCoordinateOffsets
+       for jOffset in module.cellCoordinateOffsets])
+    activatedEpisodes = np.tile(activatedCellKeys // numCells,
+                                len(module.cellCoordinateOffsets)**2)
+
+    phases = np.append(self.activePhases[iModule][keptPhases],
+                       activatedCoords / module.cellDimensions, axis=0)
+    phaseEpisodes = np.append(phaseEpisodes[keptPhases], activatedEpisodes)
+    order = np.argsort(phaseEpisodes, kind="mergesort")
+    self.activePhases[iModule] = phases[order]
+    self.episodesForActivePhases[iModule] = phaseEpisodes[order]
+    self._computeActiveCells(iModule)
+
+    associatedCellKeys = self.sensoryAssociatedCellKeys[iModule]
+    self.sensoryAssociatedCellKeys[iModule] = np.union1d(
+      associatedCellKeys[~hasInput[associatedCellKeys // numCells]],
+      sensorySupportedCellKeys)
+
+
+  def _computeActiveCells(self, iModule):
+    module = self.column.L6aModules[iModule]
+
+    # Round each coordinate to the nearest cell.
+    activeCellCoordinates = np.floor(
+      self.activePhases[iModule] * module.cellDimensions).astype("int")
+
+    # Convert coordinates to cell numbers.
+    cellsForActivePhases = np.ravel_multi_index(activeCellCoordinates.T,
+                                                module.cellDimensions)
+    self.cellKeysForActivePhases[iModule] = (
+      self.episodesForActivePhases[iModule]*module.numberOfCells() +
+      cellsForActivePhases)
+    self.activeCellKeys[iModule] = np.unique(
+      self.cellKeysForActivePhases[iModule])
+
+
+  def getSensoryRepresentation(self, episode):
+    """
+    Gets the active cells in the sensory layer of an episode.
+    """
+    return _getEpisodeCells(self.L4ActiveCellKeys, episode, self.numL4Cells)
+
+
+  def getLocationRepresentation(self, episode):
+    """
+    Get the full population representation of an episode's location layer.
+    """
+    return self._getLocationCells(self.activeCellKeys, episode)
+
+
+  def getSensoryAssociatedLocationRepresentation(self, episode):
+    """
+    Get the location cells of an episode that were driven by the input layer.
+    """
+    return self._getLocationCells(self.sensoryAssociatedCellKeys, episode)
+
+
+  def _getLocationCells(self, moduleCellKeys, episode):
+    return np.concatenate(
+      [np.empty(0, dtype="int64")] +
+      [_getEpisodeCells(keys, episode, module.numberOfCells()) + offset
+       for module, offset, keys in zip(self.column.L6aModules,
+                                       self.moduleCellOffsets,
+                                       moduleCellKeys)])
+
+
+
+def _getConnectedSynapses(connections, connectedPermanence):
+  """
+  Copy the connected synapses of a SparseMatrixConnections.
+
+  @return (tuple)
+  - synapses (scipy.sparse.csr_matrix)
+    A 0/1 matrix with a row per input bit and a column per segment
+
+  - cellsForSegments (numpy array)
+    The cell of each segment
+  """
+  segments, inputBits, permanences = connections.matrix.getAllNonZeros(True)
+  connected = permanences >= np.float32(connectedPermanence)
+  numSegments = connections.matrix.nRows()
+
+  synapses = scipy.sparse.csr_matrix(
+    (np.ones(np.count_nonzero(connected), dtype="int32"),
+     (inputBits[connected], segments[connected])),
+    shape=(connections.matrix.nCols(), numSegments))
+  cellsForSegments = connections.mapSegmentsToCells(
+    np.arange(numSegments, dtype="uint32")).astype("int64")
+
+  return synapses, cellsForSegments
+
+
+def _getInputMatrix(keys, numInputs, numEpisodes):
+  """
+  Convert the keys (episode * numInputs + input) of the active inputs into a
+  0/1 matrix with a row per episode.
+  """
+  return scipy.sparse.csr_matrix(
+    (np.ones(len(keys), dtype="int32"), (keys // numInputs, keys % numInputs)),
+    shape=(numEpisodes, numInputs))
+
+
+def _getCellKeysWithActiveSegments(inputs, synapses, cellsForSegments,
+                                   activationThreshold, numCells):
+  """
+  Compute the segment overlaps of every episode with one matrix product.
+
+  @return (numpy array)
+  The sorted keys (episode * numCells + cell) of the cells with an active
+  segment
+  """
+  overlaps = inputs.dot(synapses).tocoo()
+  active = overlaps.data >= activationThreshold
+  return np.unique(overlaps.row[active].astype("int64")*numCells +
+                   cellsForSegments[overlaps.col[active]])
+
+
+def _getEpisodeCells(keys, episode, numCells):
+  """
+  Get the cells of one episode from a sorted array of keys.
+  """
+  start, stop = np.searchsorted(keys, [episode*numCells, (episode + 1)*numCells])
+  return keys[start:stop] - episode*numCells
+
+
+
 class PIUNExperiment(object):
   """
   An experiment class which passes sensory and motor inputs into a special two
@@ -396,9 +734,34 @@ class PIUNExperiment(object):
 
     self.representationSet = set()
 
+    # An inverted index of locationRepresentations, for classifying a location
+    # representation in time proportional to its number of cells. Each learned
+    # (objectName, featureIndex) and each object gets an ID, and each cell
+    # maps to bit masks of the IDs whose learned representations contain it.
+    self.learnedLocations = []
+    self.learnedLocationIds = {}
+    self.objectNames = []
+    self.objectIds = {}
+    self.cellLocationMasks = {}
+    self.cellObjectMasks = {}
+
+    # Bit mask of the objects that can still be inferred since the last reset.
+    self.candidateObjectMask = 0
+
+  def __getstate__(self):
+    """
+    Pickle the trained network and the learned representations, e.g. to train
+    once and run inference in several processes. Monitors trace a specific run,
+    so they aren't pickled.
+    """
+    state = self.__dict__.copy()
+    state["monitors"] = {}
+    return state
+
   def reset(self):
     self.column.reset()
     self.locationOnObject = None
+    self.candidateObjectMask = (1 << len(self.objectNames)) - 1
 
     for monitor in self.monitors.values():
       monitor.afterReset()
@@ -446,6 +809,8 @@ class PIUNExperiment(object):
         locationRepresentation = self.column.getSensoryAssociatedLocationRepresentation()
         self.locationRepresentations[(objectDescription["name"],
                                       iFeature)].append(locationRepresentation)
+        self._indexLocationRepresentation(objectDescription["name"], iFeature,
+                                          locationRepresentation)
         self.inputRepresentations[(objectDescription["name"],
                                    iFeature, feature["name"])] = (
                                      self.column.L4.getWinnerCells())
@@ -461,11 +826,82 @@ class PIUNExperiment(object):
     return locationsAreUnique
 
 
+  def _indexLocationRepresentation(self, objectName, iFeature, cells):
+    """
+    Add a learned location representation to the inverted index.
+    """
+    locationId = self.learnedLocationIds.get((objectName, iFeature))
+    if locationId is None:
+      locationId = len(self.learnedLocations)
+      self.learnedLocationIds[(objectName, iFeature)] = locationId
+      self.learnedLocations.append((objectName, iFeature))
+
+    objectId = self.objectIds.get(objectName)
+    if objectId is None:
+      objectId = len(self.objectNames)
+      self.objectIds[objectName] = objectId
+      self.objectNames.append(objectName)
+
+    for cell in cells:
+      cell = int(cell)
+      self.cellLocationMasks[cell] = (self.cellLocationMasks.get(cell, 0) |
+                                      (1 << locationId))
+      self.cellObjectMasks[cell] = (self.cellObjectMasks.get(cell, 0) |
+                                    (1 << objectId))
+
+
+  def _getContainingLocationMask(self, representation):
+    """
+    Get a bit mask of the learned locations whose learned representations
+    contain every cell of this representation.
+    """
+    mask = (1 << len(self.learnedLocations)) - 1
+    for cell in representation:
+      mask &= self.cellLocationMasks.get(int(cell), 0)
+      if mask == 0:
+        break
+
+    return mask
+
+
+  def classifyLocationRepresentation(self, representation):
+    """
+    Find the learned locations that explain a location representation.
+
+    @param representation (sequence of ints)
+    Location layer cells, e.g. from getSensoryAssociatedLocationRepresentation
+
+    @return (list)
+    The (objectName, featureIndex) pairs whose learned representations contain
+    every cell in the representation
+    """
+    mask = self._getContainingLocationMask(representation)
+    return [location
+            for locationId, location in enumerate(self.learnedLocations)
+            if mask >> locationId & 1]
+
+
+  def getCandidateObjects(self):
+    """
+    Get the objects that are still candidates in the current inference, i.e.
+    objects with at least one learned location cell in every location
+    representation that inferObjectWithRandomMovements has checked since the
+    last reset.
+
+    @return (list)
+    Object names
+    """
+    return [objectName
+            for objectId, objectName in enumerate(self.objectNames)
+            if self.candidateObjectMask >> objectId & 1]
+
+
   def inferObjectWithRandomMovements(self,
                                      objectDescription,
                                      numSensations=None,
                                      randomLocation=False,
-                                     checkFalseConvergence=True):
+                                     checkFalseConvergence=True,
+                                     stopWhenRuledOut=False):
     """
     Attempt to recognize the specified object with the network. Randomly move
     the sensor over the object until the object is recognized.
@@ -481,6 +917,11 @@ class PIUNExperiment(object):
     method will run until the object is recognized or until maxTraversals is
     reached.
 
+    @param stopWhenRuledOut (bool)
+    Stop inference as soon as the object is no longer a candidate (see
+    getCandidateObjects), i.e. the location layer no longer has any cell of
+    the object's learned locations.
+
     @return (bool)
     True if inference succeeded
     """
@@ -493,6 +934,7 @@ class PIUNExperiment(object):
     finished = False
     inferred = False
     inferredStep = None
+    ruledOut = False
     prevTouchSequence = None
 
     for _ in xrange(self.maxTraversals):
@@ -524,10 +966,13 @@ class PIUNExperiment(object):
           # are correct, it implies that the input layer's representation is
           # classifiable -- the location layer just correctly classified it.
           representation = self.column.getSensoryAssociatedLocationRepresentation()
-          target_representations = set(np.concatenate(
-            self.locationRepresentations[
-              (objectDescription["name"], iFeature)]))
-          inferred = (set(representation) <= target_representations)
+          targetId = self.learnedLocationIds.get(
+            (objectDescription["name"], iFeature))
+          if targetId is None:
+            inferred = (len(representation) == 0)
+          else:
+            inferred = bool(
+              self._getContainingLocationMask(representation) >> targetId & 1)
           if inferred:
             inferredStep = currentStep
 
@@ -536,8 +981,20 @@ class PIUNExperiment(object):
             print("Converged to an incorrect representation!")
             return None
 
+          if len(representation) > 0:
+            anyCellMask = 0
+            for cell in representation:
+              anyCellMask |= self.cellObjectMasks.get(int(cell), 0)
+            self.candidateObjectMask &= anyCellMask
+
+          objectId = self.objectIds.get(objectDescription["name"])
+          ruledOut = (not inferred and
+                      (objectId is None or
+                       not self.candidateObjectMask >> objectId & 1))
+
         finished = ((inferred and numSensations is None) or
-                    (numSensations is not None and currentStep == numSensations))
+                    (numSensations is not None and currentStep == numSensations) or
+                    (stopWhenRuledOut and ruledOut))
 
         if finished:
           break
@@ -553,24 +1010,158 @@ class PIUNExperiment(object):
     return inferredStep
 
 
-  def _move(self, feature, randomLocation = False, useNoise = True):
+  def inferObjectsWithRandomMovements(self,
+                                      objectDescriptions,
+                                      numSensations=None,
+                                      randomLocation=False,
+                                      stopWhenRuledOut=False):
     """
-    Move the sensor to the center of the specified feature. If the sensor is
-    currently at another location, send the displacement into the cortical
-    column so that it can perform path integration.
+    Like inferObjectWithRandomMovements, but infer several objects at once with
+    a BatchedPIUNCorticalColumn. Each object gets its own inference episode with
+    its own random touch sequences, and all episodes share each timestep's
+    segment computations. The column must use the "square" bumpType. Monitors
+    aren't notified, and the column's own activity isn't changed.
+
+    @param objectDescriptions (list of dicts)
+    Objects in the format used by inferObjectWithRandomMovements
+
+    @return (list)
+    For each object, the inferredStep that inferObjectWithRandomMovements
+    would return
     """
+    numEpisodes = len(objectDescriptions)
+    batch = BatchedPIUNCorticalColumn(self.column, numEpisodes)
+
+    # Choose the touch sequences of every episode.
+    touches = []
+    for objectDescription in objectDescriptions:
+      episodeTouches = []
+      prevTouchSequence = None
+      for _ in xrange(self.maxTraversals):
+        while True:
+          touchSequence = range(len(objectDescription["features"]))
+          random.shuffle(touchSequence)
+
+          # Make sure the first touch will cause a movement.
+          if (prevTouchSequence is not None and
+              touchSequence[0] == prevTouchSequence[-1]):
+            continue
+
+          break
+
+        episodeTouches += touchSequence
+        prevTouchSequence = touchSequence
+      touches.append(episodeTouches)
+
+    locationsOnObject = [None] * numEpisodes
+    candidateObjectMasks = [(1 << len(self.objectNames)) - 1] * numEpisodes
+    inferred = [False] * numEpisodes
+    inferredSteps = [None] * numEpisodes
+    ruledOut = [False] * numEpisodes
+
+    currentStep = 0
+    episodes = range(numEpisodes)
+    while True:
+      episodes = [episode for episode in episodes
+                  if currentStep < len(touches[episode])]
+      if len(episodes) == 0:
+        break
+
+      features = [
+        objectDescriptions[episode]["features"][touches[episode][currentStep]]
+        for episode in episodes]
+      currentStep += 1
+
+      movingEpisodes = []
+      displacements = []
+      for episode, feature in zip(episodes, features):
+        locationOnObject = self._chooseLocationOnFeature(feature,
+                                                         randomLocation)
+        if locationsOnObject[episode] is not None:
+          movingEpisodes.append(episode)
+          displacements.append(
+            [locationOnObject["top"] - locationsOnObject[episode]["top"],
+             locationOnObject["left"] - locationsOnObject[episode]["left"]])
+        locationsOnObject[episode] = locationOnObject
+
+      if len(movingEpisodes) > 0:
+        batch.movementCompute(displacements, movingEpisodes, self.noiseFactor,
+                              self.moduleNoiseFactor)
+      batch.sensoryCompute([self.features[feature["name"]]
+                            for feature in features], episodes)
+
+      unfinishedEpisodes = []
+      for episode in episodes:
+        objectDescription = objectDescriptions[episode]
+
+        if not inferred[episode]:
+          representation = batch.getSensoryAssociatedLocationRepresentation(
+            episode)
+          targetId = self.learnedLocationIds.get(
+            (objectDescription["name"], touches[episode][currentStep - 1]))
+          if targetId is None:
+            inferred[episode] = (len(representation) == 0)
+          else:
+            inferred[episode] = bool(
+              self._getContainingLocationMask(representation) >> targetId & 1)
+          if inferred[episode]:
+            inferredSteps[episode] = currentStep
+
+          if (not inferred[episode] and
+              tuple(representation) in self.representationSet):
+            # We have converged to an incorrect representation - declare failure.
+            print("Converged to an incorrect representation!")
+            continue
+
+          if len(representation) > 0:
+            anyCellMask = 0
+            for cell in representation:
+              anyCellMask |= self.cellObjectMasks.get(int(cell), 0)
+            candidateObjectMasks[episode] &= anyCellMask
 
+          objectId = self.objectIds.get(objectDescription["name"])
+          ruledOut[episode] = (
+            not inferred[episode] and
+            (objectId is None or
+             not candidateObjectMasks[episode] >> objectId & 1))
+
+        finished = ((inferred[episode] and numSensations is None) or
+                    (numSensations is not None and
+                     currentStep == numSensations) or
+                    (stopWhenRuledOut and ruledOut[episode]))
+        if not finished:
+          unfinishedEpisodes.append(episode)
+
+      episodes = unfinishedEpisodes
+
+    return inferredSteps
+
+
+  def _chooseLocationOnFeature(self, feature, randomLocation):
+    """
+    Choose where the sensor touches a feature: its center, or a random point.
+    """
     if randomLocation:
-      locationOnObject = {
+      return {
         "top": feature["top"] + np.random.rand()*feature["height"],
         "left": feature["left"] + np.random.rand()*feature["width"],
       }
     else:
-      locationOnObject = {
+      return {
         "top": feature["top"] + feature["height"]/2.,
         "left": feature["left"] + feature["width"]/2.
       }
 
+
+  def _move(self, feature, randomLocation = False, useNoise = True):
+    """
+    Move the sensor to the center of the specified feature. If the sensor is
+    currently at another location, send the displacement into the cortical
+    column so that it can perform path integration.
+    """
+
+    locationOnObject = self._chooseLocationOnFeature(feature, randomLocation)
+
     if self.locationOnObject is not None:
       displacement = {"top": locationOnObject["top"] -
                              self.locationOnObject["top"],
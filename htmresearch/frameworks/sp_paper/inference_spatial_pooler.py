@@ -0,0 +1,184 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+An inference-only copy of a trained spatial pooler that processes many input
+vectors at once.
+
+The SP paper metrics run every test input, and noisy versions of it, through
+the spatial pooler with learning off. Calling compute once per vector spends
+most of the time in per-call overhead. InferenceSpatialPooler copies the
+connected synapses of the spatial pooler into a sparse matrix, computes the
+overlaps of a whole batch with one sparse matrix product and selects the
+winners of global inhibition with a vectorized top-k.
+"""
+
+import numpy as np
+import scipy.sparse
+
+from nupic.bindings.math import GetNTAReal
+
+realDType = GetNTAReal()
+uintType = "uint32"
+
+
+
+class InferenceSpatialPooler(object):
+  """
+  A frozen snapshot of a spatial pooler, computing the same active columns as
+  sp.compute(inputVector, False, activeArray).
+
+  Winners are selected like the Python SpatialPooler: columns are ranked by
+  overlap, ties are won by the column with the highest index, and columns
+  below the stimulus threshold are inhibited. Only global inhibition is
+  supported, i.e. spatial poolers with globalInhibition or an inhibition
+  radius larger than the column dimensions.
+
+  The snapshot doesn't follow later changes to the spatial pooler. Create a new
+  one after training.
+  """
+
+  def __init__(self, sp):
+    """
+    @param sp (SpatialPooler)
+    A Python or C++ spatial pooler, or a subclass of either
+    """
+    self.numInputs = sp.getNumInputs()
+    self.columnDimensions = np.array(sp.getColumnDimensions(), ndmin=1)
+    self.numColumns = int(np.prod(self.columnDimensions))
+    self.stimulusThreshold = sp.getStimulusThreshold()
+
+    if not self.supports(sp):
+      raise ValueError("Only global inhibition is supported")
+    inhibitionRadius = sp.getInhibitionRadius()
+
+    # Same density as SpatialPooler._inhibitColumns.
+    localAreaDensity = sp.getLocalAreaDensity()
+    if localAreaDensity > 0:
+      density = localAreaDensity
+    else:
+      inhibitionArea = ((2 * inhibitionRadius + 1) **
+                        self.columnDimensions.size)
+      inhibitionArea = min(self.numColumns, inhibitionArea)
+      density = float(sp.getNumActiveColumnsPerInhArea()) / inhibitionArea
+      density = min(density, 0.5)
+    self.numActive = int(density * self.numColumns)
+
+    connectedSynapses = np.zeros((self.numColumns, self.numInputs),
+                                 dtype=uintType)
+    for columnIndex in xrange(self.numColumns):
+      sp.getConnectedSynapses(columnIndex, connectedSynapses[columnIndex])
+    self.connectedSynapses = scipy.sparse.csr_matrix(connectedSynapses,
+                                                     dtype=realDType)
+
+    self.boostFactors = np.zeros(self.numColumns, dtype=realDType)
+    sp.getBoostFactors(self.boostFactors)
+
+
+  @staticmethod
+  def supports(sp):
+    """
+    Return True if an InferenceSpatialPooler can be created for the given
+    spatial pooler.
+    """
+    return (sp.getGlobalInhibition() or
+            sp.getInhibitionRadius() > max(np.array(sp.getColumnDimensions(),
+                                                    ndmin=1)))
+
+
+  def computeBatch(self, inputVectors, boost=False, batchSize=1024):
+    """
+    Compute the active columns for a batch of input vectors.
+
+    @param inputVectors (2D numpy array or scipy sparse matrix)
+    One input vector per row
+
+    @param boost (bool)
+    If True, the overlaps are multiplied by the boost factors of the spatial
+    pooler, as they are when it's learning.
+
+    @param batchSize (int)
+    Number of rows processed at once, to bound memory use
+
+    @return (2D numpy array)
+    One 0/1 uint32 row of active columns per input vector
+    """
+    if not scipy.sparse.issparse(inputVectors):
+      inputVectors = np.asarray(inputVectors).reshape(len(inputVectors), -1)
+    if inputVectors.shape[1] != self.numInputs:
+      raise ValueError(
+        "Input vector dimensions don't match. Expecting %s but got %s" % (
+          self.numInputs, inputVectors.shape[1]))
+
+    numInputVector = inputVectors.shape[0]
+    activeColumns = np.zeros((numInputVector, self.numColumns),
+                             dtype=uintType)
+    for start in xrange(0, numInputVector, batchSize):
+      overlaps = self.computeOverlaps(inputVectors[start:start + batchSize])
+      if boost:
+        overlaps *= self.boostFactors
+      activeColumns[start:start + batchSize] = self._inhibitColumnsGlobal(
+        overlaps)
+
+    return activeColumns
+
+
+  def computeOverlaps(self, inputVectors):
+    """
+    Return the overlap of each column with each input vector, as a
+    len(inputVectors) x numColumns array.
+    """
+    # Both operands are sparse, so the cost follows the active bits and the
+    # connected synapses, whether the inputs are dense arrays or sparse rows.
+    inputVectors = scipy.sparse.csr_matrix(inputVectors, dtype=realDType)
+    return np.asarray(inputVectors.dot(self.connectedSynapses.T).toarray(),
+                      dtype=realDType)
+
+
+  def _inhibitColumnsGlobal(self, overlaps):
+    """
+    Select the numActive columns with the highest overlap in each row, breaking
+    ties in favor of the highest column index, like the stable sort of
+    SpatialPooler._inhibitColumnsGlobal.
+
+    @return (2D numpy array)
+    A boolean matrix of winners
+    """
+    numColumns = overlaps.shape[1]
+    if self.numActive == 0:
+      return np.zeros(overlaps.shape, dtype=bool)
+
+    # The overlap of the last winner before tie-breaking.
+    kthOverlap = np.partition(overlaps, numColumns - self.numActive,
+                              axis=1)[:, numColumns - self.numActive]
+    kthOverlap = kthOverlap[:, np.newaxis]
+
+    winners = overlaps > kthOverlap
+    numTiedWinners = self.numActive - winners.sum(axis=1)
+
+    # Among the columns tied with the kth overlap, the ones with the highest
+    # indices win.
+    tied = overlaps == kthOverlap
+    tiedRankFromRight = np.cumsum(tied[:, ::-1], axis=1)[:, ::-1]
+    winners |= tied & (tiedRankFromRight <= numTiedWinners[:, np.newaxis])
+
+    winners &= overlaps >= self.stimulusThreshold
+    return winners
@@ -0,0 +1,298 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Noise robustness of a spatial pooler, evaluated on whole batches of corrupted
+inputs.
+
+calculateOverlapCurve and classificationAccuracyVsNoise in sp_metrics corrupt
+one vector at a time with corruptSparseVector. corruptSparseVectors corrupts
+every input at every noise level at once and returns a sparse matrix, and
+NoiseRobustnessEvaluator feeds these batches to the spatial pooler and
+computes the overlap curves and the classification accuracy from sparse
+matrix products:
+
+  evaluator = NoiseRobustnessEvaluator(sp, testInputs, seed=42)
+  inputOverlapScore, outputOverlapScore, accuracy = evaluator.evaluate()
+
+The noise is the same as corruptSparseVector's: int(noiseLevel * numActive)
+active bits are turned off and as many inactive bits are turned on, chosen
+uniformly. The random draws differ, so results are statistically equivalent
+to sp_metrics but not identical. They only depend on the seed, not on the
+chunk size.
+"""
+
+import numpy as np
+import scipy.sparse
+
+from htmresearch.frameworks.sp_paper.sp_metrics import (
+  _percentOverlapFromCounts, computeSPOutputs, createInferenceSpatialPooler)
+
+
+
+def corruptSparseVectors(inputVectors, noiseLevelList, rng=None,
+                         chunkSize=1024):
+  """
+  Corrupt every input vector at every noise level, like corruptSparseVector.
+
+  @param inputVectors (2D numpy array or scipy sparse matrix)
+  Binary input vectors, one per row
+
+  @param noiseLevelList (list)
+  Noise levels, between 0 and 1
+
+  @param rng (numpy.random.RandomState)
+  Random number generator. Defaults to numpy's global one.
+
+  @param chunkSize (int)
+  Number of corrupted vectors generated at once, to bound memory use
+
+  @return (scipy.sparse.csr_matrix)
+  A (len(noiseLevelList) * numInputVector) x inputSize matrix. The row
+  i * numInputVector + j is input vector j corrupted with noise level i.
+  """
+  if rng is None:
+    rng = np.random
+
+  numInputVector, inputSize = inputVectors.shape
+  inputVectors = scipy.sparse.csr_matrix(inputVectors)
+  inputVectors.eliminate_zeros()
+  numActive = np.diff(inputVectors.indptr)
+
+  numNoiseBits = np.concatenate([
+    (noiseLevel * numActive).astype("int64") for noiseLevel in noiseLevelList])
+  numActive = np.tile(numActive, len(noiseLevelList))
+  numRows = len(numActive)
+
+  # Like corruptSparseVector, fewer bits are turned on than off when there
+  # aren't enough inactive bits.
+  numTurnedOff = np.minimum(numNoiseBits, numActive)
+  numTurnedOn = np.minimum(numNoiseBits, inputSize - numActive)
+
+  chunks = []
+  for start in xrange(0, numRows, chunkSize):
+    rows = np.arange(start, min(start + chunkSize, numRows))
+    dense = inputVectors[rows % numInputVector].toarray() > 0
+
+    # Shuffle each vector, keeping the active bits in front. The first active
+    # bits are turned off and the first inactive bits are turned on, so the
+    # corrupted vector is a contiguous range of positions. Only the first
+    # numPositions positions are needed, so the rest isn't sorted.
+    priority = rng.random_sample(dense.shape) + ~dense
+    end = numActive[rows] + numTurnedOn[rows]
+    numPositions = int(end.max())
+    if numPositions < inputSize:
+      candidates = np.argpartition(priority, numPositions, axis=1)
+      candidates = candidates[:, :numPositions]
+    else:
+      candidates = np.tile(np.arange(inputSize), (len(rows), 1))
+    rowIndices = np.arange(len(rows))[:, np.newaxis]
+    order = candidates[
+      rowIndices, np.argsort(priority[rowIndices, candidates], axis=1)]
+
+    position = np.arange(numPositions)
+    keep = ((position >= numTurnedOff[rows, np.newaxis]) &
+            (position < end[:, np.newaxis]))
+    indices = np.sort(np.where(keep, order, inputSize), axis=1)
+
+    chunk = scipy.sparse.csr_matrix(
+      (np.ones(keep.sum(), dtype="uint32"),
+       indices[indices < inputSize],
+       np.concatenate([[0], np.cumsum(keep.sum(axis=1))])),
+      shape=(len(rows), inputSize))
+    chunks.append(chunk)
+
+  if not chunks:
+    return scipy.sparse.csr_matrix((0, inputSize), dtype="uint32")
+  return scipy.sparse.vstack(chunks, format="csr")
+
+
+
+def classifySparseOutputs(targetOutputColumns, outputColumns):
+  """
+  Classify each output as the target with the highest percentOverlap, like
+  classifySPoutput. Ties go to the target with the lowest index.
+
+  @param targetOutputColumns (scipy sparse matrix) one target per row
+  @param outputColumns (scipy sparse matrix) one output per row
+  @return classLabels (array) classification outcome of each output
+  """
+  targetOutputColumns = scipy.sparse.csr_matrix(targetOutputColumns)
+  outputColumns = scipy.sparse.csr_matrix(outputColumns)
+
+  overlaps = scipy.sparse.csr_matrix(
+    outputColumns.dot(targetOutputColumns.T))
+  outputSizes = np.diff(outputColumns.indptr)
+  targetSizes = np.diff(targetOutputColumns.indptr)
+
+  # Every stored overlap is positive, so the best target of an output is
+  # among its stored entries. Outputs without any overlap get label 0, like
+  # np.argmax of a row of zeros.
+  rowSizes = np.diff(overlaps.indptr)
+  percentOverlap = (overlaps.data.astype("float64") /
+                    np.minimum(np.repeat(outputSizes, rowSizes),
+                               targetSizes[overlaps.indices]))
+
+  classLabels = np.zeros(outputColumns.shape[0], dtype="int64")
+  hasOverlap = rowSizes > 0
+  if not hasOverlap.any():
+    return classLabels
+
+  # The stored entries of a row aren't sorted by target, so take the lowest
+  # target among the maxima of each row.
+  rowStarts = overlaps.indptr[:-1][hasOverlap]
+  rowMax = np.maximum.reduceat(percentOverlap, rowStarts)
+  isMax = percentOverlap == np.repeat(rowMax, rowSizes[hasOverlap])
+  classLabels[hasOverlap] = np.minimum.reduceat(
+    np.where(isMax, overlaps.indices, targetOutputColumns.shape[0]),
+    rowStarts)
+  return classLabels
+
+
+
+class NoiseRobustnessEvaluator(object):
+  """
+  Computes the noise robustness metrics of a spatial pooler on a set of
+  inputs: the overlap between each input and its corrupted versions, the
+  overlap between their SP outputs, and the accuracy of classifying the
+  outputs of corrupted inputs by their nearest uncorrupted output.
+  """
+
+  def __init__(self, sp, inputVectors, noiseLevelList=None, seed=42,
+               chunkSize=1024):
+    """
+    @param sp (SpatialPooler)
+    The spatial pooler to evaluate. If None, the inputs are evaluated directly,
+    like classificationAccuracyVsNoise with sp=None.
+
+    @param inputVectors (2D numpy array or scipy sparse matrix)
+    The uncorrupted inputs, one per row
+
+    @param noiseLevelList (list)
+    Noise levels, between 0 and 1. Defaults to np.linspace(0, 1.0, 21) as in
+    calculateOverlapCurve.
+
+    @param seed (int)
+    Seed of the corrupted input generation
+
+    @param chunkSize (int)
+    Number of inputs sent to the spatial pooler at once, to bound memory use
+    """
+    if noiseLevelList is None:
+      noiseLevelList = np.linspace(0, 1.0, 21)
+
+    self.sp = sp
+    self.inputVectors = scipy.sparse.csr_matrix(inputVectors, dtype="uint32")
+    self.noiseLevelList = np.asarray(noiseLevelList)
+    self.seed = seed
+    self.chunkSize = chunkSize
+
+    if sp is None:
+      self._inferenceSP = None
+    else:
+      self._inferenceSP = createInferenceSpatialPooler(sp)
+
+    self.targetOutputColumns = self._computeOutputs(self.inputVectors)
+
+
+  def evaluate(self, classify=True):
+    """
+    Corrupt every input at every noise level and compute the metrics.
+
+    @param classify (bool)
+    Whether to compute the classification accuracy. Classification compares
+    every output with every target, so it dominates the run time for large
+    datasets.
+
+    @return inputOverlapScore (2D numpy array)
+    percentOverlap of each input with its corrupted versions, with one row per
+    input and one column per noise level, as returned by calculateOverlapCurve
+
+    @return outputOverlapScore (2D numpy array)
+    percentOverlap of the SP outputs of each input and its corrupted versions
+
+    @return classificationAccuracy (numpy array)
+    For each noise level, the fraction of corrupted inputs whose output is
+    closest to the output of the uncorrupted input, or None if classify is
+    False
+    """
+    numInputVector = self.inputVectors.shape[0]
+    numNoiseLevels = len(self.noiseLevelList)
+
+    inputOverlapScore = np.zeros((numInputVector, numNoiseLevels))
+    outputOverlapScore = np.zeros((numInputVector, numNoiseLevels))
+    classificationAccuracy = np.zeros(numNoiseLevels) if classify else None
+
+    # The noise levels are corrupted in order with one generator, so the
+    # inputs are the rows of corruptSparseVectors(inputVectors,
+    # noiseLevelList, RandomState(seed)).
+    rng = np.random.RandomState(self.seed)
+    for i, noiseLevel in enumerate(self.noiseLevelList):
+      corruptedInputs = corruptSparseVectors(self.inputVectors, [noiseLevel],
+                                             rng, self.chunkSize)
+      outputColumns = self._computeOutputs(corruptedInputs)
+
+      inputOverlapScore[:, i] = _rowPercentOverlaps(self.inputVectors,
+                                                    corruptedInputs)
+      outputOverlapScore[:, i] = _rowPercentOverlaps(self.targetOutputColumns,
+                                                     outputColumns)
+
+      if not classify:
+        continue
+
+      numCorrect = 0
+      for start in xrange(0, numInputVector, self.chunkSize):
+        end = min(start + self.chunkSize, numInputVector)
+        classLabels = classifySparseOutputs(self.targetOutputColumns,
+                                            outputColumns[start:end])
+        numCorrect += np.sum(classLabels == np.arange(start, end))
+      classificationAccuracy[i] = float(numCorrect) / numInputVector
+
+    return inputOverlapScore, outputOverlapScore, classificationAccuracy
+
+
+  def _computeOutputs(self, inputVectors):
+    """
+    Compute the SP outputs of sparse inputs, chunk by chunk.
+
+    @return (scipy.sparse.csr_matrix) one output per row
+    """
+    if self.sp is None:
+      return scipy.sparse.csr_matrix(inputVectors, dtype="uint32")
+
+    chunks = []
+    for start in xrange(0, inputVectors.shape[0], self.chunkSize):
+      chunk = inputVectors[start:start + self.chunkSize]
+      if self._inferenceSP is None:
+        chunk = chunk.toarray()
+      chunks.append(scipy.sparse.csr_matrix(
+        computeSPOutputs(self.sp, chunk, self._inferenceSP)))
+    return scipy.sparse.vstack(chunks, format="csr")
+
+
+
+def _rowPercentOverlaps(x1, x2):
+  """
+  percentOverlap of the corresponding rows of two sparse matrices.
+  """
+  return _percentOverlapFromCounts(
+    np.asarray(x1.multiply(x2).sum(axis=1)).ravel(),
+    np.diff(x1.indptr), np.diff(x2.indptr))
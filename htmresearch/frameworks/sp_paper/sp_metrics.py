@@ -393,6 +393,11 @@ class SDRDataSet(object):
 
 from nupic.math.topology import coordinatesFromIndex
 
+from htmresearch.frameworks.sp_paper.inference_spatial_pooler import (
+  InferenceSpatialPooler)
+from htmresearch.support.spatial_pooler_monitor_mixin import (
+  SpatialPoolerMonitorMixin)
+
 realDType = GetNTAReal()
 uintType = "uint32"
 
@@ -477,6 +482,82 @@ def corruptSparseVector(sdr, noiseLevel):
 
 
 
+def createInferenceSpatialPooler(sp):
+  """
+  Create an InferenceSpatialPooler snapshot of a spatial pooler, or return None
+  if the spatial pooler must compute one vector at a time. Monitored spatial
+  poolers trace every compute call, so they are never batched.
+
+  @param sp a spatial pooler instance
+  @return inferenceSP (InferenceSpatialPooler) or None
+  """
+  if (InferenceSpatialPooler.supports(sp) and
+      not isinstance(sp, SpatialPoolerMonitorMixin)):
+    return InferenceSpatialPooler(sp)
+  return None
+
+
+
+def computeSPOutputs(sp, inputVectors, inferenceSP=None):
+  """
+  Compute the SP outputs of a batch of input vectors without learning, like
+  calling sp.compute(inputVector, False, outputColumns) for each of them.
+
+  Spatial poolers with global inhibition are evaluated by an
+  InferenceSpatialPooler, see createInferenceSpatialPooler.
+
+  @param sp a spatial pooler instance
+  @param inputVectors (2D numpy array) one input vector per row. Scipy sparse
+                      matrices are only supported with an inferenceSP.
+  @param inferenceSP (InferenceSpatialPooler) a snapshot of sp, to reuse it
+                     across calls while sp doesn't learn
+  @return outputColumns (2D numpy array) one SP output per row
+  """
+  numInputVector = inputVectors.shape[0]
+
+  if inferenceSP is None:
+    inferenceSP = createInferenceSpatialPooler(sp)
+
+  if inferenceSP is not None:
+    outputColumns = inferenceSP.computeBatch(inputVectors)
+    # Each compute call counts as an iteration, even without learning.
+    sp.setIterationNum(sp.getIterationNum() + numInputVector)
+    return outputColumns
+
+  columnNumber = np.prod(sp.getColumnDimensions())
+  outputColumns = np.zeros((numInputVector, columnNumber), dtype=uintType)
+  for i in range(numInputVector):
+    sp.compute(inputVectors[i][:], False, outputColumns[i][:])
+  return outputColumns
+
+
+
+def percentOverlaps(x1, x2):
+  """
+  Computes percentOverlap between the vectors in the last dimension of x1 and
+  x2, broadcasting the other dimensions.
+
+  @param x1   (array) binary vectors
+  @param x2   (array) binary vectors
+
+  @return percentOverlaps (array) percentage overlap of each pair of vectors
+  """
+  return _percentOverlapFromCounts(
+    np.sum(x1.astype("float64") * x2, axis=-1),
+    np.count_nonzero(x1, axis=-1), np.count_nonzero(x2, axis=-1))
+
+
+
+def _percentOverlapFromCounts(overlap, nonZeroX1, nonZeroX2):
+  minX1X2 = np.minimum(nonZeroX1, nonZeroX2)
+  percentOverlap = np.zeros(np.broadcast(overlap, minX1X2).shape)
+  hasBits = minX1X2 > 0
+  percentOverlap[hasBits] = (np.broadcast_to(overlap, hasBits.shape)[hasBits] /
+                             minX1X2[hasBits])
+  return percentOverlap
+
+
+
 def calculateOverlapCurve(sp, inputVectors):
   """
   Evalulate noise robustness of SP for a given set of SDRs
@@ -484,29 +565,28 @@ def calculateOverlapCurve(sp, inputVectors):
   @param inputVectors list of arrays.
   :return:
   """
-  columnNumber = np.prod(sp.getColumnDimensions())
   numInputVector, inputSize = inputVectors.shape
 
-  outputColumns = np.zeros((numInputVector, columnNumber), dtype=uintType)
-  outputColumnsCorrupted = np.zeros((numInputVector, columnNumber),
-                                    dtype=uintType)
-
   noiseLevelList = np.linspace(0, 1.0, 21)
-  inputOverlapScore = np.zeros((numInputVector, len(noiseLevelList)))
-  outputOverlapScore = np.zeros((numInputVector, len(noiseLevelList)))
+  numNoiseLevels = len(noiseLevelList)
+
+  # Corrupt the vectors in the same order as a loop over vectors and noise
+  # levels, so the same random numbers are used.
+  inputVectorsCorrupted = np.repeat(inputVectors, numNoiseLevels, axis=0)
   for i in range(numInputVector):
-    for j in range(len(noiseLevelList)):
-      inputVectorCorrupted = copy.deepcopy(inputVectors[i][:])
-      corruptSparseVector(inputVectorCorrupted, noiseLevelList[j])
+    for j in range(numNoiseLevels):
+      corruptSparseVector(inputVectorsCorrupted[i * numNoiseLevels + j],
+                          noiseLevelList[j])
 
-      sp.compute(inputVectors[i][:], False, outputColumns[i][:])
-      sp.compute(inputVectorCorrupted, False,
-                 outputColumnsCorrupted[i][:])
+  outputColumns = computeSPOutputs(sp, inputVectors)
+  outputColumnsCorrupted = computeSPOutputs(sp, inputVectorsCorrupted)
 
-      inputOverlapScore[i][j] = percentOverlap(inputVectors[i][:],
-                                               inputVectorCorrupted)
-      outputOverlapScore[i][j] = percentOverlap(outputColumns[i][:],
-                                                outputColumnsCorrupted[i][:])
+  inputOverlapScore = percentOverlaps(
+    inputVectors[:, np.newaxis],
+    inputVectorsCorrupted.reshape(numInputVector, numNoiseLevels, -1))
+  outputOverlapScore = percentOverlaps(
+    outputColumns[:, np.newaxis],
+    outputColumnsCorrupted.reshape(numInputVector, numNoiseLevels, -1))
 
   return noiseLevelList, inputOverlapScore, outputOverlapScore
 
@@ -520,12 +600,23 @@ def classifySPoutput(targetOutputColumns, outputColumns):
   @param outputColumns (array) The current output
   @return classLabel (int) classification outcome
   """
-  numTargets, numDims = targetOutputColumns.shape
-  overlap = np.zeros((numTargets,))
-  for i in range(numTargets):
-    overlap[i] = percentOverlap(outputColumns, targetOutputColumns[i, :])
-  classLabel = np.argmax(overlap)
-  return classLabel
+  return classifySPoutputs(targetOutputColumns, outputColumns[np.newaxis])[0]
+
+
+
+def classifySPoutputs(targetOutputColumns, outputColumns):
+  """
+  Classify a batch of SP outputs, like classifySPoutput
+  @param targetOutputColumns (2D array) The target outputs, corresponding to
+                                        different classes
+  @param outputColumns (2D array) One output per row
+  @return classLabels (array) classification outcome of each output
+  """
+  overlap = _percentOverlapFromCounts(
+    outputColumns.astype("float64").dot(targetOutputColumns.T),
+    np.count_nonzero(outputColumns, axis=1)[:, np.newaxis],
+    np.count_nonzero(targetOutputColumns, axis=1)[np.newaxis, :])
+  return np.argmax(overlap, axis=1)
 
 
 
@@ -542,32 +633,29 @@ def classificationAccuracyVsNoise(sp, inputVectors, noiseLevelList):
   if sp is None:
     targetOutputColumns = copy.deepcopy(inputVectors)
   else:
-    columnNumber = np.prod(sp.getColumnDimensions())
     # calculate target output given the uncorrupted input vectors
-    targetOutputColumns = np.zeros((numInputVector, columnNumber),
-                                   dtype=uintType)
-    for i in range(numInputVector):
-      sp.compute(inputVectors[i][:], False, targetOutputColumns[i][:])
+    targetOutputColumns = computeSPOutputs(sp, inputVectors)
 
   outcomes = np.zeros((len(noiseLevelList), numInputVector))
   for i in range(len(noiseLevelList)):
+    corruptedInputVectors = copy.deepcopy(inputVectors)
     for j in range(numInputVector):
-      corruptedInputVector = copy.deepcopy(inputVectors[j][:])
-      corruptSparseVector(corruptedInputVector, noiseLevelList[i])
+      corruptSparseVector(corruptedInputVectors[j], noiseLevelList[i])
 
-      if sp is None:
-        outputColumns = copy.deepcopy(corruptedInputVector)
-      else:
-        outputColumns = np.zeros((columnNumber, ), dtype=uintType)
-        sp.compute(corruptedInputVector, False, outputColumns)
+    if sp is None:
+      outputColumns = corruptedInputVectors
+    else:
+      outputColumns = computeSPOutputs(sp, corruptedInputVectors)
 
-      predictedClassLabel = classifySPoutput(targetOutputColumns, outputColumns)
-      outcomes[i][j] = predictedClassLabel == j
+    predictedClassLabels = classifySPoutputs(targetOutputColumns,
+                                             outputColumns)
+    outcomes[i] = predictedClassLabels == np.arange(numInputVector)
 
   predictionAccuracy = np.mean(outcomes, 1)
   return predictionAccuracy
 
 
+
 def plotExampleInputOutput(sp, inputVectors, saveFigPrefix=None):
   """
   Plot example input & output
@@ -895,47 +983,89 @@ def mutualInformation(sp, activeColumnsCurrentEpoch, column_1, column_2):
   \]
   (https://en.wikipedia.org/wiki/Mutual_information)
   """
-  i, j        = column_1, column_2
-  batchSize   = activeColumnsCurrentEpoch.shape[0]
+  activity_1 = np.asarray(activeColumnsCurrentEpoch[:, column_1], dtype="float64")
+  activity_2 = np.asarray(activeColumnsCurrentEpoch[:, column_2], dtype="float64")
+  return float(_mutualInformationFromCounts(
+    activity_1.sum(), activity_2.sum(), np.dot(activity_1, activity_2),
+    activeColumnsCurrentEpoch.shape[0]))
+
 
-  # Activity Counts
-  ci, cj, cij = 0., 0., dict([((0,0),0.), ((1,0),0.), ((0,1),0.), ((1,1),0.)])
-  for t in range(batchSize):
-    ai = activeColumnsCurrentEpoch[t, i]
-    aj = activeColumnsCurrentEpoch[t, j]
-    cij[(ai, aj)] += 1.
-    ci += ai
-    cj += aj
 
-  # Mutual information calculation 
+def _mutualInformationFromCounts(ci, cj, cij, batchSize):
+  """
+  Computes the mutual information of pairs of binary variables from the number
+  of times each variable is 1 (ci, cj) and both are 1 (cij) over batchSize
+  samples. The counts can be numpy arrays that broadcast together.
+  """
   Iij = 0
-  for a,b in [(0,0), (1,0), (0,1), (1,1)]:
-    # Compute probabilities
-    pij = cij[(a,b)]/batchSize
-    pi  = ci/batchSize if a == 1 else 1. - ci/batchSize
-    pj  = cj/batchSize if b == 1 else 1. - cj/batchSize
-    # Add current term of mutual information 
-    Iij += pij * np.log2(pij/(pi*pj)) if pij > 0 else 0
+  # Joint counts and marginal counts of (1,1), (1,0), (0,1) and (0,0)
+  for count, marginal_1, marginal_2 in (
+      (cij, ci, cj),
+      (ci - cij, ci, batchSize - cj),
+      (cj - cij, batchSize - ci, cj),
+      (batchSize - ci - cj + cij, batchSize - ci, batchSize - cj)):
+    # p(x,y) / ( p(x) p(y) ) = count * batchSize / (marginal_1 * marginal_2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+      term = (count / batchSize) * np.log2(
+        count * batchSize / (marginal_1 * marginal_2))
+    Iij = Iij + np.where(count > 0, term, 0)
 
   return Iij
 
 
 
-def meanMutualInformation(sp, activeColumnsCurrentEpoch, columnsUnderInvestigation = []):
+def mutualInformationMatrix(activeColumnsCurrentEpoch, columns=None,
+                            dtype="float64"):
+  """
+  Computes the mutual information of every pair of columns with one matrix
+  product, see mutualInformation.
+
+  @param activeColumnsCurrentEpoch (array) batchSize x numColumns activity
+  @param columns (list) columns to use, defaults to all of them
+  @param dtype (string) floating point type of the computation. "float32"
+         counts are exact for up to 2**24 samples.
+  @return (array) numColumns x numColumns mutual information matrix. The
+          diagonal contains the entropy of each column.
+  """
+  activity = np.asarray(activeColumnsCurrentEpoch, dtype=dtype)
+  if columns is not None:
+    activity = activity[:, columns]
+  counts = activity.sum(axis=0)
+  return _mutualInformationFromCounts(
+    counts[:, np.newaxis], counts[np.newaxis, :], np.dot(activity.T, activity),
+    activity.shape[0])
+
+
+
+def meanMutualInformation(sp, activeColumnsCurrentEpoch, columnsUnderInvestigation = [],
+                          chunkSize=1024, dtype="float64"):
   """
   Computes the mean of the mutual information 
   of pairs taken from a list of columns. 
+
+  The mutual information is computed for chunkSize columns at a time against
+  every other column, so memory stays bounded for large numbers of columns.
   """
   if len(columnsUnderInvestigation) == 0:
     columns = range(np.prod(sp.getColumnDimensions()))
   else:
     columns = columnsUnderInvestigation
   numCols = len(columns)
-  sumMutualInfo = 0
   normalizingConst = numCols*(numCols - 1)/2
-  for i in range(numCols):
-    for j in range(i+1, numCols):
-      sumMutualInfo += mutualInformation(sp, activeColumnsCurrentEpoch, columns[i], columns[j])
+
+  activity = np.asarray(activeColumnsCurrentEpoch, dtype=dtype)[:, columns]
+  batchSize = activity.shape[0]
+  counts = activity.sum(axis=0)
+  sumMutualInfo = 0
+  for start in xrange(0, numCols, chunkSize):
+    end = min(start + chunkSize, numCols)
+    # Only the pairs (i, j) with j > i
+    chunkMutualInfo = _mutualInformationFromCounts(
+      counts[start:end, np.newaxis], counts[np.newaxis, start + 1:],
+      np.dot(activity[:, start:end].T, activity[:, start + 1:]), batchSize)
+    upper = (np.arange(start + 1, numCols)[np.newaxis, :] >
+             np.arange(start, end)[:, np.newaxis])
+    sumMutualInfo += chunkMutualInfo[upper].sum(dtype="float64")
 
   return sumMutualInfo/normalizingConst
 
@@ -26,6 +26,10 @@ Region for Temporal Memory with various apical implementations.
 import numpy as np
 
 from nupic.bindings.regions.PyRegion import PyRegion
+from htmresearch.support.sparse_links import (clearSparseOutput,
+                                              getSparseInput,
+                                              getSparseOutputWidth,
+                                              setSparseOutput)
 
 
 
@@ -183,6 +187,16 @@ class ApicalTMPairRegion(PyRegion):
           "count": 1,
           "defaultValue": "true"
         },
+        "sparseLinks": {
+          "description": ("True if the inputs and outputs are sparse link "
+                          "buffers (the number of active bits followed by "
+                          "their sorted indices) instead of dense 0/1 "
+                          "arrays."),
+          "accessMode": "Read",
+          "dataType": "Bool",
+          "count": 1,
+          "defaultValue": "false"
+        },
         "cellsPerColumn": {
           "description": "Number of cells per column",
           "accessMode": "Read",
@@ -337,6 +351,7 @@ class ApicalTMPairRegion(PyRegion):
                # Region params
                implementation="ApicalTiebreak",
                learn=True,
+               sparseLinks=False,
                **kwargs):
 
     # Input sizes (the network API doesn't provide these during initialize)
@@ -364,6 +379,7 @@ class ApicalTMPairRegion(PyRegion):
     # Region params
     self.implementation = implementation
     self.learn = learn
+    self.sparseLinks = sparseLinks
 
     PyRegion.__init__(self, **kwargs)
 
@@ -431,36 +447,53 @@ class ApicalTMPairRegion(PyRegion):
       if inputs["resetIn"][0] != 0:
         # send empty output
         self._tm.reset()
-        outputs["activeCells"][:] = 0
-        outputs["predictedActiveCells"][:] = 0
-        outputs["winnerCells"][:] = 0
+        for name in ("activeCells", "predictedActiveCells", "winnerCells"):
+          if self.sparseLinks:
+            clearSparseOutput(outputs[name])
+          else:
+            outputs[name][:] = 0
         return
 
-    activeColumns = inputs["activeColumns"].nonzero()[0]
+    if self.sparseLinks:
+      getIndices = getSparseInput
+    else:
+      getIndices = lambda inputArray: inputArray.nonzero()[0]
+
+    activeColumns = getIndices(inputs["activeColumns"])
 
     if "basalInput" in inputs:
-      basalInput = inputs["basalInput"].nonzero()[0]
+      basalInput = getIndices(inputs["basalInput"])
     else:
       basalInput = np.empty(0, dtype="uint32")
 
     if "apicalInput" in inputs:
-      apicalInput = inputs["apicalInput"].nonzero()[0]
+      apicalInput = getIndices(inputs["apicalInput"])
     else:
       apicalInput = np.empty(0, dtype="uint32")
 
     if "basalGrowthCandidates" in inputs:
-      basalGrowthCandidates = inputs["basalGrowthCandidates"].nonzero()[0]
+      basalGrowthCandidates = getIndices(inputs["basalGrowthCandidates"])
     else:
       basalGrowthCandidates = basalInput
 
     if "apicalGrowthCandidates" in inputs:
-      apicalGrowthCandidates = inputs["apicalGrowthCandidates"].nonzero()[0]
+      apicalGrowthCandidates = getIndices(inputs["apicalGrowthCandidates"])
     else:
       apicalGrowthCandidates = apicalInput
 
     self._tm.compute(activeColumns, basalInput, apicalInput,
                      basalGrowthCandidates, apicalGrowthCandidates, self.learn)
 
+    if self.sparseLinks:
+      activeCells = self._tm.getActiveCells()
+      predictedCells = self._tm.getPredictedCells()
+      setSparseOutput(outputs["activeCells"], activeCells)
+      setSparseOutput(outputs["predictedCells"], predictedCells)
+      setSparseOutput(outputs["predictedActiveCells"],
+                      np.intersect1d(activeCells, predictedCells))
+      setSparseOutput(outputs["winnerCells"], self._tm.getWinnerCells())
+      return
+
     # Extract the active / predicted cells and put them into binary arrays.
     outputs["activeCells"][:] = 0
     outputs["activeCells"][self._tm.getActiveCells()] = 1
@@ -507,6 +540,8 @@ class ApicalTMPairRegion(PyRegion):
     """
     if name in ["activeCells", "predictedCells", "predictedActiveCells",
                 "winnerCells"]:
+      if self.sparseLinks:
+        return getSparseOutputWidth(self.cellsPerColumn * self.columnCount)
       return self.cellsPerColumn * self.columnCount
     else:
       raise Exception("Invalid output name specified: %s" % name)
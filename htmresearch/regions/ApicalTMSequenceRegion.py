@@ -26,6 +26,10 @@ Region for Temporal Memory with various apical implementations.
 import numpy as np
 
 from nupic.bindings.regions.PyRegion import PyRegion
+from htmresearch.support.sparse_links import (clearSparseOutput,
+                                              getSparseInput,
+                                              getSparseOutputWidth,
+                                              setSparseOutput)
 
 
 
@@ -153,6 +157,16 @@ class ApicalTMSequenceRegion(PyRegion):
           "count": 1,
           "defaultValue": "true"
         },
+        "sparseLinks": {
+          "description": ("True if the inputs and outputs are sparse link "
+                          "buffers (the number of active bits followed by "
+                          "their sorted indices) instead of dense 0/1 "
+                          "arrays."),
+          "accessMode": "Read",
+          "dataType": "Bool",
+          "count": 1,
+          "defaultValue": "false"
+        },
         "cellsPerColumn": {
           "description": "Number of cells per column",
           "accessMode": "Read",
@@ -305,6 +319,7 @@ class ApicalTMSequenceRegion(PyRegion):
                # Region params
                implementation="ApicalTiebreakCPP",
                learn=True,
+               sparseLinks=False,
                **kwargs):
 
     # Input sizes (the network API doesn't provide these during initialize)
@@ -331,6 +346,7 @@ class ApicalTMSequenceRegion(PyRegion):
     # Region params
     self.implementation = implementation
     self.learn = learn
+    self.sparseLinks = sparseLinks
 
     PyRegion.__init__(self, **kwargs)
 
@@ -397,27 +413,43 @@ class ApicalTMSequenceRegion(PyRegion):
       if inputs["resetIn"][0] != 0:
         # send empty output
         self._tm.reset()
-        outputs["activeCells"][:] = 0
-        outputs["nextPredictedCells"][:] = 0
-        outputs["predictedActiveCells"][:] = 0
-        outputs["winnerCells"][:] = 0
+        for name in ("activeCells", "nextPredictedCells",
+                     "predictedActiveCells", "winnerCells"):
+          if self.sparseLinks:
+            clearSparseOutput(outputs[name])
+          else:
+            outputs[name][:] = 0
         return
 
-    activeColumns = inputs["activeColumns"].nonzero()[0]
+    if self.sparseLinks:
+      getIndices = getSparseInput
+    else:
+      getIndices = lambda inputArray: inputArray.nonzero()[0]
+
+    activeColumns = getIndices(inputs["activeColumns"])
 
     if "apicalInput" in inputs:
-      apicalInput = inputs["apicalInput"].nonzero()[0]
+      apicalInput = getIndices(inputs["apicalInput"])
     else:
       apicalInput = np.empty(0, dtype="uint32")
 
     if "apicalGrowthCandidates" in inputs:
-      apicalGrowthCandidates = inputs["apicalGrowthCandidates"].nonzero()[0]
+      apicalGrowthCandidates = getIndices(inputs["apicalGrowthCandidates"])
     else:
       apicalGrowthCandidates = apicalInput
 
     self._tm.compute(activeColumns, apicalInput, apicalGrowthCandidates,
                      self.learn)
 
+    if self.sparseLinks:
+      setSparseOutput(outputs["activeCells"], self._tm.getActiveCells())
+      setSparseOutput(outputs["nextPredictedCells"],
+                      self._tm.getNextPredictedCells())
+      setSparseOutput(outputs["predictedActiveCells"],
+                      self._tm.getPredictedActiveCells())
+      setSparseOutput(outputs["winnerCells"], self._tm.getWinnerCells())
+      return
+
     # Extract the active / predicted cells and put them into binary arrays.
     outputs["activeCells"][:] = 0
     outputs["activeCells"][self._tm.getActiveCells()] = 1
@@ -465,6 +497,8 @@ class ApicalTMSequenceRegion(PyRegion):
     """
     if name in ["activeCells", "nextPredictedCells", "predictedActiveCells",
                 "winnerCells"]:
+      if self.sparseLinks:
+        return getSparseOutputWidth(self.cellsPerColumn * self.columnCount)
       return self.cellsPerColumn * self.columnCount
     else:
       raise Exception("Invalid output name specified: %s" % name)
@@ -25,6 +25,11 @@ import inspect
 
 from nupic.bindings.regions.PyRegion import PyRegion
 from htmresearch.algorithms.column_pooler import ColumnPooler
+from htmresearch.support.sparse_links import (clearSparseOutput,
+                                              getSparseInput,
+                                              getSparseInputs,
+                                              getSparseOutputWidth,
+                                              setSparseOutput)
 
 
 def getConstructorArguments():
@@ -311,6 +316,14 @@ class ColumnPoolerRegion(PyRegion):
           count=0,
           constraints="enum: active,predicted,predictedActiveCells",
           defaultValue="active"),
+        sparseLinks=dict(
+          description="If true, inputs and outputs are sparse link buffers "
+                      "(the number of active bits followed by their sorted "
+                      "indices) instead of dense 0/1 arrays.",
+          accessMode="Read",
+          dataType="Bool",
+          count=1,
+          defaultValue="false"),
       ),
       commands=dict(
         reset=dict(description="Explicitly reset TM states now."),
@@ -349,6 +362,7 @@ class ColumnPoolerRegion(PyRegion):
 
                seed=42,
                defaultOutputType = "active",
+               sparseLinks=False,
                **kwargs):
 
     # Used to derive Column Pooler params
@@ -380,6 +394,7 @@ class ColumnPoolerRegion(PyRegion):
     # Region params
     self.learningMode = True
     self.defaultOutputType = defaultOutputType
+    self.sparseLinks = sparseLinks
 
     self._pooler = None
 
@@ -433,31 +448,41 @@ class ColumnPoolerRegion(PyRegion):
       if inputs["resetIn"][0] != 0:
         # send empty output
         self.reset()
-        outputs["feedForwardOutput"][:] = 0
-        outputs["activeCells"][:] = 0
+        for name in ("feedForwardOutput", "activeCells"):
+          if self.sparseLinks:
+            clearSparseOutput(outputs[name])
+          else:
+            outputs[name][:] = 0
         return
 
-    feedforwardInput = numpy.asarray(inputs["feedforwardInput"].nonzero()[0],
-                                     dtype="uint32")
+    if self.sparseLinks:
+      getIndices = getSparseInput
+    else:
+      getIndices = lambda inputArray: numpy.asarray(inputArray.nonzero()[0],
+                                                    dtype="uint32")
+
+    feedforwardInput = getIndices(inputs["feedforwardInput"])
 
     if "feedforwardGrowthCandidates" in inputs:
-      feedforwardGrowthCandidates = numpy.asarray(
-        inputs["feedforwardGrowthCandidates"].nonzero()[0], dtype="uint32")
+      feedforwardGrowthCandidates = getIndices(
+        inputs["feedforwardGrowthCandidates"])
     else:
       feedforwardGrowthCandidates = feedforwardInput
 
     if "lateralInput" in inputs:
-      lateralInputs = tuple(numpy.asarray(singleInput.nonzero()[0],
-                                          dtype="uint32")
-                            for singleInput
-                            in numpy.split(inputs["lateralInput"],
-                                           self.numOtherCorticalColumns))
+      if self.sparseLinks:
+        lateralInputs = getSparseInputs(inputs["lateralInput"],
+                                        self.numOtherCorticalColumns)
+      else:
+        lateralInputs = tuple(getIndices(singleInput)
+                              for singleInput
+                              in numpy.split(inputs["lateralInput"],
+                                             self.numOtherCorticalColumns))
     else:
       lateralInputs = ()
 
     if "predictedInput" in inputs:
-      predictedInput = numpy.asarray(
-        inputs["predictedInput"].nonzero()[0], dtype="uint32")
+      predictedInput = getIndices(inputs["predictedInput"])
     else:
       predictedInput = None
 
@@ -466,6 +491,18 @@ class ColumnPoolerRegion(PyRegion):
                          feedforwardGrowthCandidates, learn=self.learningMode,
                          predictedInput = predictedInput)
 
+    if self.sparseLinks:
+      activeCells = self._pooler.getActiveCells()
+      setSparseOutput(outputs["activeCells"], activeCells)
+
+      # Only the count and the indices need to be copied.
+      if self.defaultOutputType == "active":
+        outputs["feedForwardOutput"][:len(activeCells) + 1] = (
+          outputs["activeCells"][:len(activeCells) + 1])
+      else:
+        raise Exception("Unknown outputType: " + self.defaultOutputType)
+      return
+
     # Extract the active / predicted cells and put them into binary arrays.
     outputs["activeCells"][:] = 0
     outputs["activeCells"][self._pooler.getActiveCells()] = 1
@@ -507,6 +544,8 @@ class ColumnPoolerRegion(PyRegion):
     Return the number of elements for the given output.
     """
     if name in ["feedForwardOutput", "activeCells"]:
+      if self.sparseLinks:
+        return getSparseOutputWidth(self.cellCount)
       return self.cellCount
     else:
       raise Exception("Invalid output name specified: " + name)
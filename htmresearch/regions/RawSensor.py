@@ -20,7 +20,12 @@
 # ----------------------------------------------------------------------
 
 from collections import deque
+
+import numpy as np
+
 from nupic.bindings.regions.PyRegion import PyRegion
+from htmresearch.support.sparse_links import (getSparseOutputWidth,
+                                              setSparseOutput)
 
 
 class RawSensor(PyRegion):
@@ -33,14 +38,19 @@ class RawSensor(PyRegion):
 
   Each data record consists of the non-zero indices of the sparse vector,
   a 0/1 reset flag, and an integer sequence ID.
+
+  If sparseLinks is True, dataOut is a sparse link buffer (see
+  htmresearch.support.sparse_links) rather than a dense 0/1 array.
   """
 
   def __init__(self,
                outputWidth=2048,
+               sparseLinks=False,
                verbosity=0):
     """Create an instance with the appropriate output size."""
     self.verbosity = verbosity
     self.outputWidth = outputWidth
+    self.sparseLinks = sparseLinks
     self.queue = deque()
 
 
@@ -90,6 +100,16 @@ class RawSensor(PyRegion):
           "defaultValue": 2048,
           "constraints":"",
         },
+        "sparseLinks":{
+          "description":"If true, dataOut holds the number of active bits "
+                        "followed by their sorted indices instead of a dense "
+                        "0/1 array.",
+          "dataType":"Bool",
+          "accessMode":"Read",
+          "count":1,
+          "defaultValue":"false",
+          "constraints":"",
+        },
       },
       "commands":{
         "addDataToQueue": {
@@ -116,14 +136,17 @@ class RawSensor(PyRegion):
     # Copy data into output vectors
     outputs["resetOut"][0] = data["reset"]
     outputs["sequenceIdOut"][0] = data["sequenceId"]
-    outputs["dataOut"][:] = 0
-    outputs["dataOut"][data["nonZeros"]] = 1
+    if self.sparseLinks:
+      setSparseOutput(outputs["dataOut"], data["nonZeros"])
+    else:
+      outputs["dataOut"][:] = 0
+      outputs["dataOut"][data["nonZeros"]] = 1
 
     if self.verbosity > 1:
       print "RawSensor outputs:"
       print "sequenceIdOut: ", outputs["sequenceIdOut"]
       print "resetOut: ", outputs["resetOut"]
-      print "dataOut: ", outputs["dataOut"].nonzero()[0]
+      print "dataOut: ", data["nonZeros"]
 
 
   def addDataToQueue(self, nonZeros, reset, sequenceId):
@@ -132,9 +155,10 @@ class RawSensor(PyRegion):
     will cause items in the queue to be dequeued in FIFO order.
 
     @param nonZeros   A list of the non-zero elements corresponding
-                      to the sparse output. This list can be specified in two
-                      ways, as a python list of integers or as a string which
-                      can evaluate to a python list of integers.
+                      to the sparse output. This list can be specified in three
+                      ways, as a python list of integers, as a numpy array of
+                      indices or as a string which can evaluate to a python
+                      list of integers.
     @param reset      An int or string that is 0 or 1. resetOut will be set to
                       this value when this item is computed.
     @param sequenceId An int or string with an integer ID associated with this
@@ -142,7 +166,7 @@ class RawSensor(PyRegion):
     """
     if type(nonZeros) == type(""):
       nonZeroList = eval(nonZeros)
-    elif type(nonZeros) == type([]):
+    elif type(nonZeros) == type([]) or isinstance(nonZeros, np.ndarray):
       nonZeroList = nonZeros
     else:
       raise Exception("RawSensor.addDataToQueue: unknown type for nonZeros")
@@ -177,6 +201,8 @@ class RawSensor(PyRegion):
       return 1
 
     elif name == "dataOut":
+      if self.sparseLinks:
+        return getSparseOutputWidth(self.outputWidth)
       return self.outputWidth
 
     else:
@@ -0,0 +1,64 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""
+Pickling support for SparseMatrixConnections.
+
+SparseMatrixConnections is a SWIG object without pickle support, so algorithms
+that own one convert it into a picklable state in their __getstate__ and
+rebuild it in their __setstate__. The state holds the cell of every segment
+and the permanence matrix; the matrix itself is a picklable SparseMatrix.
+Segments are recreated in order so they get back their original indices. This
+assumes no segment has been destroyed, which holds for every algorithm that
+uses these helpers.
+"""
+
+import numpy as np
+
+from nupic.bindings.math import SparseMatrixConnections
+
+
+
+def getConnectionsState(connections):
+  """
+  Return a picklable representation of a SparseMatrixConnections.
+
+  @param connections (SparseMatrixConnections)
+
+  @return (tuple)
+  (numCells, segmentCells, matrix)
+  """
+  segments = np.arange(connections.nSegments(), dtype="uint32")
+  return (connections.nCells(),
+          connections.mapSegmentsToCells(segments),
+          connections.matrix)
+
+
+def createConnectionsFromState(state):
+  """
+  Create a SparseMatrixConnections from the output of getConnectionsState.
+  """
+  numCells, segmentCells, matrix = state
+  connections = SparseMatrixConnections(numCells, matrix.nCols())
+  connections.createSegments(np.asarray(segmentCells, dtype="uint32"))
+  connections.matrix.copy(matrix)
+  return connections
@@ -6,10 +6,15 @@
 # iterate() methods, and define your defaults and experiments variables
 # in a config file.
 # PyExperimentSuite will create directories, run the experiments and store the 
-# logged data. An aborted experiment can be resumed at any time. If you want
-# to resume it on iteration level (instead of repetition level) you need to
-# implement the restore_state and save_state method and make sure the 
-# restore_supported variable is set to True.
+# logged data. An aborted experiment can be resumed at any time: completed
+# repetitions are recorded in a manifest.log file in the experiment folder and
+# are skipped. If you want to resume it on iteration level (instead of
+# repetition level) you need to implement the restore_state and save_state
+# method (or get_checkpoint and restore_checkpoint, to save in the background)
+# and make sure the restore_supported variable is set to True. The state is
+# saved every checkpoint_interval iterations, every checkpoint_seconds seconds
+# and on SIGTERM, and a resumed repetition continues from its latest complete
+# checkpoint.
 #
 # For more information, consult the included documentation.pdf file.
 #
@@ -22,12 +27,22 @@
 from ConfigParser import ConfigParser
 from multiprocessing import Process, Pool, cpu_count
 from numpy import *
-import json, os, sys, time, itertools, re, optparse, types
+import json, os, sys, time, itertools, re, optparse, types, sqlite3
+import cPickle, signal, threading
 
 def mp_runrep(args):
     """ Helper function to allow multiprocessing support. """
     return PyExperimentSuite.run_rep(*args)
 
+def mp_runrep_timed(args):
+    """ Like mp_runrep, but also returns the parameters, the repetition number
+        and the run time (None if the repetition was already complete).
+    """
+    start = time.time()
+    skipped = (mp_runrep(args) == False)
+    duration = None if skipped else time.time() - start
+    return args[1], args[2], duration
+
 def progress(params, rep):
     """ Helper function to calculate the progress made on one experiment. """
     name = params['name']
@@ -41,6 +56,143 @@ def progress(params, rep):
     else: 
         return 0
 
+def write_atomic(filename, data, sync=True):
+    """ Helper function to replace a file in one step: the data is written to a
+        temporary file that is then renamed, so readers never see a partially
+        written file.
+    """
+    tmpname = '%s.tmp%i'%(filename, os.getpid())
+    f = open(tmpname, 'wb')
+    f.write(data)
+    f.flush()
+    if sync:
+        os.fsync(f.fileno())
+    f.close()
+    os.rename(tmpname, filename)
+
+
+class Checkpointer(object):
+    """ Decides when a repetition saves its state and saves it. The state
+        is either saved by the suite's save_state in the calling thread, or,
+        if the suite returns a snapshot from get_checkpoint, the snapshot is
+        pickled and written in a background thread while the next iterations
+        run. Either way, the number of completed iterations in the latest
+        complete checkpoint can be read back with latest().
+    """
+
+    def __init__(self, suite, params, rep):
+        self.suite = suite
+        self.params = params
+        self.rep = rep
+        fullpath = os.path.join(params['path'], params['name'])
+        self.statename = os.path.join(fullpath, '%i.state'%rep)
+        self.markername = os.path.join(fullpath, '%i.checkpoint'%rep)
+
+        self.interval = params.get('checkpoint_interval', suite.checkpoint_interval)
+        self.seconds = params.get('checkpoint_seconds', suite.checkpoint_seconds)
+        self.on_sigterm = params.get('checkpoint_on_sigterm', suite.checkpoint_on_sigterm)
+
+        self.last_time = time.time()
+        self.terminated = False
+        self.thread = None
+        self.error = None
+        self.old_handler = None
+
+    def latest(self, numlines):
+        """ returns the number of completed iterations of the latest complete
+            checkpoint and its snapshot (None for save_state checkpoints).
+            numlines is the number of lines in the log: checkpoints of a log
+            that was never marked (i.e. written before checkpoints were
+            tracked) are assumed to be up to date with it, and checkpoints
+            ahead of the log can't be used.
+        """
+        n, state = 0, None
+        if os.path.exists(self.markername):
+            f = open(self.markername, 'r')
+            n = json.load(f)['iterations']
+            f.close()
+        else:
+            n = numlines
+        if os.path.exists(self.statename):
+            f = open(self.statename, 'rb')
+            checkpoint = cPickle.load(f)
+            f.close()
+            if checkpoint['iterations'] >= n:
+                n, state = checkpoint['iterations'], checkpoint['state']
+        if n > numlines:
+            return 0, None
+        return n, state
+
+    def start(self, n):
+        """ starts tracking a repetition that has completed n iterations. """
+        if n == 0:
+            self.remove()
+            write_atomic(self.markername, json.dumps({'iterations': 0}), sync=False)
+        if self.on_sigterm:
+            try:
+                self.old_handler = signal.signal(signal.SIGTERM, self._terminate)
+            except ValueError:
+                # signal handlers can only be set in the main thread
+                self.old_handler = None
+
+    def _terminate(self, signum, frame):
+        self.terminated = True
+
+    def due(self, n):
+        """ returns whether to save a checkpoint after n completed iterations. """
+        if self.terminated:
+            return True
+        if self.interval and n % self.interval == 0:
+            return True
+        if self.seconds is not None and time.time() - self.last_time >= self.seconds:
+            return True
+        return False
+
+    def save(self, n):
+        """ saves a checkpoint after n completed iterations. """
+        self.last_time = time.time()
+        checkpoint = self.suite.get_checkpoint(self.params, self.rep, n)
+        # only one checkpoint is written at a time
+        self.wait()
+        if checkpoint is None:
+            self.suite.save_state(self.params, self.rep, n - 1)
+            write_atomic(self.markername, json.dumps({'iterations': n}), sync=False)
+        else:
+            self.thread = threading.Thread(target=self._write, args=(n, checkpoint))
+            self.thread.start()
+
+    def _write(self, n, checkpoint):
+        try:
+            write_atomic(self.statename, cPickle.dumps(
+                {'iterations': n, 'state': checkpoint}, cPickle.HIGHEST_PROTOCOL))
+        except Exception:
+            self.error = sys.exc_info()
+
+    def wait(self):
+        """ waits until the checkpoint that is being written is complete. """
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error[0], error[1], error[2]
+
+    def stop(self):
+        """ waits for the last checkpoint and restores the SIGTERM handler. """
+        try:
+            self.wait()
+        finally:
+            if self.old_handler is not None:
+                signal.signal(signal.SIGTERM, self.old_handler)
+                self.old_handler = None
+
+    def remove(self):
+        """ deletes the checkpoint files of a repetition. """
+        for filename in (self.statename, self.markername):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+
 def convert_param_to_dirname(param):
     """ Helper function to convert a parameter value to a valid directory name. """
     if type(param) == types.StringType:
@@ -53,6 +205,19 @@ class PyExperimentSuite(object):
     
     # change this in subclass, if you support restoring state on iteration level
     restore_supported = False
+
+    # change these in subclass or set them as parameters to control how often
+    # the state is saved, if restoring is supported: after every
+    # checkpoint_interval iterations (0 to disable), after the first
+    # iteration that ends checkpoint_seconds after the previous checkpoint
+    # (None to disable), and before exiting on SIGTERM.
+    checkpoint_interval = 1
+    checkpoint_seconds = None
+    checkpoint_on_sigterm = True
+
+    # change this in subclass to always parse the json logs in get_history
+    # instead of keeping a per-tag index of them (see get_log_columns)
+    index_history = True
     
     def __init__(self):
         # list of keys, that had to be renamed because they contained spaces
@@ -183,40 +348,124 @@ class PyExperimentSuite(object):
         if tags != 'all' and not hasattr(tags, '__iter__'):
             tags = [tags] 
         
-        results = {}
-        logfile = os.path.join(exp, '%i.log'%rep)
-        try:
-            f = open(logfile)
-        except IOError:
-            if len(tags) == 1:
+        alltags = (tags == 'all')
+        if alltags:
+            columns = self.get_log_columns(exp, rep)
+        else:
+            columns = self.get_log_columns(exp, rep, tags)
+        if columns is None:
+            if len(tags) == 1 and not alltags:
                 return []
             else:
                 return {}
 
-        for line in f:
-            dic = json.loads(line)
+        numlines, columns = columns
+        results = {}
+        if numlines > 0:
+            if alltags:
+                tags = columns.keys()
             for tag in tags:
-              if not tag in results:
-                results[tag] = []
-
-              if tag in dic:
-                results[tag].append(dic[tag])
-              else:
-                results[tag].append(None)
-                            
-        f.close()
+                results[tag] = columns.get(tag, [None]*numlines)
+
         if len(results) == 0:
-            if len(tags) == 1:
+            if len(tags) == 1 and not alltags:
                 return []
             else:
                 return {}
             # raise ValueError('tag(s) not found: %s'%str(tags))
-        if len(tags) == 1:
+        if len(tags) == 1 and not alltags:
             return results[results.keys()[0]]
         else:
             return results
     
     
+    def get_log_columns(self, exp, rep, tags=None):
+        """ returns the number of lines of the log of one repetition and a
+            dictionary with the list of values of each requested tag (None
+            where a line doesn't have the tag). tags that never occur are left
+            out. if tags is None, all tags are returned. returns None if the
+            log doesn't exist.
+
+            if index_history is set, the columns of each log are stored in an
+            sqlite index (history.sqlite) in the experiment folder the first
+            time the log is read, and later queries only load the requested
+            tags of the requested repetition. the index of a log is rebuilt
+            whenever the log's modification time or size changes.
+        """
+        logfile = os.path.join(exp, '%i.log'%rep)
+        try:
+            stat = os.stat(logfile)
+        except OSError:
+            return None
+
+        if self.index_history:
+            try:
+                return self._get_indexed_log_columns(exp, rep, tags, stat)
+            except sqlite3.Error:
+                # e.g. a read-only experiment folder, parse the log instead
+                pass
+
+        numlines, columns = self._parse_log_columns(logfile)
+        if tags is not None:
+            columns = dict((tag, columns[tag]) for tag in tags if tag in columns)
+        return numlines, columns
+
+    def _parse_log_columns(self, logfile):
+        """ reads all tags of a log into one list of values per tag. """
+        lines = []
+        f = open(logfile)
+        for line in f:
+            lines.append(json.loads(line))
+        f.close()
+
+        columns = {}
+        for dic in lines:
+            for tag in dic:
+                if tag not in columns:
+                    columns[tag] = [d.get(tag) for d in lines]
+        return len(lines), columns
+
+    def _get_indexed_log_columns(self, exp, rep, tags, stat):
+        """ get_log_columns using the sqlite index of the experiment folder. """
+        db = sqlite3.connect(os.path.join(exp, 'history.sqlite'), timeout=60)
+        try:
+            db.execute('CREATE TABLE IF NOT EXISTS logs (rep INTEGER PRIMARY KEY, '
+                       'mtime REAL, size INTEGER, numlines INTEGER)')
+            db.execute('CREATE TABLE IF NOT EXISTS columns (rep INTEGER, tag TEXT, '
+                       'vals TEXT, PRIMARY KEY (rep, tag))')
+
+            row = db.execute('SELECT mtime, size, numlines FROM logs WHERE rep = ?',
+                             (rep,)).fetchone()
+            if row is not None and row[0] == stat.st_mtime and row[1] == stat.st_size:
+                numlines = row[2]
+                if tags is None:
+                    rows = db.execute('SELECT tag, vals FROM columns WHERE rep = ?',
+                                      (rep,))
+                else:
+                    tags = list(tags)
+                    rows = db.execute('SELECT tag, vals FROM columns WHERE rep = ? '
+                                      'AND tag IN (%s)'%','.join('?'*len(tags)),
+                                      [rep] + tags)
+                columns = dict((tag, json.loads(vals)) for tag, vals in rows)
+                return numlines, columns
+
+            # the log is new or has changed since it was indexed
+            numlines, columns = self._parse_log_columns(os.path.join(exp, '%i.log'%rep))
+            with db:
+                db.execute('DELETE FROM columns WHERE rep = ?', (rep,))
+                db.executemany('INSERT INTO columns VALUES (?, ?, ?)',
+                               [(rep, tag, json.dumps(vals))
+                                for tag, vals in columns.iteritems()])
+                db.execute('INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?)',
+                           (rep, stat.st_mtime, stat.st_size, numlines))
+        finally:
+            db.close()
+
+        if tags is not None:
+            columns = dict((tag, columns[tag]) for tag in tags if tag in columns)
+        return numlines, columns
+    
+    
     def get_history_tags(self, exp, rep=0):
         """ returns all available tags (logging keys) of the given experiment 
             repetition. 
@@ -525,32 +774,119 @@ class PyExperimentSuite(object):
                 print 'Error: parameter set does not contain all required keys: name, iterations, repetitions, path'
                 return False
             
+        # read the manifests of completed repetitions
+        manifests = [self.read_manifest(pl) for pl in paramlist]
+
         # create experiment list 
         explist = []
+        costs = []
             
-        # expand paramlist for all repetitions and add self and rep number
-        for p in paramlist:
-            explist.extend(zip( [self]*p['repetitions'], [p]*p['repetitions'], xrange(p['repetitions']) ))
+        # expand paramlist for all repetitions that the manifest doesn't list
+        # as completed and add self and rep number
+        expcosts = self.estimate_costs(paramlist, manifests)
+        for p, manifest, cost in zip(paramlist, manifests, expcosts):
+            for rep in xrange(p['repetitions']):
+                if rep not in manifest:
+                    explist.append((self, p, rep))
+                    costs.append(cost)
+
+        # start the most expensive repetitions first, so that the cores aren't
+        # left idle while a few long repetitions finish at the end
+        order = sorted(xrange(len(explist)), key=lambda i: -costs[i])
+        explist = [explist[i] for i in order]
                 
         # if only 1 process is required call each experiment seperately (no worker pool)
         if self.options.ncores == 1:
-            for e in explist:
-                mp_runrep(e)
+            results = itertools.imap(mp_runrep_timed, explist)
         else:
-            # create worker processes    
+            # create worker processes and hand out one repetition at a time
             pool = Pool(processes=self.options.ncores)
-            pool.map(mp_runrep, explist)
+            results = pool.imap_unordered(mp_runrep_timed, explist)
+
+        for i, (p, rep, duration) in enumerate(results):
+            self.write_manifest(p, rep, duration)
+            if duration is None:
+                status = 'was already complete'
+            else:
+                status = 'finished in %.1fs'%duration
+            print '[%i/%i] %s repetition %i %s'%(i + 1, len(explist), p['name'], rep, status)
+            sys.stdout.flush()
+
+        if self.options.ncores != 1:
+            pool.close()
+            pool.join()
         
         return True        
         
+
+    def read_manifest(self, params):
+        """ returns a dictionary that maps the completed repetitions of an
+            experiment to their manifest entries. repetitions that were
+            completed with a different number of iterations are ignored.
+        """
+        manifestname = os.path.join(params['path'], params['name'], 'manifest.log')
+        manifest = {}
+        if os.path.exists(manifestname):
+            f = open(manifestname, 'r')
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the sweep was killed while writing this line
+                    continue
+                if entry.get('iterations') == params.get('iterations'):
+                    manifest[entry['repetition']] = entry
+            f.close()
+        return manifest
+
+
+    def write_manifest(self, params, rep, duration):
+        """ records a completed repetition and its run time in the manifest of
+            the experiment. the manifest is only written by the main process.
+        """
+        manifestname = os.path.join(params['path'], params['name'], 'manifest.log')
+        entry = {'repetition': rep, 'iterations': params.get('iterations'),
+                 'duration': duration}
+        f = open(manifestname, 'a')
+        json.dump(entry, f)
+        f.write('\n')
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+
+
+    def estimate_costs(self, paramlist, manifests):
+        """ returns the expected run time of one repetition of each experiment.
+            experiments with completed repetitions in their manifest use their
+            mean measured run time. the others use estimate_cost(), scaled to
+            seconds by the measured experiments if there are any.
+        """
+        estimates = [float(self.estimate_cost(p)) for p in paramlist]
+        measured = []
+        for manifest in manifests:
+            durations = [e['duration'] for e in manifest.values()
+                         if e.get('duration') is not None]
+            measured.append(mean(durations) if durations else None)
+
+        known = [(m, e) for m, e in zip(measured, estimates) if m is not None]
+        if known and sum(e for m, e in known) > 0:
+            secondsperunit = sum(m for m, e in known) / sum(e for m, e in known)
+        else:
+            secondsperunit = 1.0
+
+        return [m if m is not None else e * secondsperunit
+                for m, e in zip(measured, estimates)]
+        
        
     def run_rep(self, params, rep):
         """ run a single repetition including directory creation, log files, etc. """
         name = params['name']
         fullpath = os.path.join(params['path'], params['name'])
         logname = os.path.join(fullpath, '%i.log'%rep)
+        checkpointer = Checkpointer(self, params, rep)
         # check if repetition exists and has been completed
         restore = 0
+        state = None
         if os.path.exists(logname):
             logfile = open(logname, 'r')
             lines = logfile.readlines()
@@ -566,30 +902,53 @@ class PyExperimentSuite(object):
                 os.remove(logname)
                 restore = 0
             else:
-                restore = len(lines)
+                # resume from the latest checkpoint, the iterations after it
+                # are run again
+                restore, state = checkpointer.latest(len(lines))
+                if restore < len(lines):
+                    logfile = open(logname, 'w')
+                    logfile.writelines(lines[:restore])
+                    logfile.close()
             
         self.reset(params, rep)
         
         if restore:
             logfile = open(logname, 'a')
-            self.restore_state(params, rep, restore)
+            if state is not None:
+                self.restore_checkpoint(params, rep, restore, state)
+            else:
+                self.restore_state(params, rep, restore)
+            state = None
         else:
             logfile = open(logname, 'w')
+
+        if self.restore_supported:
+            checkpointer.start(restore)
             
-        # loop through iterations and call iterate
-        for it in xrange(restore, params['iterations']):
-            dic = self.iterate(params, rep, it) or {}
-            dic['iteration'] = it
+        try:
+            # loop through iterations and call iterate
+            for it in xrange(restore, params['iterations']):
+                dic = self.iterate(params, rep, it) or {}
+                dic['iteration'] = it
 
-            if self.restore_supported:
-                self.save_state(params, rep, it)
+                if dic is not None:
+                  json.dump(dic, logfile)
+                  logfile.write('\n')
+                  logfile.flush()
 
-            if dic is not None:
-              json.dump(dic, logfile)
-              logfile.write('\n')
-              logfile.flush()
+                if self.restore_supported and checkpointer.due(it + 1):
+                    checkpointer.save(it + 1)
+                    if checkpointer.terminated:
+                        checkpointer.wait()
+                        raise SystemExit('terminated after iteration %i of %s, '
+                                         'repetition %i'%(it, name, rep))
+        finally:
+            logfile.close()
+            if self.restore_supported:
+                checkpointer.stop()
 
-        logfile.close()
+        if self.restore_supported:
+            checkpointer.remove()
 
         self.finalize(params, rep)
     
@@ -597,6 +956,16 @@ class PyExperimentSuite(object):
     def reset(self, params, rep):
         """ needs to be implemented by subclass. """
         pass
+
+    def estimate_cost(self, params):
+        """ can be implemented by subclass to return the relative run time of
+            one repetition of this parameter set (e.g. growing with the number
+            of objects or columns), so that the longest repetitions are started
+            first. the default assumes that the run time grows with the number
+            of iterations. estimates are replaced by measured run times once
+            repetitions of the experiment have completed.
+        """
+        return params['iterations']
     
     def iterate(self, params, rep, n):
         """ needs to be implemented by subclass. """
@@ -608,7 +977,27 @@ class PyExperimentSuite(object):
         pass
     
     def save_state(self, params, rep, n):
-        """ optionally can be implemented by subclass. """
+        """ optionally can be implemented by subclass. called at each
+            checkpoint (see checkpoint_interval) after iteration n, unless
+            get_checkpoint returns a snapshot.
+        """
+        pass
+
+    def get_checkpoint(self, params, rep, n):
+        """ optionally can be implemented by subclass instead of save_state
+            and restore_state. returns a picklable snapshot of the state after
+            n completed iterations, which is pickled and written in a
+            background thread while the next iterations run, so it must not be
+            modified afterwards (e.g. a copy, or an already pickled string).
+            it is passed to restore_checkpoint when the repetition is resumed.
+            the default returns None, which saves the state with save_state.
+        """
+        return None
+
+    def restore_checkpoint(self, params, rep, n, checkpoint):
+        """ restores the snapshot returned by get_checkpoint after n completed
+            iterations. called after reset().
+        """
         pass
         
     def restore_state(self, params, rep, n):
@@ -0,0 +1,330 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+A disk cache of trained models, so that scripts that sweep inference
+parameters don't retrain the same network for every point of the sweep.
+
+Models are stored as pickles, under a key computed from everything that
+determines the training: the layer parameters, the objects and the state of
+the random number generators when training starts. For example:
+
+  cache = ModelCache("~/.cache/htmresearch/models", maxBytes=10 * 2**30)
+
+  def train():
+    exp = L4L2Experiment(**experimentArgs)
+    exp.learnObjects(objectsToLearn)
+    return exp
+
+  exp = cache.getOrTrain({"experiment": experimentArgs,
+                          "objects": objectsToLearn}, train)
+
+Training usually consumes random numbers, so the cache also stores the state
+of Python's and numpy's global generators after training and restores them
+when a model is loaded. Code that runs after getOrTrain sees the same random
+numbers whether the model was trained or loaded.
+
+The key doesn't include the code of the algorithms. Use the 'namespace'
+argument, or clear the cache, when a change to the code changes what training
+produces.
+
+The least recently used models are deleted when the cache exceeds its size
+limits. Several processes can share a cache directory: models are written to
+a temporary file and renamed.
+"""
+
+import cPickle
+import hashlib
+import json
+import os
+import random
+import tempfile
+
+import numpy as np
+
+
+
+class ModelCache(object):
+  """
+  A directory of pickled models, keyed by a hash of their configuration.
+  """
+
+  def __init__(self, directory, maxBytes=None, maxEntries=None,
+               namespace=""):
+    """
+    @param directory (str)
+    Where models are stored. Created if needed.
+
+    @param maxBytes (int or None)
+    Maximum total size of the stored models. The least recently used models
+    are deleted when a new model is stored. None for no limit.
+
+    @param maxEntries (int or None)
+    Maximum number of stored models. None for no limit.
+
+    @param namespace (str)
+    Included in every key, e.g. to separate the models of different scripts or
+    to invalidate models trained by an older version of the code.
+    """
+    self.directory = os.path.abspath(os.path.expanduser(directory))
+    self.maxBytes = maxBytes
+    self.maxEntries = maxEntries
+    self.namespace = namespace
+    self.hits = 0
+    self.misses = 0
+
+    if not os.path.isdir(self.directory):
+      try:
+        os.makedirs(self.directory)
+      except OSError:
+        # Another process may have created it.
+        if not os.path.isdir(self.directory):
+          raise
+
+
+  def getKey(self, config, includeRandomState=True):
+    """
+    Compute the key of a configuration.
+
+    @param config
+    Any combination of dicts, lists, tuples, sets, strings, numbers, None and
+    numpy arrays, except arrays of objects. Other types raise a TypeError, so
+    that a key is never computed from an unstable repr.
+
+    @param includeRandomState (bool)
+    Whether the current state of Python's and numpy's global random number
+    generators is part of the key.
+
+    @return (str)
+    A hexadecimal digest
+    """
+    keyData = {
+      "namespace": self.namespace,
+      "config": _canonicalize(config),
+    }
+    if includeRandomState:
+      keyData["randomState"] = _canonicalize(_getRandomState())
+
+    return hashlib.sha1(json.dumps(keyData, sort_keys=True,
+                                   separators=(",", ":"))).hexdigest()
+
+
+  def get(self, key):
+    """
+    Load a model.
+
+    @return
+    The stored (model, randomState) pair, or None if the key isn't cached
+    """
+    filename = self._getFilename(key)
+    try:
+      with open(filename, "rb") as f:
+        entry = cPickle.load(f)
+    except (IOError, EOFError, cPickle.UnpicklingError):
+      self.misses += 1
+      return None
+
+    self.hits += 1
+    try:
+      # The modification time orders the models for eviction.
+      os.utime(filename, None)
+    except OSError:
+      pass
+    return entry
+
+
+  def put(self, key, model, randomState=None):
+    """
+    Store a model, then delete the least recently used models if the cache
+    exceeds its limits.
+
+    @param randomState
+    The random number generator states to restore when the model is loaded,
+    as a (random.getstate(), numpy.random.get_state()) pair, or None.
+    """
+    fd, tempFilename = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+    try:
+      with os.fdopen(fd, "wb") as f:
+        cPickle.dump((model, randomState), f, cPickle.HIGHEST_PROTOCOL)
+      os.rename(tempFilename, self._getFilename(key))
+    except:
+      if os.path.exists(tempFilename):
+        os.remove(tempFilename)
+      raise
+
+    self.evict(keep=key)
+
+
+  def getOrTrain(self, config, train, restoreRandomState=True):
+    """
+    Load the model trained with a configuration, or train and store it.
+
+    @param config
+    Everything that determines the trained model, see getKey
+
+    @param train (function)
+    Called without arguments to train the model on a cache miss
+
+    @param restoreRandomState (bool)
+    If True, the key includes the random number generator states before
+    training, and loading a model sets them to their state after training.
+
+    @return
+    The trained model
+    """
+    key = self.getKey(config, includeRandomState=restoreRandomState)
+
+    entry = self.get(key)
+    if entry is not None:
+      model, randomState = entry
+      if restoreRandomState and randomState is not None:
+        _setRandomState(randomState)
+      return model
+
+    model = train()
+    self.put(key, model,
+             _getRandomState() if restoreRandomState else None)
+    return model
+
+
+  def evict(self, keep=None):
+    """
+    Delete the least recently used models until the cache fits in its limits.
+
+    @param keep (str or None)
+    A key that is never deleted, e.g. the model that was just stored
+    """
+    if self.maxBytes is None and self.maxEntries is None:
+      return
+
+    entries = []
+    for name in os.listdir(self.directory):
+      if not name.endswith(".pkl"):
+        continue
+      try:
+        stat = os.stat(os.path.join(self.directory, name))
+      except OSError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, name))
+    entries.sort()
+
+    totalBytes = sum(size for _, size, _ in entries)
+    numEntries = len(entries)
+    keepName = (os.path.basename(self._getFilename(keep))
+                if keep is not None else None)
+    for _, size, name in entries:
+      if ((self.maxBytes is None or totalBytes <= self.maxBytes) and
+          (self.maxEntries is None or numEntries <= self.maxEntries)):
+        break
+      if name == keepName:
+        continue
+      try:
+        os.remove(os.path.join(self.directory, name))
+      except OSError:
+        # Already deleted by another process.
+        pass
+      totalBytes -= size
+      numEntries -= 1
+
+
+  def clear(self):
+    """
+    Delete every stored model.
+    """
+    for name in os.listdir(self.directory):
+      if name.endswith(".pkl"):
+        try:
+          os.remove(os.path.join(self.directory, name))
+        except OSError:
+          pass
+
+
+  def getStatistics(self):
+    """
+    Return the number of hits and misses of this instance, and the number and
+    total size of the stored models.
+    """
+    sizes = []
+    for name in os.listdir(self.directory):
+      if name.endswith(".pkl"):
+        try:
+          sizes.append(os.path.getsize(os.path.join(self.directory, name)))
+        except OSError:
+          pass
+
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "entries": len(sizes),
+      "bytes": sum(sizes),
+    }
+
+
+  def _getFilename(self, key):
+    return os.path.join(self.directory, key + ".pkl")
+
+
+
+def _getRandomState():
+  return (random.getstate(), np.random.get_state())
+
+
+def _setRandomState(randomState):
+  pythonState, numpyState = randomState
+  random.setstate(pythonState)
+  np.random.set_state(numpyState)
+
+
+def _canonicalize(value):
+  """
+  Convert a value into JSON data that only depends on its contents: dict
+  items are sorted, sets are sorted and arrays are replaced by a digest of
+  their dtype, shape and data.
+  """
+  if value is None or isinstance(value, (bool, basestring)):
+    return value
+  if isinstance(value, (int, long)):
+    return value
+  if isinstance(value, float):
+    # repr keeps every digit, and also handles nan and infinity.
+    return {"float": repr(value)}
+  if isinstance(value, np.generic):
+    return _canonicalize(value.item())
+  if isinstance(value, np.ndarray):
+    if value.dtype.hasobject:
+      # The data of object arrays are pointers.
+      raise TypeError("Can't compute a cache key from an array of objects")
+    value = np.ascontiguousarray(value)
+    return {"ndarray": [value.dtype.str, list(value.shape),
+                        hashlib.sha1(value.tostring()).hexdigest()]}
+  if isinstance(value, dict):
+    items = [[_canonicalize(k), _canonicalize(v)] for k, v in value.iteritems()]
+    return {"dict": sorted(items, key=_sortKey)}
+  if isinstance(value, (set, frozenset)):
+    return {"set": sorted((_canonicalize(v) for v in value), key=_sortKey)}
+  if isinstance(value, (list, tuple)):
+    return [_canonicalize(v) for v in value]
+
+  raise TypeError("Can't compute a cache key from a {}".format(type(value)))
+
+
+def _sortKey(canonicalValue):
+  return json.dumps(canonicalValue, sort_keys=True)
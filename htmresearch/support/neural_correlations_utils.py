@@ -140,7 +140,8 @@ def generateRandomSequence(numSymbols, numColumns, sparsity):
   return sequence
 
 
-def computePWCorrelations(spikeTrains, removeAutoCorr):
+def computePWCorrelations(spikeTrains, removeAutoCorr, chunkSize=1024,
+                          dtype="float64"):
   """
   Computes pairwise correlations from spikeTrains
   
@@ -148,21 +149,62 @@ def computePWCorrelations(spikeTrains, removeAutoCorr):
          the array dimensions are: numCells x timeSteps
   @param removeAutoCorr (boolean) if true, auto-correlations are removed by substracting
          the diagonal of the correlation matrix         
+  @param chunkSize (int) number of rows of the correlation matrix computed at once,
+         which bounds the size of the temporary arrays
+  @param dtype (string) floating point type of the computation, "float32" halves the
+         memory needed for large numbers of cells
   @return corrMatrix (array) numCells x numCells matrix containing the Pearson correlation
           coefficient of spike trains of cell i and cell j
   @return numNegPCC (int) number of negative pairwise correlations (PCC(i,j) < 0)
   """
-  numCells = np.shape(spikeTrains)[0]
-  corrMatrix = np.zeros((numCells, numCells))
-  numNegPCC = 0
-  for i in range(numCells):
-    for j in range(numCells):
-      if i == j and removeAutoCorr == True:
-        continue
-      if not all(spikeTrains[i,:] == 0) and not all(spikeTrains[j,:] == 0):
-        corrMatrix[i,j] = np.corrcoef(spikeTrains[i,:], spikeTrains[j,:])[0,1]    
-        if corrMatrix[i,j] < 0:
-          numNegPCC += 1
+  centered, norms, silent = _centerSpikeTrains(spikeTrains, dtype)
+  numCells = centered.shape[0]
+  corrMatrix = np.zeros((numCells, numCells), dtype=dtype)
+  for start in xrange(0, numCells, chunkSize):
+    end = min(start + chunkSize, numCells)
+    corrMatrix[start:end] = _normalizeCovariances(
+      np.dot(centered[start:end], centered.T),
+      np.outer(norms[start:end], norms))
+
+  return _finishPWCorrelations(corrMatrix, silent, removeAutoCorr)
+
+
+def _centerSpikeTrains(spikeTrains, dtype):
+  """
+  Subtract the mean of every spike train and compute the norms of the centered
+  trains, which turns the correlation matrix into a matrix product.
+
+  @return centered (array) numCells x timeSteps centered spike trains
+  @return norms (array) norm of each centered spike train
+  @return silent (array) mask of the cells that never spike
+  """
+  spikeTrains = np.asarray(spikeTrains, dtype=dtype)
+  centered = spikeTrains - spikeTrains.mean(axis=1)[:, np.newaxis]
+  norms = np.sqrt(np.einsum("ij,ij->i", centered, centered))
+  silent = ~spikeTrains.any(axis=1)
+  return (centered, norms, silent)
+
+
+def _normalizeCovariances(covariances, normProducts):
+  """
+  Turn covariances into Pearson correlation coefficients, clipped to [-1, 1] like
+  np.corrcoef. Spike trains that are constant give NaN, as with np.corrcoef.
+  """
+  with np.errstate(divide="ignore", invalid="ignore"):
+    return np.clip(covariances / normProducts, -1, 1)
+
+
+def _finishPWCorrelations(corrMatrix, silent, removeAutoCorr):
+  """
+  Clear the correlations of cells that never spike and, if requested, the
+  auto-correlations, then count the negative correlations.
+  """
+  corrMatrix[silent, :] = 0
+  corrMatrix[:, silent] = 0
+  if removeAutoCorr == True:
+    np.fill_diagonal(corrMatrix, 0)
+  with np.errstate(invalid="ignore"):
+    numNegPCC = int(np.count_nonzero(corrMatrix < 0))
   return (corrMatrix, numNegPCC)
 
   
@@ -541,7 +583,8 @@ def inputAnalysis(allSequences, model, numColumns):
   return overlapMatrix  
   
 
-def computePWCorrelationsWithinCol(spikeTrains, removeAutoCorr, cellsPerColumn):
+def computePWCorrelationsWithinCol(spikeTrains, removeAutoCorr, cellsPerColumn,
+                                   dtype="float64"):
   """
   Computes pairwise correlations from spikeTrains
   
@@ -550,26 +593,24 @@ def computePWCorrelationsWithinCol(spikeTrains, removeAutoCorr, cellsPerColumn):
   @param removeAutoCorr (boolean) if true, auto-correlations are removed by substracting
      the diagonal of the correlation matrix
   @param cellsPerColumn (int) number of cells per column in thr TM
+  @param dtype (string) floating point type of the computation
   @return corrMatrix (array) numCells x numCells matrix containing the Pearson correlation
       coefficient of spike trains of cell i and cell j
   @return numNegPCC (int) number of negative pairwise correlations (PCC(i,j) < 0)
   """
-  numCells = np.shape(spikeTrains)[0]
+  centered, norms, silent = _centerSpikeTrains(spikeTrains, dtype)
+  numCells = centered.shape[0]
   numCols = numCells / cellsPerColumn
-  corrMatrix = np.zeros((numCells, numCells))
-  numNegPCC = 0
-  indices = np.zeros(cellsPerColumn, dtype="uint32")
-  
-  for col in range(numCols):
-    for k in range(cellsPerColumn):
-      indices[k] = (cellsPerColumn * col) + k
-    for i in indices:
-      for j in indices:
-        if i == j and removeAutoCorr == True:
-          continue
-        if not all(spikeTrains[i,:] == 0) and not all(spikeTrains[j,:] == 0):          
-          corrMatrix[i,j] = np.corrcoef(spikeTrains[i,:], spikeTrains[j,:])[0,1]  
-          if corrMatrix[i,j] < 0:
-            numNegPCC += 1
-          
-  return (corrMatrix, numNegPCC)
+  corrMatrix = np.zeros((numCells, numCells), dtype=dtype)
+
+  # Only the correlations between the cells of a same column are computed, one
+  # cellsPerColumn x cellsPerColumn block per column.
+  indices = np.arange(numCols * cellsPerColumn).reshape(numCols, cellsPerColumn)
+  columnTrains = centered[indices]
+  columnNorms = norms[indices]
+  corrMatrix[indices[:, :, np.newaxis], indices[:, np.newaxis, :]] = (
+    _normalizeCovariances(
+      np.einsum("cit,cjt->cij", columnTrains, columnTrains),
+      columnNorms[:, :, np.newaxis] * columnNorms[:, np.newaxis, :]))
+
+  return _finishPWCorrelations(corrMatrix, silent, removeAutoCorr)
@@ -0,0 +1,491 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compact containers for batches of SDRs.
+
+Object machines describe every sensation as a dict mapping each cortical
+column to a (location, feature) pair of Python sets. For large object sets
+most of the memory goes into these sets and experiments convert every one of
+them to a list before feeding it to the network.
+
+The classes in this module store the active bits of many SDRs in two flat
+arrays, like the rows of a CSR matrix: the active bits of SDR i are
+indices[indptr[i]:indptr[i + 1]], as sorted uint32 indices.
+
+  - SDRBatch: a sequence of SDRs of the same width
+  - SensationBatch: a list of sensations, each one holding a location and a
+    feature SDR for every cortical column
+  - ObjectBatch: a dict of sensation lists, keyed by object name
+
+SensationBatch and ObjectBatch can be used wherever the canonical sensation
+list and object dict formats are expected. Their SDRs are numpy arrays instead
+of sets, which RawSensor and DirectL4L2Columns accept without conversion.
+
+Batches can be saved to a directory of .npy files and loaded back as memory
+mapped arrays, so a learning set can be shared between processes without
+being loaded in memory.
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+
+class SDRBatch(object):
+  """
+  A sequence of SDRs of the same width, stored as CSR arrays.
+  """
+
+  def __init__(self, indptr, indices, width):
+    """
+    @param indptr (numpy array)
+    Offsets of each SDR in 'indices', with one more element than SDRs
+
+    @param indices (numpy array)
+    The active bits of every SDR, sorted within each SDR
+
+    @param width (int)
+    Number of bits in each SDR
+    """
+    self.indptr = np.asarray(indptr, dtype="int64")
+    self.indices = np.asarray(indices, dtype="uint32")
+    self.width = width
+
+
+  @classmethod
+  def fromSDRs(cls, sdrs, width):
+    """
+    Create a batch from an iterable of SDRs, each one given as a set, list or
+    array of active bits.
+    """
+    sdrs = [np.unique(np.asarray(list(sdr) if isinstance(sdr, (set, frozenset))
+                                 else sdr, dtype="uint32"))
+            for sdr in sdrs]
+    indptr = np.zeros(len(sdrs) + 1, dtype="int64")
+    indptr[1:] = np.cumsum([len(sdr) for sdr in sdrs])
+    if len(sdrs) > 0:
+      indices = np.concatenate(sdrs)
+    else:
+      indices = np.empty(0, dtype="uint32")
+    return cls(indptr, indices, width)
+
+
+  def __len__(self):
+    return len(self.indptr) - 1
+
+
+  def __iter__(self):
+    for i in xrange(len(self)):
+      yield self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+
+  def __getitem__(self, item):
+    """
+    An integer returns the active bits of one SDR, as a view into the batch. A
+    contiguous slice returns a batch that shares the indices of this one.
+    """
+    if isinstance(item, slice):
+      start, stop, step = item.indices(len(self))
+      if step != 1:
+        return self.take(np.arange(start, stop, step))
+      stop = max(start, stop)
+      indptr = self.indptr[start:stop + 1]
+      return SDRBatch(indptr - indptr[0],
+                      self.indices[indptr[0]:indptr[-1]],
+                      self.width)
+
+    if item < 0:
+      item += len(self)
+    if not 0 <= item < len(self):
+      raise IndexError("SDR index out of range")
+    return self.indices[self.indptr[item]:self.indptr[item + 1]]
+
+
+  def take(self, rows):
+    """
+    Return a new batch with the SDRs at the given positions.
+    """
+    rows = np.asarray(rows, dtype="int64")
+    starts = self.indptr[rows]
+    sizes = self.indptr[rows + 1] - starts
+    indptr = np.zeros(len(rows) + 1, dtype="int64")
+    np.cumsum(sizes, out=indptr[1:])
+
+    # Position of every selected bit in self.indices.
+    positions = (np.arange(indptr[-1], dtype="int64") -
+                 np.repeat(indptr[:-1] - starts, sizes))
+    return SDRBatch(indptr, self.indices[positions], self.width)
+
+
+  def getSizes(self):
+    """
+    Return the number of active bits of each SDR.
+    """
+    return np.diff(self.indptr)
+
+
+  def getRows(self):
+    """
+    Return the SDR index of every element of 'indices'.
+    """
+    return np.repeat(np.arange(len(self), dtype="int64"), self.getSizes())
+
+
+  def toDense(self, dtype="uint8"):
+    """
+    Return the batch as a len(self) x width 0/1 matrix.
+    """
+    dense = np.zeros((len(self), self.width), dtype=dtype)
+    dense[self.getRows(), self.indices] = 1
+    return dense
+
+
+  def addNoise(self, noiseLevel, rng=None):
+    """
+    Return a new batch where each active bit has been replaced, with
+    probability noiseLevel, by a bit that isn't active in the original SDR.
+    Like SimpleObjectMachine._addNoise, each SDR keeps its number of active
+    bits.
+
+    @param noiseLevel (float)
+    Probability that each active bit is replaced
+
+    @param rng (numpy.random.RandomState)
+    Random number generator. Defaults to numpy's global one.
+    """
+    if rng is None:
+      rng = np.random
+
+    replaced = rng.random_sample(len(self.indices)) < noiseLevel
+    numReplaced = np.bincount(self.getRows()[replaced], minlength=len(self))
+
+    sdrs = []
+    for i, sdr in enumerate(self):
+      if numReplaced[i] == 0:
+        sdrs.append(sdr)
+        continue
+
+      if self.width - len(sdr) < numReplaced[i]:
+        raise ValueError("Not enough inactive bits to add noise")
+
+      kept = sdr[~replaced[self.indptr[i]:self.indptr[i + 1]]]
+      newBits = np.empty(0, dtype="uint32")
+      while len(newBits) < numReplaced[i]:
+        candidates = rng.randint(self.width, size=2 * numReplaced[i])
+        candidates = candidates[~np.in1d(candidates, sdr)]
+        newBits = np.union1d(newBits, candidates).astype("uint32")
+      newBits = rng.permutation(newBits)[:numReplaced[i]]
+      sdrs.append(np.union1d(kept, newBits))
+
+    return SDRBatch.fromSDRs(sdrs, self.width)
+
+
+  def save(self, directory):
+    """
+    Save the batch as .npy files in the given directory.
+    """
+    _makeDirectory(directory)
+    np.save(os.path.join(directory, "indptr.npy"), self.indptr)
+    np.save(os.path.join(directory, "indices.npy"), self.indices)
+    with open(os.path.join(directory, "sdrs.json"), "w") as f:
+      json.dump({"width": self.width}, f)
+
+
+  @classmethod
+  def load(cls, directory, mmapMode="r"):
+    """
+    Load a batch saved with save().
+
+    @param mmapMode (str or None)
+    Passed to numpy.load. By default, the arrays are read-only memory maps.
+    """
+    with open(os.path.join(directory, "sdrs.json"), "r") as f:
+      width = json.load(f)["width"]
+    return cls(np.load(os.path.join(directory, "indptr.npy"),
+                       mmap_mode=mmapMode),
+               np.load(os.path.join(directory, "indices.npy"),
+                       mmap_mode=mmapMode),
+               width)
+
+
+
+class SensationBatch(object):
+  """
+  A list of sensations. Sensation i of cortical column c has the location and
+  feature SDRs at position i * numColumns + c of the location and feature
+  batches.
+
+  Indexing the batch with an integer returns a sensation in the canonical
+  format, i.e. a dict mapping each column to a (location, feature) pair, where
+  the SDRs are uint32 arrays.
+  """
+
+  def __init__(self, locations, features, numColumns):
+    """
+    @param locations (SDRBatch)
+    @param features (SDRBatch)
+    @param numColumns (int)
+    """
+    if len(locations) != len(features) or len(locations) % numColumns != 0:
+      raise ValueError("Locations and features must have one SDR per column "
+                       "and sensation")
+
+    self.locations = locations
+    self.features = features
+    self.numColumns = numColumns
+
+
+  @classmethod
+  def fromSensations(cls, sensationList, numColumns, locationWidth,
+                     featureWidth):
+    """
+    Create a batch from a sensation list in the canonical format.
+    """
+    return cls(
+      SDRBatch.fromSDRs((sensations[col][0]
+                         for sensations in sensationList
+                         for col in xrange(numColumns)), locationWidth),
+      SDRBatch.fromSDRs((sensations[col][1]
+                         for sensations in sensationList
+                         for col in xrange(numColumns)), featureWidth),
+      numColumns)
+
+
+  def __len__(self):
+    return len(self.locations) // self.numColumns
+
+
+  def __iter__(self):
+    for i in xrange(len(self)):
+      yield self[i]
+
+
+  def __getitem__(self, item):
+    """
+    An integer returns one sensation. A slice returns a SensationBatch.
+    """
+    if isinstance(item, slice):
+      start, stop, step = item.indices(len(self))
+      if step == 1:
+        stop = max(start, stop)
+        return SensationBatch(
+          self.locations[start * self.numColumns:stop * self.numColumns],
+          self.features[start * self.numColumns:stop * self.numColumns],
+          self.numColumns)
+      return self.take(np.arange(start, stop, step))
+
+    if item < 0:
+      item += len(self)
+    if not 0 <= item < len(self):
+      raise IndexError("Sensation index out of range")
+    first = item * self.numColumns
+    return dict((col, (self.locations[first + col], self.features[first + col]))
+                for col in xrange(self.numColumns))
+
+
+  def take(self, steps):
+    """
+    Return a new batch with the sensations at the given positions.
+    """
+    rows = (np.asarray(steps, dtype="int64")[:, np.newaxis] * self.numColumns +
+            np.arange(self.numColumns)).ravel()
+    return SensationBatch(self.locations.take(rows),
+                          self.features.take(rows),
+                          self.numColumns)
+
+
+  def addNoise(self, featureNoise=None, locationNoise=None, rng=None):
+    """
+    Return a new batch with noise added to the features and/or locations. See
+    SDRBatch.addNoise.
+    """
+    locations = self.locations
+    features = self.features
+    if locationNoise is not None:
+      locations = locations.addNoise(locationNoise, rng)
+    if featureNoise is not None:
+      features = features.addNoise(featureNoise, rng)
+    return SensationBatch(locations, features, self.numColumns)
+
+
+  def save(self, directory):
+    """
+    Save the batch as .npy files in the given directory.
+    """
+    _makeDirectory(directory)
+    self.locations.save(os.path.join(directory, "locations"))
+    self.features.save(os.path.join(directory, "features"))
+    with open(os.path.join(directory, "sensations.json"), "w") as f:
+      json.dump({"numColumns": self.numColumns}, f)
+
+
+  @classmethod
+  def load(cls, directory, mmapMode="r"):
+    """
+    Load a batch saved with save(). See SDRBatch.load.
+    """
+    with open(os.path.join(directory, "sensations.json"), "r") as f:
+      numColumns = json.load(f)["numColumns"]
+    return cls(SDRBatch.load(os.path.join(directory, "locations"), mmapMode),
+               SDRBatch.load(os.path.join(directory, "features"), mmapMode),
+               numColumns)
+
+
+
+class ObjectBatch(object):
+  """
+  A dict of sensation lists, keyed by object name, stored as a single
+  SensationBatch. The sensations of object i are the steps
+  stepIndptr[i]:stepIndptr[i + 1] of the batch.
+
+  Object names must be JSON serializable to save the batch.
+  """
+
+  def __init__(self, objectNames, stepIndptr, sensations):
+    """
+    @param objectNames (list)
+    @param stepIndptr (numpy array)
+    @param sensations (SensationBatch)
+    """
+    self.objectNames = list(objectNames)
+    self.stepIndptr = np.asarray(stepIndptr, dtype="int64")
+    self.sensations = sensations
+    self._objectIndices = dict((name, i)
+                               for i, name in enumerate(self.objectNames))
+
+
+  @classmethod
+  def fromObjects(cls, objects, numColumns, locationWidth, featureWidth):
+    """
+    Create a batch from a dict of sensation lists in the canonical format.
+    """
+    objectNames = list(objects.keys())
+    stepIndptr = np.zeros(len(objectNames) + 1, dtype="int64")
+    stepIndptr[1:] = np.cumsum([len(objects[name]) for name in objectNames])
+    allSensations = (sensations
+                     for name in objectNames
+                     for sensations in objects[name])
+    return cls(objectNames, stepIndptr,
+               SensationBatch.fromSensations(allSensations, numColumns,
+                                             locationWidth, featureWidth))
+
+
+  def __len__(self):
+    return len(self.objectNames)
+
+
+  def __iter__(self):
+    return iter(self.objectNames)
+
+
+  def __contains__(self, objectName):
+    return objectName in self._objectIndices
+
+
+  def __getitem__(self, objectName):
+    """
+    Return the sensations of an object as a SensationBatch.
+    """
+    i = self._objectIndices[objectName]
+    return self.sensations[self.stepIndptr[i]:self.stepIndptr[i + 1]]
+
+
+  def keys(self):
+    return list(self.objectNames)
+
+
+  def iterkeys(self):
+    return iter(self.objectNames)
+
+
+  def itervalues(self):
+    for objectName in self.objectNames:
+      yield self[objectName]
+
+
+  def iteritems(self):
+    for objectName in self.objectNames:
+      yield objectName, self[objectName]
+
+
+  def values(self):
+    return list(self.itervalues())
+
+
+  def items(self):
+    return list(self.iteritems())
+
+
+  def select(self, objectNames):
+    """
+    Return a new batch with only the given objects, in the given order.
+    """
+    indices = [self._objectIndices[name] for name in objectNames]
+    starts = self.stepIndptr[indices]
+    sizes = self.stepIndptr[np.asarray(indices, dtype="int64") + 1] - starts
+    stepIndptr = np.zeros(len(indices) + 1, dtype="int64")
+    np.cumsum(sizes, out=stepIndptr[1:])
+    steps = (np.arange(stepIndptr[-1], dtype="int64") -
+             np.repeat(stepIndptr[:-1] - starts, sizes))
+    return ObjectBatch(objectNames, stepIndptr, self.sensations.take(steps))
+
+
+  def addNoise(self, featureNoise=None, locationNoise=None, rng=None):
+    """
+    Return a new batch with noise added to every sensation. See
+    SDRBatch.addNoise.
+    """
+    return ObjectBatch(self.objectNames, self.stepIndptr,
+                       self.sensations.addNoise(featureNoise, locationNoise,
+                                                rng))
+
+
+  def save(self, directory):
+    """
+    Save the batch as .npy files in the given directory.
+    """
+    _makeDirectory(directory)
+    self.sensations.save(os.path.join(directory, "sensations"))
+    np.save(os.path.join(directory, "stepIndptr.npy"), self.stepIndptr)
+    with open(os.path.join(directory, "objects.json"), "w") as f:
+      json.dump({"objectNames": self.objectNames}, f)
+
+
+  @classmethod
+  def load(cls, directory, mmapMode="r"):
+    """
+    Load a batch saved with save(). See SDRBatch.load.
+    """
+    with open(os.path.join(directory, "objects.json"), "r") as f:
+      objectNames = json.load(f)["objectNames"]
+    return cls(objectNames,
+               np.load(os.path.join(directory, "stepIndptr.npy")),
+               SensationBatch.load(os.path.join(directory, "sensations"),
+                                   mmapMode))
+
+
+
+def _makeDirectory(directory):
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
@@ -28,7 +28,7 @@ import matplotlib.cm as cm
 import matplotlib as mpl
 
 from htmresearch.frameworks.sp_paper.sp_metrics import (
-calculateInputOverlapMat, percentOverlap
+calculateInputOverlapMat, percentOverlap, computeSPOutputs
 )
 from nupic.bindings.math import GetNTAReal
 
@@ -286,25 +286,25 @@ def runSPOnBatch(sp, inputVectors, learn, sdrOrders=None, verbose=0):
   if sdrOrders is None:
     sdrOrders = range(numInputVector)
 
+  if not learn:
+    outputColumns = np.zeros((numInputVector, numColumns), dtype=uintType)
+    outputColumns[sdrOrders] = computeSPOutputs(sp, inputVectors[sdrOrders])
+    return outputColumns, np.ones((numColumns,), dtype=realDType)
+
   outputColumns = np.zeros((numInputVector, numColumns), dtype=uintType)
-  if learn:
-    avgBoostFactors = np.zeros((numColumns,), dtype=realDType)
-  else:
-    avgBoostFactors = np.ones((numColumns,), dtype=realDType)
+  avgBoostFactors = np.zeros((numColumns,), dtype=realDType)
 
   for i in range(numInputVector):
     sp.compute(inputVectors[sdrOrders[i]][:], learn, outputColumns[sdrOrders[i]][:])
-    if learn:
-      boostFactors = np.zeros((numColumns,), dtype=realDType)
-      sp.getBoostFactors(boostFactors)
-      avgBoostFactors += boostFactors
+    boostFactors = np.zeros((numColumns,), dtype=realDType)
+    sp.getBoostFactors(boostFactors)
+    avgBoostFactors += boostFactors
 
     if verbose > 0:
       if i % 200 == 0:
         print "{} % finished".format(100 * float(i) / float(numInputVector))
 
-  if learn:
-    avgBoostFactors = avgBoostFactors/numInputVector
+  avgBoostFactors = avgBoostFactors/numInputVector
   return outputColumns, avgBoostFactors
 
 
@@ -324,21 +324,28 @@ def runDiscriminationTest(sp, inputVectors, numPairs=100):
   overlaps = np.zeros(numPairs)
   mergedOverlaps = np.zeros(numPairs)
 
+  pairs = np.zeros((numPairs, 2), dtype="int64")
   for a in range(numPairs):
-    outputColumns = np.zeros((3, numColumns), dtype=uintType)
-    i = np.random.randint(numInputVector)
-    j = np.random.randint(numInputVector)
-    sp.compute(inputVectors[i][:], False, outputColumns[0][:])
-    sp.compute(inputVectors[j][:], False, outputColumns[1][:])
-
-    mergedInput = inputVectors[j][:].copy()
-    mergedInput[inputVectors[i][:].nonzero()[0]] = 1
-    sp.compute(mergedInput, False, outputColumns[2][:])
-
-    overlaps[a] = outputColumns[1].dot(outputColumns[0])
-    mergedOverlaps[a] = (outputColumns[1].dot(outputColumns[2]) +
-                         outputColumns[0].dot(outputColumns[2]))/2.0
-    sparsity[a] = (outputColumns[1].sum() + outputColumns[0].sum())/2.0
+    pairs[a, 0] = np.random.randint(numInputVector)
+    pairs[a, 1] = np.random.randint(numInputVector)
+  i = pairs[:, 0]
+  j = pairs[:, 1]
+
+  mergedInputs = inputVectors[j].copy()
+  mergedInputs[inputVectors[i].nonzero()] = 1
+
+  # The outputs for input i, input j and the merged input of each pair.
+  outputColumns = computeSPOutputs(
+    sp, np.stack([inputVectors[i], inputVectors[j], mergedInputs],
+                 axis=1).reshape(3 * numPairs, inputSize))
+  outputColumns = outputColumns.reshape(numPairs, 3, numColumns)
+
+  overlaps = (outputColumns[:, 1] * outputColumns[:, 0]).sum(axis=1)
+  mergedOverlaps = ((outputColumns[:, 1] * outputColumns[:, 2]).sum(axis=1) +
+                    (outputColumns[:, 0] * outputColumns[:, 2]).sum(axis=1)
+                    ) / 2.0
+  sparsity = (outputColumns[:, 1].sum(axis=1) +
+              outputColumns[:, 0].sum(axis=1)) / 2.0
 
   print "Mean/stdev overlap:",overlaps.mean(),overlaps.std()
   print "Mean/stdev merged overlap:",mergedOverlaps.mean(),mergedOverlaps.std()
@@ -0,0 +1,110 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Helpers for passing sparse index lists over Network API links.
+
+The Network API only moves fixed-size buffers between regions, so a sparse
+link buffer for a layer of N cells has N + 1 elements: the first element is the
+number of active cells and it's followed by their sorted indices. Regions that
+are created with "sparseLinks" enabled read and write their inputs and outputs
+in this format, so each compute only touches the active cells instead of
+scanning and clearing dense 0/1 arrays.
+
+Link buffers are Real32 so that sparse regions can still be linked to regions
+with dense Real32 inputs. Real32 represents every index below 2**24 exactly.
+"""
+
+import numpy as np
+
+
+
+def getSparseOutputWidth(width):
+  """
+  Return the size of a sparse link buffer for a layer of 'width' cells.
+  """
+  return width + 1
+
+
+def setSparseOutput(output, indices):
+  """
+  Write a list of active cells into a sparse link buffer.
+
+  @param output (numpy array)
+  The region output buffer, created with getSparseOutputWidth elements
+
+  @param indices (numpy array)
+  The active cells, in any order
+  """
+  numActive = len(indices)
+  output[0] = numActive
+  output[1:numActive + 1] = np.sort(indices)
+
+
+def clearSparseOutput(output):
+  """
+  Mark a sparse link buffer as empty.
+  """
+  output[0] = 0
+
+
+def getSparseInput(inputArray):
+  """
+  Read the active cells from a sparse link buffer.
+
+  @param inputArray (numpy array)
+  A region input linked to a sparse output
+
+  @return (numpy array)
+  Sorted uint32 indices
+  """
+  return np.asarray(inputArray[1:int(inputArray[0]) + 1], dtype="uint32")
+
+
+def getSparseInputs(inputArray, numInputs):
+  """
+  Read the active cells from an input that concatenates 'numInputs' equally
+  sized sparse link buffers, e.g. the lateral input of a ColumnPoolerRegion.
+
+  @return (tuple of numpy arrays)
+  Sorted uint32 indices for each link, relative to that link's layer
+  """
+  return tuple(getSparseInput(singleInput)
+               for singleInput in np.split(inputArray, numInputs))
+
+
+def sparseToDense(inputArray, width=None):
+  """
+  Convert a sparse link buffer into a dense 0/1 array, for consumers that only
+  understand dense inputs.
+
+  @param inputArray (numpy array)
+  A sparse link buffer
+
+  @param width (int or None)
+  The layer size. Defaults to the size implied by the buffer.
+  """
+  if width is None:
+    width = len(inputArray) - 1
+
+  dense = np.zeros(width, dtype="float32")
+  dense[getSparseInput(inputArray)] = 1
+  return dense
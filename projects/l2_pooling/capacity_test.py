@@ -44,6 +44,7 @@ from htmresearch.frameworks.layers.object_machine_factory import (
   createObjectMachine
 )
 from htmresearch.frameworks.layers.l2_l4_inference import L4L2Experiment
+from htmresearch.support.model_cache import ModelCache
 
 import matplotlib as mpl
 
@@ -441,7 +442,9 @@ def runCapacityTest(numObjects,
                     l4Params,
                     objectParams,
                     networkType = "MultipleL4L2Columns",
-                    repeat=0):
+                    repeat=0,
+                    modelCacheDir=None,
+                    modelCacheMaxBytes=None):
   """
   Generate [numObjects] objects with [numPointsPerObject] points per object
   Train L4-l2 network all the objects with single pass learning
@@ -452,6 +455,9 @@ def runCapacityTest(numObjects,
   :param sampleSize:
   :param activationThreshold:
   :param numCorticalColumns:
+  :param modelCacheDir: directory of a ModelCache to load the trained network
+                        from, or to save it to after training
+  :param modelCacheMaxBytes: size limit of the model cache, None for no limit
   :return:
   """
   l4ColumnCount = l4Params["columnCount"]
@@ -475,16 +481,16 @@ def runCapacityTest(numObjects,
     numFeatures=numFeatures
   )
 
-  exp = L4L2Experiment("capacity_two_objects",
-                       numInputBits=numInputBits,
-                       L2Overrides=l2Params,
-                       L4Overrides=l4Params,
-                       inputSize=l4ColumnCount,
-                       networkType = networkType,
-                       externalInputSize=externalInputSize,
-                       numLearningPoints=3,
-                       numCorticalColumns=numCorticalColumns,
-                       objectNamesAreIndices=True)
+  experimentArgs = dict(name="capacity_two_objects",
+                        numInputBits=numInputBits,
+                        L2Overrides=l2Params,
+                        L4Overrides=l4Params,
+                        inputSize=l4ColumnCount,
+                        networkType = networkType,
+                        externalInputSize=externalInputSize,
+                        numLearningPoints=3,
+                        numCorticalColumns=numCorticalColumns,
+                        objectNamesAreIndices=True)
 
   if objectParams["uniquePairs"]:
     pairs = createRandomObjects(
@@ -504,7 +510,18 @@ def runCapacityTest(numObjects,
   for object in pairs:
     objects.addObject(object)
 
-  exp.learnObjects(objects.provideObjectsToLearn())
+  objectsToLearn = objects.provideObjectsToLearn()
+
+  def train():
+    exp = L4L2Experiment(**experimentArgs)
+    exp.learnObjects(objectsToLearn)
+    return exp
+
+  if modelCacheDir is None:
+    exp = train()
+  else:
+    exp = ModelCache(modelCacheDir, maxBytes=modelCacheMaxBytes).getOrTrain(
+      {"experiment": experimentArgs, "objects": objectsToLearn}, train)
 
   testResult = testOnSingleRandomSDR(objects, exp, 100, repeat)
   return testResult
@@ -520,7 +537,9 @@ def runCapacityTestVaryingObjectSize(
     cpuCount=None,
     l2Params=None,
     l4Params=None,
-    objectParams=None):
+    objectParams=None,
+    modelCacheDir=None,
+    modelCacheMaxBytes=None):
   """
   Runs experiment with two objects, varying number of points per object
   """
@@ -539,7 +558,10 @@ def runCapacityTestVaryingObjectSize(
              l2Params,
              l4Params,
              objectParams,
-             0)
+             "MultipleL4L2Columns",
+             0,
+             modelCacheDir,
+             modelCacheMaxBytes)
             for numPointsPerObject in np.arange(10, 160, 20)]
 
   for testResult in pool.map(invokeRunCapacityTest, params):
@@ -574,7 +596,9 @@ def runCapacityTestVaryingObjectNum(numPointsPerObject=10,
                                     l4Params=None,
                                     objectParams=None,
                                     networkType="MultipleL4L2Columns",
-                                    numRpts=1):
+                                    numRpts=1,
+                                    modelCacheDir=None,
+                                    modelCacheMaxBytes=None):
   """
   Run experiment with fixed number of pts per object, varying number of objects
   """
@@ -596,7 +620,9 @@ def runCapacityTestVaryingObjectNum(numPointsPerObject=10,
                      l4Params,
                      objectParams,
                      networkType,
-                     rpt))
+                     rpt,
+                     modelCacheDir,
+                     modelCacheMaxBytes))
   result = None
   for testResult in pool.map(invokeRunCapacityTest, params):
     result = (
@@ -626,7 +652,9 @@ def runCapacityTestWrapperNonParallel(numPointsPerObject=10,
                                       l4Params=None,
                                       objectParams=None,
                                       networkType="MultipleL4L2Columns",
-                                      rpt=0):
+                                      rpt=0,
+                                      modelCacheDir=None,
+                                      modelCacheMaxBytes=None):
   """
   Run experiment with fixed number of pts per object, varying number of objects
   """
@@ -641,7 +669,9 @@ def runCapacityTestWrapperNonParallel(numPointsPerObject=10,
                                l4Params,
                                objectParams,
                                networkType,
-                               rpt)
+                               rpt,
+                               modelCacheDir,
+                               modelCacheMaxBytes)
 
 
   resultFileName = _prepareResultsDir("{}.csv".format(expName),
@@ -663,7 +693,9 @@ def runExperiment1(numObjects=2,
                    numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
                    resultDirName=DEFAULT_RESULT_DIR_NAME,
                    plotDirName=DEFAULT_PLOT_DIR_NAME,
-                   cpuCount=None):
+                   cpuCount=None,
+                   modelCacheDir=None,
+                   modelCacheMaxBytes=None):
   """
   Varying number of pts per objects, two objects
   Try different sample sizes
@@ -693,7 +725,9 @@ def runExperiment1(numObjects=2,
                                      cpuCount,
                                      l2Params,
                                      l4Params,
-                                     objectParams=objectParams)
+                                     objectParams=objectParams,
+                                     modelCacheDir=modelCacheDir,
+                                     modelCacheMaxBytes=modelCacheMaxBytes)
 
   ploti = 0
   fig, ax = plt.subplots(2, 2)
@@ -735,7 +769,9 @@ def runExperiment1(numObjects=2,
 def runExperiment2(numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
                    resultDirName=DEFAULT_RESULT_DIR_NAME,
                    plotDirName=DEFAULT_PLOT_DIR_NAME,
-                   cpuCount=None):
+                   cpuCount=None,
+                   modelCacheDir=None,
+                   modelCacheMaxBytes=None):
   """
   runCapacityTestVaryingObjectNum()
   Try different sample sizes
@@ -767,7 +803,9 @@ def runExperiment2(numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
                                     cpuCount,
                                     l2Params,
                                     l4Params,
-                                    objectParams)
+                                    objectParams,
+                                    modelCacheDir=modelCacheDir,
+                                    modelCacheMaxBytes=modelCacheMaxBytes)
 
   # plot result
   ploti = 0
@@ -817,7 +855,9 @@ def runExperiment2(numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
 def runExperiment3(numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
                    resultDirName=DEFAULT_RESULT_DIR_NAME,
                    plotDirName=DEFAULT_PLOT_DIR_NAME,
-                   cpuCount=None):
+                   cpuCount=None,
+                   modelCacheDir=None,
+                   modelCacheMaxBytes=None):
   """
   runCapacityTestVaryingObjectNum()
   Try different L4 network size
@@ -874,7 +914,9 @@ def runExperiment3(numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
                                     l4Params,
                                     objectParams,
                                     "MultipleL4L2Columns",
-                                    numRpts)
+                                    numRpts,
+                                    modelCacheDir=modelCacheDir,
+                                    modelCacheMaxBytes=modelCacheMaxBytes)
 
   # plot result
   ploti = 0
@@ -923,7 +965,9 @@ def runExperiment3(numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
 
 def runExperiment4(resultDirName=DEFAULT_RESULT_DIR_NAME,
                    plotDirName=DEFAULT_PLOT_DIR_NAME,
-                   cpuCount=None):
+                   cpuCount=None,
+                   modelCacheDir=None,
+                   modelCacheMaxBytes=None):
   """
   runCapacityTestVaryingObjectNum()
   varying number of cortical columns
@@ -982,7 +1026,9 @@ def runExperiment4(resultDirName=DEFAULT_RESULT_DIR_NAME,
                                     l4Params,
                                     objectParams,
                                     "MultipleL4L2Columns",
-                                    numRpts)
+                                    numRpts,
+                                    modelCacheDir=modelCacheDir,
+                                    modelCacheMaxBytes=modelCacheMaxBytes)
 
   # plot result
   ploti = 0
@@ -1027,7 +1073,9 @@ def runExperiment4(resultDirName=DEFAULT_RESULT_DIR_NAME,
 
 def runExperiment5(resultDirName=DEFAULT_RESULT_DIR_NAME,
                    plotDirName=DEFAULT_PLOT_DIR_NAME,
-                   cpuCount=None):
+                   cpuCount=None,
+                   modelCacheDir=None,
+                   modelCacheMaxBytes=None):
   """
   varying size of L2
   calculate capacity by varying number of objects with fixed size
@@ -1089,7 +1137,9 @@ def runExperiment5(resultDirName=DEFAULT_RESULT_DIR_NAME,
                                     l4Params,
                                     objectParams,
                                     "MultipleL4L2Columns",
-                                    numRpts)
+                                    numRpts,
+                                    modelCacheDir=modelCacheDir,
+                                    modelCacheMaxBytes=modelCacheMaxBytes)
 
   # plot result
   ploti = 0
@@ -1134,7 +1184,9 @@ def runExperiment5(resultDirName=DEFAULT_RESULT_DIR_NAME,
 
 def runExperiment6(resultDirName=DEFAULT_RESULT_DIR_NAME,
                    plotDirName=DEFAULT_PLOT_DIR_NAME,
-                   cpuCount=None):
+                   cpuCount=None,
+                   modelCacheDir=None,
+                   modelCacheMaxBytes=None):
   """
   varying size of L2
   calculate capacity by varying number of objects with fixed size
@@ -1200,7 +1252,9 @@ def runExperiment6(resultDirName=DEFAULT_RESULT_DIR_NAME,
                                     l4Params,
                                     objectParams,
                                     "MultipleL4L2Columns",
-                                    numRpts)
+                                    numRpts,
+                                    modelCacheDir=modelCacheDir,
+                                    modelCacheMaxBytes=modelCacheMaxBytes)
 
   # plot result
   ploti = 0
@@ -1245,7 +1299,9 @@ def runExperiment6(resultDirName=DEFAULT_RESULT_DIR_NAME,
 def runExperiment7(numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
                    resultDirName=DEFAULT_RESULT_DIR_NAME,
                    plotDirName=DEFAULT_PLOT_DIR_NAME,
-                   cpuCount=None):
+                   cpuCount=None,
+                   modelCacheDir=None,
+                   modelCacheMaxBytes=None):
   """
   runCapacityTestVaryingObjectNum()
   Try different numLocations
@@ -1304,7 +1360,9 @@ def runExperiment7(numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
                                     l4Params,
                                     objectParams,
                                     "MultipleL4L2Columns",
-                                    numRpts)
+                                    numRpts,
+                                    modelCacheDir=modelCacheDir,
+                                    modelCacheMaxBytes=modelCacheMaxBytes)
 
   # plot result
   ploti = 0
@@ -1353,7 +1411,9 @@ def runExperiment7(numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
 def runExperiment8(numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
                    resultDirName=DEFAULT_RESULT_DIR_NAME,
                    plotDirName=DEFAULT_PLOT_DIR_NAME,
-                   cpuCount=None):
+                   cpuCount=None,
+                   modelCacheDir=None,
+                   modelCacheMaxBytes=None):
   """
   runCapacityTestVaryingObjectNum()
   Try different numFeatures
@@ -1412,7 +1472,9 @@ def runExperiment8(numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
                                     l4Params,
                                     objectParams,
                                     "MultipleL4L2Columns",
-                                    numRpts)
+                                    numRpts,
+                                    modelCacheDir=modelCacheDir,
+                                    modelCacheMaxBytes=modelCacheMaxBytes)
 
   # plot result
   ploti = 0
@@ -1460,7 +1522,9 @@ def runExperiment8(numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
 
 def runExperiment9(resultDirName=DEFAULT_RESULT_DIR_NAME,
                    plotDirName=DEFAULT_PLOT_DIR_NAME,
-                   cpuCount=None):
+                   cpuCount=None,
+                   modelCacheDir=None,
+                   modelCacheMaxBytes=None):
   """
   runCapacityTestVaryingObjectNum()
   varying number of cortical columns, 2d topology.
@@ -1537,7 +1601,9 @@ def runExperiment9(resultDirName=DEFAULT_RESULT_DIR_NAME,
                            l4Params,
                            objectParams,
                            networkType,
-                           rpt))
+                           rpt,
+                           modelCacheDir,
+                           modelCacheMaxBytes))
 
   pool = multiprocessing.Pool(cpuCount or multiprocessing.cpu_count(), maxtasksperchild=1)
   pool.map(invokeRunCapacityTestWrapper, run_params, chunksize = 1)
@@ -1592,7 +1658,9 @@ def runExperiment9(resultDirName=DEFAULT_RESULT_DIR_NAME,
 def runExperiment10(numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
                    resultDirName=DEFAULT_RESULT_DIR_NAME,
                    plotDirName=DEFAULT_PLOT_DIR_NAME,
-                   cpuCount=1):
+                   cpuCount=1,
+                   modelCacheDir=None,
+                   modelCacheMaxBytes=None):
   """
   Try different L4 network size
   """
@@ -1656,7 +1724,9 @@ def runExperiment10(numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
                                     l4Params,
                                     objectParams,
                                     "MultipleL4L2Columns",
-                                    numRpts)
+                                    numRpts,
+                                    modelCacheDir=modelCacheDir,
+                                    modelCacheMaxBytes=modelCacheMaxBytes)
 
   # plot result
   ploti = 0
@@ -1702,7 +1772,8 @@ def runExperiment10(numCorticalColumns=DEFAULT_NUM_CORTICAL_COLUMNS,
   )
 
 
-def runExperiments(resultDirName, plotDirName, cpuCount):
+def runExperiments(resultDirName, plotDirName, cpuCount, modelCacheDir=None,
+                   modelCacheMaxBytes=None):
 #  # Varying number of pts per objects, two objects
 #  runExperiment1(numCorticalColumns=1,
 #                 resultDirName=resultDirName,
@@ -1724,7 +1795,9 @@ def runExperiments(resultDirName, plotDirName, cpuCount):
  # 10 pts per object, varying number of objects and number of columns
  runExperiment4(resultDirName=resultDirName,
                 plotDirName=plotDirName,
-                cpuCount=cpuCount)
+                cpuCount=cpuCount,
+                modelCacheDir=modelCacheDir,
+                modelCacheMaxBytes=modelCacheMaxBytes)
 
 #  # 10 pts per object, varying number of L2 cells
 #  runExperiment5(resultDirName=resultDirName,
@@ -1782,12 +1855,29 @@ if __name__ == "__main__":
     metavar="NUM",
     help="Limit number of cpu cores.  Defaults to `multiprocessing.cpu_count()`"
   )
+  parser.add_argument(
+    "--modelCacheDir",
+    default=None,
+    type=str,
+    metavar="DIRECTORY",
+    help="Load trained networks from this directory, or save them there "
+         "after training"
+  )
+  parser.add_argument(
+    "--modelCacheMaxBytes",
+    default=None,
+    type=int,
+    metavar="NUM",
+    help="Size limit of the model cache"
+  )
 
   opts = parser.parse_args()
 
   # runExperiments(resultDirName=opts.resultDirName,
   #                plotDirName=opts.plotDirName,
-  #                cpuCount=opts.cpuCount)
+  #                cpuCount=opts.cpuCount,
+  #                modelCacheDir=opts.modelCacheDir,
+  #                modelCacheMaxBytes=opts.modelCacheMaxBytes)
 
 
 
@@ -1808,4 +1898,6 @@ if __name__ == "__main__":
                       l4Params,
                       objectParams,
                       networkType = "MultipleL4L2Columns",
-                      repeat=0)
\ No newline at end of file
+                      repeat=0,
+                      modelCacheDir=opts.modelCacheDir,
+                      modelCacheMaxBytes=opts.modelCacheMaxBytes)
\ No newline at end of file
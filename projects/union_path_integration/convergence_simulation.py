@@ -41,6 +41,7 @@ from htmresearch.frameworks.location.path_integration_union_narrowing import (
   PIUNCorticalColumn, PIUNExperiment, PIUNExperimentMonitor)
 from htmresearch.frameworks.location.two_layer_tracing import (
   PIUNVisualizer as trace, PIUNLogger as rawTrace)
+from htmresearch.support.model_cache import ModelCache
 
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 
@@ -92,7 +93,9 @@ def doExperiment(locationModuleWidth,
                  thresholds,
                  seed1,
                  seed2,
-                 anchoringMethod):
+                 anchoringMethod,
+                 modelCacheDir=None,
+                 modelCacheMaxBytes=None):
   """
   Learn a set of objects. Then try to recognize each object. Output an
   interactive visualization.
@@ -102,6 +105,13 @@ def doExperiment(locationModuleWidth,
 
   @param cellCoordinateOffsets (sequence)
   The "cellCoordinateOffsets" parameter for each module
+
+  @param modelCacheDir (str or None)
+  Directory of a ModelCache for the trained networks. Experiments that only
+  differ by their inference parameters, e.g. the noise factors, share them.
+
+  @param modelCacheMaxBytes (int or None)
+  Size limit of the model cache
   """
   if not os.path.exists("traces"):
     os.makedirs("traces")
@@ -167,15 +177,32 @@ def doExperiment(locationModuleWidth,
     "cellsPerColumn": 16,
   }
 
-  column = PIUNCorticalColumn(locationConfigs, L4Overrides=l4Overrides,
-                              bumpType=bumpType)
-  exp = PIUNExperiment(column, featureNames=features,
-                       numActiveMinicolumns=10,
-                       noiseFactor=noiseFactor,
-                       moduleNoiseFactor=moduleNoiseFactor)
+  def train():
+    column = PIUNCorticalColumn(locationConfigs, L4Overrides=l4Overrides,
+                                bumpType=bumpType)
+    exp = PIUNExperiment(column, featureNames=features,
+                         numActiveMinicolumns=10)
+
+    for objectDescription in objects:
+      exp.learnObject(objectDescription)
+
+    return exp
 
-  for objectDescription in objects:
-    exp.learnObject(objectDescription)
+  if modelCacheDir is None:
+    exp = train()
+  else:
+    exp = ModelCache(modelCacheDir, maxBytes=modelCacheMaxBytes).getOrTrain({
+      "locationConfigs": locationConfigs,
+      "L4Overrides": l4Overrides,
+      "bumpType": bumpType,
+      "features": features,
+      "objects": objects,
+    }, train)
+  column = exp.column
+
+  # Noise is only used during inference.
+  exp.noiseFactor = noiseFactor
+  exp.moduleNoiseFactor = moduleNoiseFactor
 
   convergence = collections.defaultdict(int)
 
@@ -350,6 +377,10 @@ if __name__ == "__main__":
   parser.add_argument("--repeat", type=int, default=1)
   parser.add_argument("--appendResults", action="store_true")
   parser.add_argument("--numWorkers", type=int, default=cpu_count())
+  parser.add_argument("--modelCacheDir", type=str, default=None,
+                      help="Load trained networks from this directory, or "
+                           "save them there after training.")
+  parser.add_argument("--modelCacheMaxBytes", type=int, default=None)
 
   args = parser.parse_args()
 
@@ -382,4 +413,6 @@ if __name__ == "__main__":
     anchoringMethod=args.anchoringMethod,
     seed1=args.seed1,
     seed2=args.seed2,
+    modelCacheDir=args.modelCacheDir,
+    modelCacheMaxBytes=args.modelCacheMaxBytes,
   )
@@ -0,0 +1,103 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Check the ApicalTiebreakTemporalMemory segment activity against two separate
+computeActivity passes.
+"""
+
+import unittest
+
+import numpy as np
+
+from nupic.bindings.math import Random, SparseMatrixConnections
+
+from htmresearch.algorithms.apical_tiebreak_temporal_memory import (
+  ApicalTiebreakTemporalMemory)
+
+
+class SegmentActivityTest(unittest.TestCase):
+
+  def setUp(self):
+    self.rng = np.random.RandomState(42)
+    self.connections = SparseMatrixConnections(2000, 500)
+    segments = self.connections.createSegments(
+      self.rng.randint(2000, size=4000).astype("uint32"))
+    for chunk in np.array_split(segments, 40):
+      self.connections.growSynapsesToSample(
+        chunk, self.rng.choice(500, 80, replace=False).astype("uint32"), 20,
+        0.45, Random(42))
+    self.connections.adjustSynapses(
+      segments[::2], self.rng.choice(500, 250, replace=False).astype("uint32"),
+      0.1, 0.0)
+
+
+  def _expected(self, activeInput, connectedPermanence):
+    return (self.connections.computeActivity(activeInput, connectedPermanence),
+            self.connections.computeActivity(activeInput))
+
+
+  def testComputeOverlaps(self):
+    # A small input uses the candidate submatrix, a large one the full pass.
+    for numActive in (10, 40, 400):
+      activeInput = np.sort(self.rng.choice(500, numActive, replace=False))
+      overlaps, potentialOverlaps = self._expected(activeInput, 0.5)
+
+      for threshold in (1, 3, 6):
+        (candidateSegments,
+         candidateOverlaps,
+         actualPotentialOverlaps) = ApicalTiebreakTemporalMemory._computeOverlaps(
+           self.connections, activeInput, 0.5, threshold)
+
+        np.testing.assert_equal(actualPotentialOverlaps, potentialOverlaps)
+        np.testing.assert_equal(candidateSegments,
+                                np.flatnonzero(potentialOverlaps >= threshold))
+        np.testing.assert_equal(candidateOverlaps,
+                                overlaps[candidateSegments])
+
+
+  def testBasalSegmentActivityWithReducedThreshold(self):
+    activeInput = np.sort(self.rng.choice(500, 40, replace=False))
+    overlaps, potentialOverlaps = self._expected(activeInput, 0.5)
+    reducedBasalThresholdCells = np.arange(0, 2000, 3)
+
+    (activeSegments,
+     matchingSegments,
+     actualPotentialOverlaps) = (
+       ApicalTiebreakTemporalMemory._calculateBasalSegmentActivity(
+         self.connections, activeInput, reducedBasalThresholdCells, 0.5,
+         activationThreshold=5, minThreshold=3, reducedBasalThreshold=3))
+
+    conditional = np.flatnonzero((overlaps >= 3) & (overlaps < 5))
+    conditional = conditional[np.in1d(
+      self.connections.mapSegmentsToCells(conditional),
+      reducedBasalThresholdCells)]
+    np.testing.assert_equal(
+      activeSegments,
+      np.concatenate((np.flatnonzero(overlaps >= 5), conditional)))
+    np.testing.assert_equal(matchingSegments,
+                            np.flatnonzero(potentialOverlaps >= 3))
+    np.testing.assert_equal(actualPotentialOverlaps, potentialOverlaps)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,88 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2018, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Check the blocked HierarchicalClustering overlaps against the pairwise
+overlaps of the rows.
+"""
+
+import unittest
+
+import numpy as np
+import scipy.sparse
+
+from htmresearch.algorithms.hierarchical_clustering import (
+  HierarchicalClustering)
+
+
+
+def _pairwiseOverlaps(data, selfOverlaps):
+  """
+  The overlaps of every pair of rows, one row at a time.
+  """
+  data = (np.asarray(data) != 0).astype("int64")
+  overlaps = []
+  for i in xrange(data.shape[0]):
+    start = i if selfOverlaps else i + 1
+    overlaps.extend(data[start:].dot(data[i]))
+  return np.array(overlaps)
+
+
+
+class ComputeOverlapsTest(unittest.TestCase):
+
+  def setUp(self):
+    rng = np.random.RandomState(42)
+    data = (rng.rand(37, 200) < 0.1) * rng.randint(1, 4, size=(37, 200))
+    data[5] = 0
+    self.data = data
+
+
+  def testMatchesPairwiseOverlaps(self):
+    sparseData = scipy.sparse.csr_matrix(self.data)
+
+    for selfOverlaps in (False, True):
+      expected = _pairwiseOverlaps(self.data, selfOverlaps)
+
+      # One row per block, uneven blocks, and a single block
+      for maxBlockSize in (1, 37 * 5, 2**24):
+        for numWorkers in (1, 3):
+          overlaps = HierarchicalClustering._computeOverlaps(
+            sparseData, selfOverlaps=selfOverlaps, maxBlockSize=maxBlockSize,
+            numWorkers=numWorkers)
+          np.testing.assert_array_equal(overlaps, expected)
+          self.assertEqual(overlaps.dtype, np.int16)
+
+
+  def testSmallInputs(self):
+    for numRows in (0, 1, 2):
+      data = self.data[:numRows]
+      for selfOverlaps in (False, True):
+        overlaps = HierarchicalClustering._computeOverlaps(
+          scipy.sparse.csr_matrix(data, shape=(numRows, 200)),
+          selfOverlaps=selfOverlaps)
+        np.testing.assert_array_equal(overlaps,
+                                      _pairwiseOverlaps(data, selfOverlaps))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
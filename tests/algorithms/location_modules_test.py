@@ -0,0 +1,82 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2018, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Check the ThresholdedGaussian2DLocationModule excitations that only evaluate
+the cells near each bump against getCellExcitations.
+"""
+
+import unittest
+
+import numpy as np
+
+from htmresearch.algorithms.location_modules import (
+  ThresholdedGaussian2DLocationModule)
+from htmresearch.frameworks.location.path_integration_union_narrowing import (
+  computeRatModuleParametersFromCellCount)
+
+
+
+class CellExcitationsTest(unittest.TestCase):
+
+  def _createModule(self, cellsPerAxis, bumpOverlapMethod):
+    params = computeRatModuleParametersFromCellCount(cellsPerAxis)
+    return ThresholdedGaussian2DLocationModule(
+      cellsPerAxis=cellsPerAxis, scale=20.0, orientation=0.3,
+      anchorInputSize=100, activeFiringRate=params["activeFiringRate"],
+      bumpSigma=params["bumpSigma"], bumpOverlapMethod=bumpOverlapMethod)
+
+
+  def testMatchesAllPairs(self):
+    rng = np.random.RandomState(42)
+
+    for cellsPerAxis in (6, 30):
+      for bumpOverlapMethod in ("probabilistic", "sum"):
+        module = self._createModule(cellsPerAxis, bumpOverlapMethod)
+        numCells = cellsPerAxis * cellsPerAxis
+
+        for bumpPhases in (np.empty((2, 0)),
+                           rng.rand(2, 1),
+                           rng.rand(2, 200),
+                           module.cellPhases[:, rng.choice(numCells, 20,
+                                                           replace=False)]):
+          expected = ThresholdedGaussian2DLocationModule.getCellExcitations(
+            module.cellPhases, bumpPhases, module.bumpSigma, bumpOverlapMethod)
+
+          module.bumpPhases = bumpPhases
+          module._computeActiveCells()
+
+          np.testing.assert_equal(
+            module.activeCells,
+            np.where(expected >= module.activeFiringRate)[0])
+          np.testing.assert_equal(
+            module.learningCells,
+            np.where(expected == expected.max())[0])
+
+          # Few pairs at a time
+          excitations = module._computeCellExcitations(maxPairs=50)
+          np.testing.assert_allclose(excitations, expected, rtol=0,
+                                     atol=1e-9)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
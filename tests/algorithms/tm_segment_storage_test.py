@@ -0,0 +1,260 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2018, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Check the TM segment activity computed from the flat segment storage against
+the per-synapse computation of the segments' synapses.
+"""
+
+import unittest
+
+import numpy
+
+from htmresearch.algorithms.TM import TM
+
+
+
+class PerSynapseTM(TM):
+  """
+  A TM that computes segment activities one synapse at a time from the
+  segments' synapse lists, like the TM did before the flat segment storage.
+  """
+
+  def getSegmentActivityLevel(self, seg, activeState,
+                              connectedSynapsesOnly=False):
+    activity = 0
+    for srcCellCol, srcCellIdx, perm in seg.syns:
+      if activeState[srcCellCol, srcCellIdx] == 1 and (
+          not connectedSynapsesOnly or perm >= self.connectedPerm):
+        activity += 1
+    return activity
+
+
+  def computePhase2(self, doLearn=False):
+    for c in xrange(self.numberOfCols):
+      for i in xrange(self.cellsPerColumn):
+        maxConfidence = 0
+        for s in self.cells[c][i]:
+          if self.isSegmentActive(s, self.activeState['t']):
+            self.predictedState['t'][c,i] = 1
+            maxConfidence = max(maxConfidence, s.dutyCycle(readOnly=True))
+
+            if doLearn:
+              s.totalActivations += 1
+              s.lastActiveIteration = self.iterationIdx
+              activeUpdate = self.getSegmentActiveSynapses(c,i,s,'t')
+              activeUpdate.phase1Flag = False
+              self.addToSegmentUpdates(c, i, activeUpdate)
+
+        self.confidence['t'][c,i] = maxConfidence
+
+
+  def getActiveSegment(self, c, i, timeStep):
+    bestActivation = self.activationThreshold
+    which = -1
+    for j, s in enumerate(self.cells[c][i]):
+      activity = self.getSegmentActivityLevel(s, self.activeState[timeStep],
+                                              connectedSynapsesOnly=True)
+      if activity >= bestActivation:
+        bestActivation = activity
+        which = j
+
+    return self.cells[c][i][which] if which != -1 else None
+
+
+  def getBestMatchingCell(self, c, activeState):
+    bestActivityInCol = self.minThreshold
+    bestSegIdxInCol = -1
+    bestCellInCol = -1
+
+    for i in xrange(self.cellsPerColumn):
+      maxSegActivity = 0
+      maxSegIdx = 0
+      for j, s in enumerate(self.cells[c][i]):
+        activity = self.getSegmentActivityLevel(s, activeState)
+        if activity > maxSegActivity:
+          maxSegActivity = activity
+          maxSegIdx = j
+
+      if maxSegActivity >= bestActivityInCol:
+        bestActivityInCol = maxSegActivity
+        bestSegIdxInCol = maxSegIdx
+        bestCellInCol = i
+
+    if bestCellInCol == -1:
+      return (None, None)
+    return bestCellInCol, self.cells[c][bestCellInCol][bestSegIdxInCol]
+
+
+  def getBestMatchingSegment(self, c, i, activeState):
+    maxActivity, which = self.minThreshold, -1
+    for j, s in enumerate(self.cells[c][i]):
+      activity = self.getSegmentActivityLevel(s, activeState)
+      if activity >= maxActivity:
+        maxActivity, which = activity, j
+
+    return self.cells[c][i][which] if which != -1 else None
+
+
+
+def _getSynapses(tm):
+  """
+  The synapses of every segment of every cell, with float32 permanences.
+  """
+  return [[[(srcCellCol, srcCellIdx, numpy.float32(perm))
+            for srcCellCol, srcCellIdx, perm in segment.syns]
+           for segment in tm.cells[c][i]]
+          for c in xrange(tm.numberOfCols)
+          for i in xrange(tm.cellsPerColumn)]
+
+
+
+class SegmentStorageTest(unittest.TestCase):
+
+  def _createTMs(self, **kwargs):
+    params = dict(numberOfCols=64, cellsPerColumn=4, activationThreshold=6,
+                  minThreshold=4, newSynapseCount=8, connectedPerm=0.5,
+                  initialPerm=0.51, globalDecay=0.0, seed=42)
+    params.update(kwargs)
+    return TM(**params), PerSynapseTM(**params)
+
+
+  def _createSequences(self, numColumns=64):
+    rng = numpy.random.RandomState(0)
+    return [[rng.choice(numColumns, 10, replace=False) for _ in xrange(10)]
+            for _ in xrange(5)]
+
+
+  def _runInLockstep(self, tms, numRepetitions, learn):
+    """
+    Feed the sequences to each TM, checking after each input that all the TMs
+    have the same states, and at the end that they have the same synapses.
+    """
+    for _ in xrange(numRepetitions):
+      for sequence in self._createSequences():
+        for pattern in sequence:
+          bottomUpInput = numpy.zeros(tms[0].numberOfCols, dtype="float32")
+          bottomUpInput[pattern] = 1
+          for tm in tms:
+            tm.compute(bottomUpInput, enableLearn=learn)
+
+          for tm in tms[1:]:
+            for stateName in ("activeState", "predictedState", "learnState",
+                              "confidence"):
+              numpy.testing.assert_array_equal(getattr(tm, stateName)["t"],
+                                               getattr(tms[0], stateName)["t"])
+
+        for tm in tms:
+          tm.reset()
+
+    for tm in tms[1:]:
+      self.assertEqual(_getSynapses(tm), _getSynapses(tms[0]))
+
+
+  def testLearnAndInferMatchPerSynapse(self):
+    tm, referenceTM = self._createTMs()
+
+    self._runInLockstep((tm, referenceTM), 5, learn=True)
+    self.assertGreater(tm.getNumSegments(), 0)
+
+    self._runInLockstep((tm, referenceTM), 2, learn=False)
+
+    for t in (tm, referenceTM):
+      t.trimSegments(minPermanence=0.5)
+    self.assertEqual(_getSynapses(tm), _getSynapses(referenceTM))
+    self._runInLockstep((tm, referenceTM), 2, learn=True)
+
+
+  def testGlobalDecayMatchesPerSynapse(self):
+    tm, referenceTM = self._createTMs(globalDecay=0.05, maxAge=2)
+
+    self._runInLockstep((tm, referenceTM), 6, learn=True)
+
+    # Segments were destroyed, and their rows were reused by new segments.
+    self.assertGreater(tm.getNumSegments(), 0)
+    self.assertLess(tm.getNumSegments(), tm.segID)
+
+    self._runInLockstep((tm, referenceTM), 2, learn=False)
+
+
+  def testApplyGlobalDecay(self):
+    tm, _ = self._createTMs()
+    self._runInLockstep((tm,), 4, learn=True)
+
+    tm.globalDecay = 0.3
+    tm.maxAge = 3
+    for _ in xrange(5):
+      tm.iterationIdx += 2
+
+      expected = []
+      for c in xrange(tm.numberOfCols):
+        for i in xrange(tm.cellsPerColumn):
+          cellSegments = []
+          for segment in tm.cells[c][i]:
+            syns = [(srcCellCol, srcCellIdx, numpy.float32(perm))
+                    for srcCellCol, srcCellIdx, perm in segment.syns]
+            if tm.iterationIdx - segment.lastActiveIteration > tm.maxAge:
+              syns = [(srcCellCol, srcCellIdx,
+                       numpy.float32(perm - numpy.float32(tm.globalDecay)))
+                      for srcCellCol, srcCellIdx, perm in syns]
+              syns = [syn for syn in syns if syn[2] > 0]
+            if len(syns) > 0:
+              cellSegments.append(syns)
+          expected.append(cellSegments)
+
+      tm.applyGlobalDecay()
+      self.assertEqual(_getSynapses(tm), expected)
+
+    self.assertEqual(tm.getNumSegments(), 0)
+
+
+  def testDestroyedSegmentActivity(self):
+    tm, referenceTM = self._createTMs()
+    self._runInLockstep((tm,), 4, learn=True)
+
+    c, i = next((c, i) for c in xrange(tm.numberOfCols)
+                for i in xrange(tm.cellsPerColumn)
+                if tm.cells[c][i] and tm.cells[c][i][-1]._slot != 0)
+    segment = tm.cells[c][i][-1]
+    slot = segment._slot
+    syns = segment.syns
+    tm._removeSegment(c, i, segment)
+
+    # A new segment reuses the row of the destroyed one.
+    tm.adaptSegment(TM.SegmentUpdate(c, i, None, [(0, 0), (1, 1), (2, 2)]),
+                    positiveReinforcement=True)
+    self.assertEqual(tm.cells[c][i][-1]._slot, slot)
+    self.assertEqual(segment.syns, syns)
+
+    rng = numpy.random.RandomState(42)
+    for _ in xrange(10):
+      activeState = (rng.rand(tm.numberOfCols, tm.cellsPerColumn) < 0.5)
+      activeState = activeState.astype("int8")
+      for connectedSynapsesOnly in (False, True):
+        self.assertEqual(
+          tm.getSegmentActivityLevel(segment, activeState,
+                                     connectedSynapsesOnly),
+          referenceTM.getSegmentActivityLevel(segment, activeState,
+                                              connectedSynapsesOnly))
+
+
+if __name__ == "__main__":
+  unittest.main()
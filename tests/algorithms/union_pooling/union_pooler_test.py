@@ -25,6 +25,8 @@ import unittest
 import numpy
 
 from htmresearch.algorithms.union_temporal_pooler import UnionTemporalPooler
+from htmresearch.frameworks.union_temporal_pooling.activation.excite_functions.excite_functions_all import (
+  LogisticExciteFunction)
 
 
 
@@ -32,6 +34,16 @@ REAL_DTYPE = numpy.float32
 
 
 
+class FullSelectionUnionTemporalPooler(UnionTemporalPooler):
+  """
+  A Union Temporal Pooler that always selects the union SDR among all cells.
+  """
+
+  def _getMostActiveCells(self, changedCells=None):
+    return super(FullSelectionUnionTemporalPooler, self)._getMostActiveCells()
+
+
+
 class UnionTemporalPoolerTest(unittest.TestCase):
 
 
@@ -124,5 +136,173 @@ class UnionTemporalPoolerTest(unittest.TestCase):
     self.assertEquals(result[1], 4)
 
 
+  def testGetMostActiveCellsIncremental(self):
+    utp = self.unionTemporalPooler
+    utp._poolingActivation = numpy.array([0, 5, 2, 0, 1], dtype=REAL_DTYPE)
+    utp._maxUnionCells = 2
+    self.assertEqual(list(utp._getMostActiveCells()), [1, 2])
+
+    # Only the changed cells can displace the most active cells
+    utp._poolingActivation[3] += 3
+    self.assertEqual(list(utp._getMostActiveCells(numpy.array([3]))), [1, 3])
+    utp._poolingActivation[4] += 0.5
+    self.assertEqual(list(utp._getMostActiveCells(numpy.array([4]))), [1, 3])
+
+    # A new union size or activation array invalidates the previous most
+    # active cells
+    utp._maxUnionCells = 3
+    self.assertEqual(list(utp._getMostActiveCells(numpy.array([4]))), [1, 2, 3])
+    utp._poolingActivation = numpy.array([4, 0, 3, 0, 2], dtype=REAL_DTYPE)
+    self.assertEqual(list(utp._getMostActiveCells(numpy.array([4]))), [0, 2, 4])
+
+    # The incremental selection matches a full selection
+    rng = numpy.random.RandomState(7)
+    utp._poolingActivation = numpy.zeros(5, dtype=REAL_DTYPE)
+    for _ in xrange(20):
+      changedCells = numpy.unique(rng.randint(5, size=2))
+      utp._poolingActivation[changedCells] += rng.rand(len(changedCells))
+      incremental = list(utp._getMostActiveCells(changedCells))
+      self.assertEqual(incremental, list(utp._getMostActiveCells()))
+
+
+  def _checkComputeMatchesFullSelection(self, exciteFunction=None):
+    """
+    Check that compute finds the same union SDRs as a pooler that always
+    selects among all cells.
+    """
+    poolers = [cls(inputDimensions=(64, ),
+                   columnDimensions=(128, ),
+                   potentialRadius=64,
+                   potentialPct=0.5,
+                   globalInhibition=True,
+                   numActiveColumnsPerInhArea=8.0,
+                   stimulusThreshold=1,
+                   boostStrength=0.0,
+                   seed=42,
+                   maxUnionActivity=0.1,
+                   exciteFunctionType='Fixed',
+                   decayFunctionType='NoDecay')
+               for cls in (UnionTemporalPooler,
+                           FullSelectionUnionTemporalPooler)]
+    if exciteFunction is not None:
+      for pooler in poolers:
+        pooler._exciteFunction = exciteFunction
+
+    rng = numpy.random.RandomState(11)
+    unionSizes = set()
+    for step in xrange(40):
+      if step == 25:
+        for pooler in poolers:
+          pooler.reset()
+
+      activeInput = (rng.rand(64) < 0.2).astype("uint32")
+      predictedActiveInput = activeInput * (rng.rand(64) < 0.5).astype("uint32")
+      unionSDRs = [list(pooler.compute(activeInput, predictedActiveInput, True))
+                   for pooler in poolers]
+      self.assertEqual(unionSDRs[0], unionSDRs[1])
+      unionSizes.add(len(unionSDRs[0]))
+
+    # The union filled up, so cells competed for it
+    self.assertIn(poolers[0]._maxUnionCells, unionSizes)
+
+
+  def testComputeMatchesFullSelection(self):
+    self._checkComputeMatchesFullSelection()
+    self._checkComputeMatchesFullSelection(
+      LogisticExciteFunction(minValue=0, maxValue=20))
+
+
+  def testComputeMatchesFullSelectionWhenExciteLowersActivation(self):
+    self._checkComputeMatchesFullSelection(
+      LogisticExciteFunction(xMidpoint=3, minValue=-20, maxValue=10))
+
+
+  def testAdaptSynapsesBatch(self):
+    utp = self.unionTemporalPooler
+    numInputs = utp.getNumInputs()
+    numColumns = utp.getNumColumns()
+
+    perms = numpy.zeros((numColumns, numInputs), dtype=REAL_DTYPE)
+    potentials = numpy.zeros((numColumns, numInputs), dtype=REAL_DTYPE)
+    for column in xrange(numColumns):
+      utp.getPermanence(column, perms[column])
+      utp.getPotential(column, potentials[column])
+
+    # Small increments are trimmed after each update, so they don't add up
+    synPermTrimThreshold = utp.getSynPermTrimThreshold()
+    updates = [
+      (numpy.array([1, 0, 1, 1, 0]), numpy.array([0, 2, 3]), 0.03, 0.01),
+      (numpy.array([1, 0, 0, 0, 1]), numpy.array([1, 2]), 0.5, 0.0),
+      (numpy.array([0, 1, 1, 0, 0]), numpy.array([0, 3]),
+       synPermTrimThreshold * 0.6, 0.0),
+      (numpy.array([0, 1, 1, 0, 0]), numpy.array([0, 3]),
+       synPermTrimThreshold * 0.6, 0.0),
+      (numpy.array([1, 1, 1, 1, 1]), numpy.array([], dtype="uint32"), 0.1, 0.1),
+    ]
+
+    expected = perms.copy()
+    for inputVector, activeColumns, synPermActiveInc, synPermInactiveDec in updates:
+      permChanges = numpy.where(inputVector > 0, synPermActiveInc,
+                                -synPermInactiveDec).astype(REAL_DTYPE)
+      for column in activeColumns:
+        mask = potentials[column] > 0
+        expected[column, mask] += permChanges[mask]
+        expected[column, expected[column] < synPermTrimThreshold] = 0
+        expected[column] = numpy.minimum(expected[column], utp.getSynPermMax())
+
+    utp._adaptSynapsesBatch(
+      [(numpy.where(inputVector > 0)[0], activeColumns, synPermActiveInc,
+        synPermInactiveDec)
+       for inputVector, activeColumns, synPermActiveInc, synPermInactiveDec
+       in updates])
+
+    connected = numpy.zeros(numInputs, dtype="uint32")
+    for column in xrange(numColumns):
+      utp.getPermanence(column, perms[column])
+      utp.getConnectedSynapses(column, connected)
+      numpy.testing.assert_allclose(perms[column], expected[column])
+      numpy.testing.assert_array_equal(
+        connected, expected[column] >= utp.getSynPermConnected())
+
+
+
+  def testPredictedActiveInputHistory(self):
+    utp = UnionTemporalPooler(inputDimensions=(5, ),
+                              columnDimensions=(5, ),
+                              potentialRadius=16,
+                              potentialPct=0.9,
+                              globalInhibition=True,
+                              numActiveColumnsPerInhArea=2.0,
+                              stimulusThreshold=2,
+                              seed=42,
+                              historyLength=3)
+
+    self.assertEqual([list(indices)
+                      for indices in utp._getPredictedActiveInputHistory()],
+                     [[], [], []])
+
+    predictedActiveInputs = [[1, 0, 0, 0, 0],
+                             [0, 1, 0, 0, 1],
+                             [0, 0, 1, 0, 0],
+                             [0, 0, 0, 1, 0],
+                             [1, 1, 0, 0, 0]]
+    for predictedActiveInput in predictedActiveInputs:
+      utp.compute(numpy.ones(5, dtype=REAL_DTYPE),
+                  numpy.array(predictedActiveInput, dtype=REAL_DTYPE),
+                  True)
+
+    # Most recent first
+    self.assertEqual([list(indices)
+                      for indices in utp._getPredictedActiveInputHistory()],
+                     [[0, 1], [3], [2]])
+    self.assertEqual(list(utp._preActiveInput), [0, 1, 2, 3, 4])
+
+    utp.reset()
+    self.assertEqual([list(indices)
+                      for indices in utp._getPredictedActiveInputHistory()],
+                     [[], [], []])
+
+
+
 if __name__ == "__main__":
   unittest.main()
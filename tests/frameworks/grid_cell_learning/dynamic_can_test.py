@@ -0,0 +1,300 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2018, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Check the batched STDP updates of the dynamic CANs against the sum of the
+kernels over every pair of time steps, and the hardwired 2D weights against
+the distance between every pair of cells.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from htmresearch.frameworks.grid_cell_learning import DynamicCAN
+from htmresearch.frameworks.grid_cell_learning.DynamicCAN import (
+  Dynamic1DCAN, Dynamic2DCAN, computeHardwiredWeights2D, defaultSTDPKernel,
+  getHardwiredWeights2D, placeSTDPKernel, w_0)
+
+
+
+def _getKernelUpdates(connections, weights, history, onlineStep=None):
+  """
+  Sum the updates of the STDP kernels, one pair of time steps at a time.
+
+  :param connections: List of (name, pre, post, rate, kernel, kernelArgs,
+          transpose), where the weights of the connection are weights[name],
+          and are (post x pre) if transpose is True.
+  :param weights: Dict of the weights to update.
+  :param history: List of (time, activations) of the steps to learn from.
+  :param onlineStep: If None, learn from every pair of steps in history, in
+          time order.  Otherwise learn from the pairs of this step with each
+          step of history, in both directions.
+  """
+  if onlineStep is None:
+    pairs = [(history[j], history[i])
+             for i in xrange(len(history)) for j in xrange(i)]
+  else:
+    pairs = ([(onlineStep, step) for step in history] +
+             [(step, onlineStep) for step in history])
+
+  for name, pre, post, rate, kernel, kernelArgs, transpose in connections:
+    for (preTime, preActivations), (postTime, postActivations) in pairs:
+      update = kernel(rate * preActivations[pre], postActivations[post],
+                      postTime - preTime, *kernelArgs)
+      weights[name] += update.T if transpose else update
+
+
+
+class DynamicCANSTDPTest(unittest.TestCase):
+
+  def _runSTDP(self, can, getWeights, connections, times, seed=42):
+    """
+    Run stdpUpdate on random activations at the specified steps, then flush
+    the buffer, checking the weight updates against the kernel sums after each
+    call.
+    """
+    rng = np.random.RandomState(seed)
+    initial = dict((name, np.copy(w)) for name, w in getWeights().items())
+    expected = dict((name, np.copy(w)) for name, w in getWeights().items())
+    history = []
+
+    def checkWeights():
+      for name, w in getWeights().items():
+        np.testing.assert_allclose(w - initial[name],
+                                   expected[name] - initial[name],
+                                   rtol=1e-5, atol=1e-9)
+
+    for time in times:
+      activations = can.getSTDPActivations()
+      stepActivations = {}
+      for name, activation in activations.items():
+        activation[:] = rng.rand(len(activation))
+        stepActivations[name] = np.copy(activation)
+
+      can.stdpUpdate(time)
+      step = (time * can.dt, stepActivations)
+      _getKernelUpdates(connections, expected, history, onlineStep=step)
+      history = (history + [step])[-can.stdpWindow:]
+      checkWeights()
+
+    can.stdpUpdate(times[-1], clearBuffer=True)
+    _getKernelUpdates(connections, expected, history)
+    checkWeights()
+
+    # The most recent step stays in the buffer, so flushing again does nothing.
+    self.assertEqual(len(can.activationBuffer), 1)
+    can.stdpUpdate(times[-1], clearBuffer=True)
+    checkWeights()
+
+
+  def test1DMatchesKernelSums(self):
+    # Uneven time steps, so that each pair of the flush has its own dt.
+    times = [0, 1, 3, 4, 7, 8, 9, 13, 14, 16]
+
+    for onlyPlace in (False, True):
+      np.random.seed(42)
+      can = Dynamic1DCAN(numExcitatory=12, numInhibitory=10, numPlaces=8,
+                         learningRate=0.5, dt=0.004, stdpWindow=4,
+                         plotting=False, hardwireI=False)
+
+      placeRate = can.learningRate * can.learnFactorP * can.dt
+      rate = can.learningRate * can.learnFactorEI * can.dt
+      connections = [
+        ("PI", "P", "I", placeRate, placeSTDPKernel, (), False),
+        ("PEL", "P", "EL", placeRate, placeSTDPKernel, (), False),
+        ("PER", "P", "ER", placeRate, placeSTDPKernel, (), False),
+      ]
+      if not onlyPlace:
+        connections += [
+          ("ELI", "EL", "I", rate, defaultSTDPKernel, (False, True), False),
+          ("ERI", "ER", "I", rate, defaultSTDPKernel, (False, True), False),
+        ]
+
+      initialWeightsII = np.copy(can.weightsII)
+      getWeights = lambda: {"PI": can.weightsPI, "PEL": can.weightsPEL,
+                            "PER": can.weightsPER, "ELI": can.weightsELI,
+                            "ERI": can.weightsERI}
+      stdp = can.stdpUpdate
+      can.stdpUpdate = (lambda time, clearBuffer=False:
+                        stdp(time, clearBuffer, onlyPlace=onlyPlace))
+      self._runSTDP(can, getWeights, connections, times)
+      np.testing.assert_array_equal(can.weightsII, initialWeightsII)
+
+
+  def test2DMatchesKernelSums(self):
+    np.random.seed(42)
+    can = Dynamic2DCAN(numPlaces=6, learningRate=0.5, dt=0.004,
+                       dimensions=(3, 4), stdpWindow=3, plotting=False,
+                       movie=False, hardwireI=False, weightCacheDir=None)
+
+    # The 2D weights are (post-synaptic x pre-synaptic).
+    rate = can.learningRate * can.learnFactorP * can.dt
+    connections = [("PI", "P", "I", rate, placeSTDPKernel, (), True)]
+    getWeights = lambda: dict(
+      [("PI", can.weightsPI)] +
+      [("PE" + k, can.weightsPE[k]) for k in can.directions] +
+      [("EI" + k, can.weightsEI[k]) for k in can.directions] +
+      [("IE" + k, can.weightsIE[k]) for k in can.directions])
+    for k in can.directions:
+      connections += [
+        ("PE" + k, "P", k, rate, placeSTDPKernel, (), True),
+        ("EI" + k, k, "I", rate, defaultSTDPKernel, (), True),
+        ("IE" + k, "I", k, rate, defaultSTDPKernel, (), True),
+      ]
+
+    self._runSTDP(can, getWeights, connections, [0, 2, 3, 4, 6, 9, 10])
+
+
+
+
+def _getLoopWeights2D(dimensions, periodic):
+  """
+  Compute the hardwired 2D weights one pair of cells at a time.
+  """
+  numCells = dimensions[0]*dimensions[1]
+  weights = np.zeros((numCells, numCells))
+  for j in xrange(numCells):
+    jCoord = np.unravel_index(j, dimensions)
+    for i in xrange(numCells):
+      iCoord = np.unravel_index(i, dimensions)
+      distanceComponents = np.abs(np.asarray(iCoord) - np.asarray(jCoord))
+      if periodic:
+        distanceComponents = np.minimum(
+          distanceComponents, np.asarray(dimensions) - distanceComponents)
+      elif distanceComponents[0] + distanceComponents[1] > 20:
+        continue
+
+      weights[i, j] = 1000*w_0(distanceComponents*2)
+
+  return weights
+
+
+
+class HardwiredWeightsTest(unittest.TestCase):
+
+
+  def setUp(self):
+    self.cacheDir = tempfile.mkdtemp()
+
+
+  def tearDown(self):
+    shutil.rmtree(self.cacheDir)
+
+
+  def testNonPeriodicMatchesLoop(self):
+    # Big enough for some cells to be beyond the cutoff.
+    dimensions = (12, 15)
+    weights = computeHardwiredWeights2D(dimensions, periodic=False)
+    expected = _getLoopWeights2D(dimensions, periodic=False)
+
+    self.assertEqual(DynamicCAN.HARDWIRED_WEIGHTS_CUTOFF, 20)
+    self.assertTrue((expected == 0).any())
+    np.testing.assert_array_equal(weights, expected)
+
+
+  def testPeriodicMatchesLoop(self):
+    for dimensions in [(5, 7), (8, 8)]:
+      weights = computeHardwiredWeights2D(dimensions, periodic=True)
+      np.testing.assert_array_equal(
+        weights, _getLoopWeights2D(dimensions, periodic=True))
+
+
+  def testCache(self):
+    weights = getHardwiredWeights2D((4, 5), True, self.cacheDir)
+    filenames = os.listdir(self.cacheDir)
+    self.assertEqual(len(filenames), 1)
+    np.testing.assert_array_equal(weights,
+                                  computeHardwiredWeights2D((4, 5), True))
+
+    # The second call reads the cached file instead of computing the weights.
+    filename = os.path.join(self.cacheDir, filenames[0])
+    np.save(filename, np.full(weights.shape, 7.0))
+    cachedWeights = getHardwiredWeights2D((4, 5), True, self.cacheDir)
+    self.assertEqual(os.listdir(self.cacheDir), filenames)
+    self.assertEqual(cachedWeights.filename, os.path.abspath(filename))
+    np.testing.assert_array_equal(cachedWeights, 7.0)
+
+    # Any change to the parameters of the weights changes the file.
+    getHardwiredWeights2D((5, 4), True, self.cacheDir)
+    self.assertEqual(len(os.listdir(self.cacheDir)), 2)
+    getHardwiredWeights2D((4, 5), False, self.cacheDir)
+    self.assertEqual(len(os.listdir(self.cacheDir)), 3)
+
+    version = DynamicCAN.HARDWIRED_WEIGHTS_VERSION
+    DynamicCAN.HARDWIRED_WEIGHTS_VERSION = version + 1
+    try:
+      np.testing.assert_array_equal(
+        getHardwiredWeights2D((4, 5), True, self.cacheDir),
+        computeHardwiredWeights2D((4, 5), True))
+    finally:
+      DynamicCAN.HARDWIRED_WEIGHTS_VERSION = version
+    self.assertEqual(len(os.listdir(self.cacheDir)), 4)
+
+
+  def _createCAN(self, weightCacheDir):
+    return Dynamic2DCAN(numPlaces=6, learningRate=0.5, dt=0.004,
+                        dimensions=(4, 5), plotting=False, movie=False,
+                        weightCacheDir=weightCacheDir)
+
+
+  def testCANCopiesCachedWeights(self):
+    expected = computeHardwiredWeights2D((4, 5), True)
+    self._createCAN(self.cacheDir)
+    filenames = os.listdir(self.cacheDir)
+    self.assertEqual(len(filenames), 1)
+
+    can = self._createCAN(self.cacheDir)
+    self.assertEqual(os.listdir(self.cacheDir), filenames)
+
+    weights = [can.weightsII] + [can.weightsIE[k] for k in can.directions]
+    for w in weights:
+      np.testing.assert_array_equal(w, expected)
+      self.assertTrue(w.flags.writeable)
+
+    # Each matrix is a separate copy, also of the cached file.
+    for i, w in enumerate(weights):
+      w += i + 1
+    for i, w in enumerate(weights):
+      np.testing.assert_array_equal(w, expected + i + 1)
+    np.testing.assert_array_equal(
+      np.load(os.path.join(self.cacheDir, filenames[0])), expected)
+
+
+  def testNoCacheDir(self):
+    cwd = os.getcwd()
+    os.chdir(self.cacheDir)
+    try:
+      can = self._createCAN(None)
+    finally:
+      os.chdir(cwd)
+
+    self.assertEqual(os.listdir(self.cacheDir), [])
+    np.testing.assert_array_equal(can.weightsII,
+                                  computeHardwiredWeights2D((4, 5), True))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,130 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2018, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import unittest
+
+import numpy as np
+from nupic.encoders.coordinate import CoordinateEncoder
+
+from htmresearch.frameworks.layers.object_machine_factory import (
+  createObjectMachine
+)
+
+
+
+class LocationCacheTest(unittest.TestCase):
+  """Unit tests for the location cache of ContinuousLocationObjectMachine."""
+
+
+  def setUp(self):
+    self.encoder = CoordinateEncoder(w=21, n=1024)
+    self.locations = [[1, 2, 3], [-4, 0, 7], [10, 10, 10], [0, 0, 0]]
+
+
+  def _createMachine(self, locationCacheSize):
+    return createObjectMachine(machineType="continuous",
+                               numInputBits=21,
+                               sensorInputSize=1024,
+                               externalInputSize=1024,
+                               numFeatures=5,
+                               locationCacheSize=locationCacheSize)
+
+
+  def _getSensation(self, machine, i):
+    """The location bits sent for the location i."""
+    return machine._getSDRPairs([(self.locations[i], 0)])[0][0]
+
+
+  def _getExpectedSensation(self, i):
+    location = self.locations[i]
+    radius = int(np.sqrt(sum(coord ** 2 for coord in location)))
+    return set(self.encoder.encode(
+      (np.array(location, dtype="int32"), radius)).nonzero()[0])
+
+
+  def _getCachedLocations(self, machine):
+    return [list(location) for location, _ in machine.locationCache.keys()]
+
+
+  def testHits(self):
+    machine = self._createMachine(locationCacheSize=10)
+
+    for i in (0, 1, 0, 0, 2, 1):
+      self.assertEqual(self._getSensation(machine, i),
+                       self._getExpectedSensation(i))
+
+    self.assertEqual(machine.getLocationCacheStatistics(),
+                     {"hits": 3, "misses": 3, "hitRate": 0.5, "size": 3})
+
+    # The sensation is a copy of the cached bits.
+    self._getSensation(machine, 0).add(-1)
+    self.assertEqual(self._getSensation(machine, 0),
+                     self._getExpectedSensation(0))
+
+    machine.clearLocationCache()
+    self.assertEqual(machine.getLocationCacheStatistics(),
+                     {"hits": 0, "misses": 0, "hitRate": 0.0, "size": 0})
+    self.assertEqual(self._getSensation(machine, 0),
+                     self._getExpectedSensation(0))
+    self.assertEqual(machine.getLocationCacheStatistics()["misses"], 1)
+
+
+  def testEvictsLeastRecentlyUsed(self):
+    machine = self._createMachine(locationCacheSize=2)
+
+    self._getSensation(machine, 0)
+    self._getSensation(machine, 1)
+    self._getSensation(machine, 0)
+    self.assertEqual(self._getCachedLocations(machine),
+                     [self.locations[1], self.locations[0]])
+
+    # The cache is full, so the least recently used location is evicted.
+    self._getSensation(machine, 2)
+    self.assertEqual(self._getCachedLocations(machine),
+                     [self.locations[0], self.locations[2]])
+    self.assertEqual(machine.getLocationCacheStatistics(),
+                     {"hits": 1, "misses": 3, "hitRate": 0.25, "size": 2})
+
+    self.assertEqual(self._getSensation(machine, 1),
+                     self._getExpectedSensation(1))
+    self.assertEqual(self._getCachedLocations(machine),
+                     [self.locations[2], self.locations[1]])
+    self.assertEqual(machine.getLocationCacheStatistics()["misses"], 4)
+
+    self._getSensation(machine, 2)
+    self.assertEqual(machine.getLocationCacheStatistics()["hits"], 2)
+
+
+  def testSizeZeroDisablesCache(self):
+    machine = self._createMachine(locationCacheSize=0)
+
+    for i in (0, 1, 0, 3, 0):
+      self.assertEqual(self._getSensation(machine, i),
+                       self._getExpectedSensation(i))
+      self.assertEqual(len(machine.locationCache), 0)
+
+    self.assertEqual(machine.getLocationCacheStatistics(),
+                     {"hits": 0, "misses": 5, "hitRate": 0.0, "size": 0})
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -22,15 +22,20 @@
 """Tests for l2_l4_inference module."""
 
 import copy
+import cPickle
 from mock import patch
 import unittest
 import random
+import shutil
+import tempfile
 
 from htmresearch.frameworks.layers import l2_l4_inference
 
 from htmresearch.frameworks.layers.object_machine_factory import (
   createObjectMachine
 )
+from htmresearch.support.model_cache import ModelCache
+from htmresearch.support.sdr_batch import ObjectBatch, SensationBatch
 
 import numpy
 
@@ -425,6 +430,253 @@ class L4L2ExperimentTest(unittest.TestCase):
           self.assertSequenceEqual(L40, set(exps[e].getL4Representations()[c]))
 
 
+  def testSparseLinks(self):
+    """
+    Test that sparse links between regions give the same results as dense
+    links.
+    """
+    objects = createObjectMachine(
+      machineType="simple",
+      numInputBits=20,
+      sensorInputSize=1024,
+      externalInputSize=1024,
+      numCorticalColumns=3,
+      seed=40,
+    )
+    objects.createRandomObjects(5, 4, numLocations=6, numFeatures=6)
+    objectsToLearn = objects.provideObjectsToLearn()
+
+    exps = []
+    for sparseLinks in (False, True):
+      exp = l2_l4_inference.L4L2Experiment(
+        "testSparseLinks",
+        numCorticalColumns=3,
+        seed=23,
+        sparseLinks=sparseLinks,
+      )
+      exp.learnObjects(objectsToLearn)
+      exp.infer(objects.provideObjectToInfer({
+        "numSteps": 4,
+        "pairs": {col: objects.objects[2] for col in xrange(3)},
+      }), objectName=2, reset=False)
+      exps.append(exp)
+
+    dense, sparse = exps
+    self.assertEqual(dense.objectL2Representations,
+                     sparse.objectL2Representations)
+    self.assertEqual(dense.getL4Representations(),
+                     sparse.getL4Representations())
+    self.assertEqual(dense.getL4PredictedActiveCells(),
+                     sparse.getL4PredictedActiveCells())
+    self.assertEqual(dense.getL2Representations(),
+                     sparse.getL2Representations())
+    self.assertEqual(dense.getInferenceStats(), sparse.getInferenceStats())
+
+
+  def testWithoutNetworkAPI(self):
+    """
+    Test that stepping the algorithms directly gives the same results as the
+    Network API.
+    """
+    objects = createObjectMachine(
+      machineType="simple",
+      numInputBits=20,
+      sensorInputSize=1024,
+      externalInputSize=1024,
+      numCorticalColumns=3,
+      seed=40,
+    )
+    objects.createRandomObjects(5, 4, numLocations=6, numFeatures=6)
+    objectsToLearn = objects.provideObjectsToLearn()
+
+    exps = []
+    for useNetworkAPI in (True, False):
+      exp = l2_l4_inference.L4L2Experiment(
+        "testWithoutNetworkAPI",
+        numCorticalColumns=3,
+        seed=23,
+        useNetworkAPI=useNetworkAPI,
+      )
+      exp.learnObjects(objectsToLearn)
+      exp.infer(objects.provideObjectToInfer({
+        "numSteps": 4,
+        "pairs": {col: objects.objects[2] for col in xrange(3)},
+      }), objectName=2, reset=False)
+      exps.append(exp)
+
+    network, direct = exps
+    self.assertEqual(network.objectL2Representations,
+                     direct.objectL2Representations)
+    self.assertEqual(network.getL4Representations(),
+                     direct.getL4Representations())
+    self.assertEqual(network.getL4PredictedCells(),
+                     direct.getL4PredictedCells())
+    self.assertEqual(network.getL4PredictedActiveCells(),
+                     direct.getL4PredictedActiveCells())
+    self.assertEqual(network.getL2Representations(),
+                     direct.getL2Representations())
+    self.assertEqual(network.getInferenceStats(), direct.getInferenceStats())
+
+
+  def testObjectBatch(self):
+    """
+    Test that learning and inferring from SDR batches, loaded as memory maps,
+    gives the same results as the canonical dict and list of sets.
+    """
+    objects = createObjectMachine(
+      machineType="simple",
+      numInputBits=20,
+      sensorInputSize=1024,
+      externalInputSize=1024,
+      numCorticalColumns=2,
+      seed=40,
+    )
+    objects.createRandomObjects(4, 4, numLocations=6, numFeatures=6)
+    inferConfig = {
+      "numSteps": 4,
+      "pairs": {col: objects.objects[1] for col in xrange(2)},
+    }
+    sensations = objects.provideObjectToInfer(inferConfig)
+
+    directory = tempfile.mkdtemp()
+    try:
+      objects.provideObjectsToLearnBatch().save(directory)
+      objectBatch = ObjectBatch.load(directory)
+
+      for useNetworkAPI in (True, False):
+        exps = []
+        for objectsToLearn, sensationsToInfer in (
+            (objects.provideObjectsToLearn(), sensations),
+            (objectBatch, SensationBatch.fromSensations(sensations, 2, 1024,
+                                                        1024))):
+          exp = l2_l4_inference.L4L2Experiment(
+            "testObjectBatch",
+            numCorticalColumns=2,
+            seed=23,
+            useNetworkAPI=useNetworkAPI,
+          )
+          exp.learnObjects(objectsToLearn)
+          exp.infer(sensationsToInfer, objectName=1, reset=False)
+          exps.append(exp)
+
+        sets, batch = exps
+        self.assertEqual(sets.objectL2Representations,
+                         batch.objectL2Representations)
+        self.assertEqual(sets.getL4Representations(),
+                         batch.getL4Representations())
+        self.assertEqual(sets.getL2Representations(),
+                         batch.getL2Representations())
+        self.assertEqual(sets.getInferenceStats(), batch.getInferenceStats())
+    finally:
+      shutil.rmtree(directory)
+
+
+  def testModelCache(self):
+    """
+    Test that an experiment loaded from the model cache infers like a newly
+    trained one, with the same subsequent random numbers.
+    """
+    objects = createObjectMachine(
+      machineType="simple",
+      numInputBits=20,
+      sensorInputSize=1024,
+      externalInputSize=1024,
+      numCorticalColumns=2,
+      seed=40,
+    )
+    objects.createRandomObjects(4, 4, numLocations=6, numFeatures=6)
+    objectsToLearn = objects.provideObjectsToLearn()
+    experimentArgs = {"name": "testModelCache", "numCorticalColumns": 2,
+                      "seed": 23}
+    trainedExperiments = []
+
+    def getOrTrain(config):
+      def train():
+        exp = l2_l4_inference.L4L2Experiment(**config["experiment"])
+        exp.learnObjects(config["objects"])
+        random.random()
+        trainedExperiments.append(exp)
+        return exp
+
+      return cache.getOrTrain(config, train)
+
+    directory = tempfile.mkdtemp()
+    try:
+      cache = ModelCache(directory, maxEntries=1)
+      config = {"experiment": experimentArgs, "objects": objectsToLearn}
+      exps = []
+      randomNumbers = []
+      for _ in xrange(2):
+        random.seed(42)
+        exp = getOrTrain(config)
+        randomNumbers.append(random.random())
+        exp.infer(objects.provideObjectToInfer({
+          "numSteps": 4,
+          "pairs": {col: objects.objects[1] for col in xrange(2)},
+        }), objectName=1, reset=False)
+        exps.append(exp)
+
+      self.assertEqual(len(trainedExperiments), 1)
+      self.assertEqual(cache.getStatistics()["hits"], 1)
+      trained, loaded = exps
+      self.assertIsNot(trained, loaded)
+      self.assertEqual(randomNumbers[0], randomNumbers[1])
+      self.assertEqual(trained.objectL2Representations,
+                       loaded.objectL2Representations)
+      self.assertEqual(trained.getL2Representations(),
+                       loaded.getL2Representations())
+      self.assertEqual(trained.getInferenceStats(), loaded.getInferenceStats())
+
+      # A different configuration is trained and evicts the first model.
+      random.seed(42)
+      getOrTrain(dict(config, experiment=dict(experimentArgs, seed=24)))
+      self.assertEqual(len(trainedExperiments), 2)
+      self.assertEqual(trainedExperiments[1].seed, 24)
+      self.assertEqual(cache.getStatistics()["entries"], 1)
+    finally:
+      shutil.rmtree(directory)
+
+
+  def testPickle(self):
+    """
+    Test that an unpickled experiment infers like the original one.
+    """
+    objects = createObjectMachine(
+      machineType="simple",
+      numInputBits=20,
+      sensorInputSize=1024,
+      externalInputSize=1024,
+      numCorticalColumns=2,
+      seed=40,
+    )
+    objects.createRandomObjects(4, 4, numLocations=6, numFeatures=6)
+    inferConfig = {
+      "numSteps": 4,
+      "pairs": {col: objects.objects[1] for col in xrange(2)},
+    }
+
+    for useNetworkAPI in (True, False):
+      exp = l2_l4_inference.L4L2Experiment(
+        "testPickle",
+        numCorticalColumns=2,
+        seed=23,
+        useNetworkAPI=useNetworkAPI,
+      )
+      exp.learnObjects(objects.provideObjectsToLearn())
+
+      exp2 = cPickle.loads(cPickle.dumps(exp, cPickle.HIGHEST_PROTOCOL))
+      self.assertEqual(exp.objectL2Representations,
+                       exp2.objectL2Representations)
+
+      for e in (exp, exp2):
+        e.infer(objects.provideObjectToInfer(inferConfig), objectName=1,
+                reset=False)
+      self.assertEqual(exp.getInferenceStats(), exp2.getInferenceStats())
+      self.assertEqual(exp.getL2Representations(), exp2.getL2Representations())
+      self.assertEqual(exp.getL2Representations()[0],
+                       exp.objectL2Representations[1][0])
+
+
   def testObjectClassificationUnit(self):
     """
     Unit Test for multi column object classification
@@ -19,12 +19,17 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
+import os
+import shutil
+import tempfile
 import unittest
 
 import matplotlib.pyplot as plt
+import numpy as np
+import plyfile
 
 from htmresearch.frameworks.layers.physical_objects import (
-  Sphere, Cylinder, Box, Cube
+  Sphere, Cylinder, Box, Cube, PlyModel
 )
 
 
@@ -137,5 +142,134 @@ class PhysicalObjectsTest(unittest.TestCase):
 
 
 
+def _containsPerPoint(vertices, faces, location, tolerance=0.0001):
+  """
+  PlyModel.contains for one point, testing every vertex, then every edge and
+  plane of each face one at a time.
+  """
+  for vertex in vertices:
+    if np.allclose(location, vertex, rtol=1.e-3):
+      return "vertex"
+  for face in faces:
+    corners = vertices[face]
+    for start, end in ((0, 1), (0, 2), (1, 2)):
+      v = corners[end] - location
+      d = corners[end] - corners[start]
+      if abs(np.dot(v / np.linalg.norm(v), d / np.linalg.norm(d)) -
+             1.0) <= tolerance:
+        return "edge"
+    n1 = np.cross(corners[2] - corners[0], corners[1] - corners[0])
+    n2 = np.cross(location - corners[0], corners[2] - location)
+    if abs(abs(np.dot(n1 / np.linalg.norm(n1), n2 / np.linalg.norm(n2))) -
+           1.0) <= tolerance:
+      return "face"
+  return False
+
+
+
+class PlyModelTest(unittest.TestCase):
+  """Unit tests for PlyModel."""
+
+
+  def setUp(self):
+    # A tetrahedron.
+    self.vertices = np.array([(0, 0, 0), (10, 0, 0), (0, 10, 0), (0, 0, 10)],
+                             dtype="float")
+    self.faces = np.array([[0, 1, 2], [0, 1, 3], [0, 2, 3], [1, 2, 3]])
+    self.tmpDir = tempfile.mkdtemp()
+    self.path = self._writeModel("tetrahedron.ply", self.faces)
+
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpDir)
+
+
+  def _writeModel(self, filename, faces):
+    path = os.path.join(self.tmpDir, filename)
+    vertices = np.array([tuple(vertex) for vertex in self.vertices],
+                        dtype=[("x", "f4"), ("y", "f4"), ("z", "f4")])
+    faces = np.array([(face,) for face in faces],
+                     dtype=[("vertex_indices", "i4", (3,))])
+    plyfile.PlyData([plyfile.PlyElement.describe(vertices, "vertex"),
+                     plyfile.PlyElement.describe(faces, "face")]).write(path)
+    return path
+
+
+  def testContains(self):
+    model = PlyModel(file=self.path)
+
+    expected = [
+      ([10, 0, 0], "vertex"),
+      ([10.005, 0, 0], "vertex"),
+      ([5, 0, 0], "edge"),
+      ([0, 0, 5], "edge"),
+      # The edge test accepts points beyond the start of an edge.
+      ([-5, 0, 0], "edge"),
+      ([2, 3, 0], "face"),
+      ([3, 3, 4], "face"),
+      # The face test accepts points outside a face, in its plane.
+      ([15, 0, 0], "face"),
+      ([-5, -5, 0], "face"),
+      ([3, 30, 0.1], False),
+      ([1, 1, 1], False),
+      ([3, 30, 30], False),
+    ]
+
+    for location, truthyFeature in expected:
+      self.assertEqual(_containsPerPoint(self.vertices, self.faces,
+                                         np.array(location, dtype="float")),
+                       truthyFeature)
+      self.assertEqual(model.contains(location), truthyFeature)
+
+    locations = [location for location, _ in expected]
+    for maxPairs in (1, 5, 2**16):
+      self.assertEqual(model.containsMany(locations, maxPairs=maxPairs),
+                       [truthyFeature for _, truthyFeature in expected])
+
+
+  def testFirstFaceWins(self):
+    # (15, 0, 0) is in the plane of the face (0, 1, 2), and on the ray from
+    # vertex 0 through vertex 1 of the face (2, 1, 0).
+    for faces, truthyFeature in (([[0, 1, 2], [2, 1, 0]], "face"),
+                                 ([[2, 1, 0], [0, 1, 2]], "edge")):
+      model = PlyModel(file=self._writeModel("triangle.ply", faces))
+      self.assertEqual(_containsPerPoint(self.vertices, np.array(faces),
+                                         np.array([15., 0, 0])),
+                       truthyFeature)
+      self.assertEqual(model.contains([15, 0, 0]), truthyFeature)
+      for maxPairs in (1, 2**16):
+        self.assertEqual(model.containsMany([[15, 0, 0], [5, 0, 0]] * 3,
+                                            maxPairs=maxPairs),
+                         [truthyFeature, "edge"] * 3)
+
+
+  def testContainsManyMatchesPerPoint(self):
+    model = PlyModel(file=self.path)
+    model.rng.seed(42)
+    rng = np.random.RandomState(42)
+
+    locations = [model.sampleLocationFromFeature(feature)
+                 for feature in ("vertex", "edge", "face") * 10]
+    locations += [location + rng.normal(scale=0.01, size=3)
+                  for location in locations]
+    locations += list(rng.uniform(-20, 20, size=(30, 3)))
+    locations = np.array(locations, dtype="float")
+
+    expected = [_containsPerPoint(self.vertices, self.faces, location)
+                for location in locations]
+    self.assertEqual(expected[:3], ["vertex", "edge", "face"])
+    self.assertIn(False, expected)
+
+    for maxPairs in (1, 7, 2**16):
+      self.assertEqual(model.containsMany(locations, maxPairs=maxPairs),
+                       expected)
+    self.assertEqual(model.containsMany([]), [])
+    self.assertEqual(model.getFeatureIDs(locations),
+                     [model.getFeatureID(location) for location in locations])
+
+
+
+
+
 if __name__ == "__main__":
   unittest.main()
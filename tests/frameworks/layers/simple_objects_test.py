@@ -21,6 +21,8 @@
 
 import unittest
 
+import numpy
+
 from htmresearch.frameworks.layers.object_machine_factory import (
   createObjectMachine
 )
@@ -76,6 +78,173 @@ class SimpleObjectsTest(unittest.TestCase):
     self.assertEqual(len(distinctPairs), 4)
 
 
+  def testObjectConfusion(self):
+    """Checks the confusion counts against a count over sensation pairs."""
+    objects = createObjectMachine(
+      machineType="simple",
+      numInputBits=20,
+      sensorInputSize=150,
+      externalInputSize=2400,
+      numCorticalColumns=1,
+      numFeatures=5,
+      numLocations=10,
+      seed=42
+    )
+
+    objects.addObject([(1, 3), (2, 4), (3, 3)], 0)
+    objects.addObject([(1, 3), (2, 3), (3, 4), (4, 4)], 1)
+    objects.addObject([(2, 4), (3, 3), (3, 3)], 2)
+
+    names, commonPairs, commonLocations, commonFeatures = (
+      objects.objectConfusionMatrix())
+    for i, name1 in enumerate(names):
+      for j, name2 in enumerate(names):
+        s1 = objects[name1]
+        s2 = objects[name2]
+        self.assertEqual(commonPairs[i, j], len(set(s1) & set(s2)))
+        self.assertEqual(commonLocations[i, j],
+                         sum(p1[0] == p2[0] for p1 in s1 for p2 in s2))
+        self.assertEqual(commonFeatures[i, j],
+                         sum(p1[1] == p2[1] for p1 in s1 for p2 in s2))
+
+    # Objects (0, 1), (0, 2) and (1, 2) share 1, 2 and 0 pairs, 3, 3 and 3
+    # locations, 6, 5 and 6 features.
+    avgPairs, avgLocations, avgFeatures = objects.objectConfusion()
+    self.assertAlmostEqual(avgPairs, 1.0)
+    self.assertAlmostEqual(avgLocations, 3.0)
+    self.assertAlmostEqual(avgFeatures, 17 / 3.0)
+
+    objects.addObject([(2, 4), (3, 3), (1, 3)], 3)
+    with self.assertRaises(RuntimeError):
+      objects.objectConfusion()
+
+
+  def testObjectConfusionFewerThanTwoObjects(self):
+    """Checks the confusion of no objects and of a single object."""
+    objects = createObjectMachine(
+      machineType="simple",
+      numInputBits=20,
+      sensorInputSize=150,
+      externalInputSize=2400,
+      numCorticalColumns=1,
+      numFeatures=5,
+      numLocations=10,
+      seed=42
+    )
+
+    self.assertEqual(objects.objectConfusion(), (0.0, 0.0, 0.0))
+    names, commonPairs, commonLocations, commonFeatures = (
+      objects.objectConfusionMatrix())
+    self.assertEqual(names, [])
+    for matrix in (commonPairs, commonLocations, commonFeatures):
+      self.assertEqual(matrix.shape, (0, 0))
+
+    # A single object has no pairs, only its overlap with itself.
+    objects.addObject([(1, 3), (2, 3), (3, 4)], 0)
+    self.assertEqual(objects.objectConfusion(), (0.0, 0.0, 0.0))
+    names, commonPairs, commonLocations, commonFeatures = (
+      objects.objectConfusionMatrix())
+    self.assertEqual(names, [0])
+    self.assertEqual(commonPairs.tolist(), [[3]])
+    self.assertEqual(commonLocations.tolist(), [[3]])
+    self.assertEqual(commonFeatures.tolist(), [[5]])
+
+
+  def testProvideObjectsToLearnBatch(self):
+    """Checks the SDR batch against the canonical learning dict."""
+    objects = createObjectMachine(
+      machineType="simple",
+      numInputBits=20,
+      sensorInputSize=150,
+      externalInputSize=2400,
+      numCorticalColumns=2,
+      numFeatures=5,
+      numLocations=10,
+      seed=42
+    )
+    objects.addObject([(1, 3), (2, 4)], 0)
+    objects.addObject([((1, 2), 3), (4, -1), (5, (1, 4))], 1)
+    objects.addObject([], 2)
+
+    expected = objects.provideObjectsToLearn()
+    batch = objects.provideObjectsToLearnBatch()
+    self.assertEqual(sorted(batch.keys()), sorted(expected.keys()))
+    for name, sensationList in expected.iteritems():
+      self.assertEqual(len(batch[name]), len(sensationList))
+      for sensations, batchSensations in zip(sensationList, batch[name]):
+        for col in xrange(2):
+          self.assertEqual(sorted(sensations[col][0]),
+                           list(batchSensations[col][0]))
+          self.assertEqual(sorted(sensations[col][1]),
+                           list(batchSensations[col][1]))
+
+    selected = batch.select([1, 0])
+    self.assertEqual(selected.keys(), [1, 0])
+    numpy.testing.assert_equal(selected[1].features.indices,
+                               batch[1].features.indices)
+    numpy.testing.assert_equal(selected[0][1][1][0], batch[0][1][1][0])
+    numpy.testing.assert_equal(batch[1][::2][1][0][1], batch[1][2][0][1])
+
+    noisy = batch.addNoise(featureNoise=0.5, rng=numpy.random.RandomState(42))
+    numpy.testing.assert_equal(noisy.sensations.locations.indices,
+                               batch.sensations.locations.indices)
+    numpy.testing.assert_equal(noisy.sensations.features.getSizes(),
+                               batch.sensations.features.getSizes())
+    overlaps = (noisy.sensations.features.toDense() &
+                batch.sensations.features.toDense()).sum(axis=1)
+    self.assertTrue(numpy.all(overlaps <=
+                              batch.sensations.features.getSizes()))
+    self.assertTrue(numpy.any(overlaps <
+                              batch.sensations.features.getSizes()))
+
+
+  def testProvideObjectsToLearnBatchChecks(self):
+    """Checks the seeding and validation of the SDR batch."""
+    objects = createObjectMachine(
+      machineType="simple",
+      numInputBits=20,
+      sensorInputSize=150,
+      externalInputSize=2400,
+      numCorticalColumns=2,
+      numFeatures=5,
+      numLocations=10,
+      seed=42
+    )
+    objects.addObject([(1, 3), (2, 4)], 0)
+    objects.addObject([], 1)
+
+    # Both formats leave numpy's generator in the same state.
+    for objectNames in ([0, 1], [1]):
+      numpy.random.seed(7)
+      objects.provideObjectsToLearn(objectNames)
+      expected = numpy.random.rand()
+      numpy.random.seed(7)
+      objects.provideObjectsToLearnBatch(objectNames)
+      self.assertEqual(numpy.random.rand(), expected)
+
+    batch = objects.provideObjectsToLearnBatch()
+    objects._checkObjectBatchToLearn(batch)
+
+    otherObjects = createObjectMachine(
+      machineType="simple",
+      numInputBits=20,
+      sensorInputSize=150,
+      externalInputSize=2400,
+      numCorticalColumns=1,
+      numFeatures=5,
+      numLocations=10,
+      seed=42
+    )
+    otherObjects.addObject([(1, 3), (2, 4)], 0)
+    with self.assertRaises(ValueError):
+      otherObjects._checkObjectBatchToLearn(batch)
+
+    objects.addObject([(1, 3)], 2)
+    batch = objects.provideObjectsToLearnBatch([0, 2])
+    del objects.objects[2]
+    with self.assertRaises(ValueError):
+      objects._checkObjectBatchToLearn(batch)
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,190 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2018, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Test pickling, classification and batched inference in a trained
+PIUNExperiment
+"""
+import cPickle as pickle
+import math
+import random
+import unittest
+
+import numpy as np
+
+from htmresearch.frameworks.location.path_integration_union_narrowing import (
+  BatchedPIUNCorticalColumn, PIUNCorticalColumn, PIUNExperiment)
+
+OBJECTS = [
+  {"name": "Object 1",
+   "features": [{"top": 0, "left": 0, "width": 10, "height": 10, "name": "A"},
+                {"top": 0, "left": 10, "width": 10, "height": 10, "name": "B"},
+                {"top": 10, "left": 0, "width": 10, "height": 10, "name": "A"},
+                {"top": 10, "left": 10, "width": 10, "height": 10, "name": "C"}
+                ]},
+  {"name": "Object 2",
+   "features": [{"top": 0, "left": 0, "width": 10, "height": 10, "name": "B"},
+                {"top": 0, "left": 10, "width": 10, "height": 10, "name": "A"},
+                {"top": 10, "left": 0, "width": 10, "height": 10, "name": "C"},
+                {"top": 10, "left": 10, "width": 10, "height": 10, "name": "C"}
+                ]},
+]
+
+
+
+class PIUNExperimentPickleTest(unittest.TestCase):
+
+  def _createExperiment(self, bumpType):
+    locationConfigs = []
+    for i in xrange(3):
+      config = {
+        "cellsPerAxis": 10,
+        "scale": 40.0,
+        "orientation": math.radians(i * 20.0 + 10.0),
+        "activationThreshold": 8,
+        "initialPermanence": 1.0,
+        "connectedPermanence": 0.5,
+        "learningThreshold": 8,
+        "sampleSize": 10,
+        "permanenceIncrement": 0.1,
+        "permanenceDecrement": 0.0,
+      }
+      if bumpType == "square":
+        config["cellCoordinateOffsets"] = (0.5,)
+      locationConfigs.append(config)
+
+    column = PIUNCorticalColumn(locationConfigs, bumpType=bumpType,
+                                L4Overrides={"initialPermanence": 1.0,
+                                             "activationThreshold": 3,
+                                             "reducedBasalThreshold": 3,
+                                             "minThreshold": 3,
+                                             "sampleSize": 3})
+    return PIUNExperiment(column, featureNames=("A", "B", "C"),
+                          numActiveMinicolumns=10)
+
+
+  def _infer(self, exp):
+    random.seed(7)
+    np.random.seed(7)
+    return [exp.inferObjectWithRandomMovements(objectDescription)
+            for objectDescription in OBJECTS]
+
+
+  def testPickledExperimentInfersIdentically(self):
+    for bumpType in ("gaussian", "square"):
+      random.seed(42)
+      np.random.seed(42)
+      exp = self._createExperiment(bumpType)
+      for objectDescription in OBJECTS:
+        exp.learnObject(objectDescription)
+
+      exp2 = pickle.loads(pickle.dumps(exp, pickle.HIGHEST_PROTOCOL))
+      self.assertEqual(exp.representationSet, exp2.representationSet)
+
+      results = self._infer(exp)
+      self.assertNotEqual(results, [None, None])
+      self.assertEqual(results, self._infer(exp2))
+      np.testing.assert_equal(exp.column.L4.getActiveCells(),
+                              exp2.column.L4.getActiveCells())
+
+
+  def testClassifyLocationRepresentation(self):
+    random.seed(42)
+    np.random.seed(42)
+    exp = self._createExperiment("gaussian")
+    for objectDescription in OBJECTS:
+      exp.learnObject(objectDescription)
+
+    for representations in exp.locationRepresentations.itervalues():
+      for representation in representations:
+        expected = sorted(
+          location
+          for location, learned in exp.locationRepresentations.iteritems()
+          if set(representation) <= set(np.concatenate(learned)))
+        self.assertEqual(
+          sorted(exp.classifyLocationRepresentation(representation)), expected)
+
+    for objectDescription in OBJECTS:
+      if exp.inferObjectWithRandomMovements(objectDescription) is not None:
+        self.assertIn(objectDescription["name"], exp.getCandidateObjects())
+
+
+  def testBatchedInferenceMatchesSequential(self):
+    random.seed(42)
+    np.random.seed(42)
+    exp = self._createExperiment("square")
+    for objectDescription in OBJECTS:
+      exp.learnObject(objectDescription)
+
+    touchSequences = [[0, 1, 3, 2, 0], [3, 0, 2], [2, 2, 1, 0]]
+    objects = [OBJECTS[0], OBJECTS[1], OBJECTS[1]]
+    batch = BatchedPIUNCorticalColumn(exp.column, len(objects))
+
+    expected = []
+    for objectDescription, touchSequence in zip(objects, touchSequences):
+      exp.column.reset()
+      representations = []
+      for iTouch, iFeature in enumerate(touchSequence):
+        feature = objectDescription["features"][iFeature]
+        if iTouch > 0:
+          prevFeature = objectDescription["features"][touchSequence[iTouch - 1]]
+          exp.column.movementCompute(
+            {"top": feature["top"] - prevFeature["top"],
+             "left": feature["left"] - prevFeature["left"]})
+        exp.column.sensoryCompute(exp.features[feature["name"]], learn=False)
+        representations.append(
+          (list(exp.column.getSensoryRepresentation()),
+           list(exp.column.getLocationRepresentation()),
+           list(exp.column.getSensoryAssociatedLocationRepresentation())))
+      expected.append(representations)
+
+    actual = [[] for _ in objects]
+    for iTouch in xrange(max(len(sequence) for sequence in touchSequences)):
+      episodes = [episode for episode, sequence in enumerate(touchSequences)
+                  if iTouch < len(sequence)]
+      features = [objects[episode]["features"][touchSequences[episode][iTouch]]
+                  for episode in episodes]
+      if iTouch > 0:
+        prevFeatures = [
+          objects[episode]["features"][touchSequences[episode][iTouch - 1]]
+          for episode in episodes]
+        batch.movementCompute(
+          [[feature["top"] - prevFeature["top"],
+            feature["left"] - prevFeature["left"]]
+           for feature, prevFeature in zip(features, prevFeatures)],
+          episodes)
+      batch.sensoryCompute([exp.features[feature["name"]]
+                            for feature in features], episodes)
+      for episode in episodes:
+        actual[episode].append(
+          (list(batch.getSensoryRepresentation(episode)),
+           list(batch.getLocationRepresentation(episode)),
+           list(batch.getSensoryAssociatedLocationRepresentation(episode))))
+
+    self.assertEqual(actual, expected)
+    self.assertTrue(any(len(associated) > 0
+                        for representations in actual
+                        for _, _, associated in representations))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,141 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Test the batched noise robustness evaluation of the SP paper
+"""
+import unittest
+
+import numpy as np
+import scipy.sparse
+
+from nupic.algorithms.spatial_pooler import SpatialPooler
+
+from htmresearch.frameworks.sp_paper.noise_robustness import (
+  NoiseRobustnessEvaluator, classifySparseOutputs, corruptSparseVectors)
+from htmresearch.frameworks.sp_paper.sp_metrics import (
+  classifySPoutput, computeSPOutputs)
+
+
+
+class NoiseRobustnessTest(unittest.TestCase):
+
+  def setUp(self):
+    rng = np.random.RandomState(42)
+    self.inputVectors = (rng.rand(40, 100) < 0.1).astype("uint32")
+    # An empty input and an input with more active than inactive bits
+    self.inputVectors[0] = 0
+    self.inputVectors[1, :80] = 1
+
+
+  def testCorruptSparseVectors(self):
+    noiseLevelList = [0.0, 0.3, 1.0]
+    corrupted = corruptSparseVectors(self.inputVectors, noiseLevelList,
+                                     np.random.RandomState(1))
+    self.assertEqual(corrupted.shape, (120, 100))
+
+    corrupted = corrupted.toarray()
+    for i, noiseLevel in enumerate(noiseLevelList):
+      for j, inputVector in enumerate(self.inputVectors):
+        numActive = inputVector.sum()
+        numNoiseBits = int(noiseLevel * numActive)
+        corruptedVector = corrupted[i * 40 + j]
+        self.assertEqual(((inputVector == 1) & (corruptedVector == 0)).sum(),
+                         numNoiseBits)
+        self.assertEqual(((inputVector == 0) & (corruptedVector == 1)).sum(),
+                         min(numNoiseBits, 100 - numActive))
+
+    # The corrupted vectors only depend on the seed.
+    for chunkSize in (1, 7):
+      sameCorrupted = corruptSparseVectors(
+        scipy.sparse.csr_matrix(self.inputVectors), noiseLevelList,
+        np.random.RandomState(1), chunkSize=chunkSize)
+      np.testing.assert_array_equal(sameCorrupted.toarray(), corrupted)
+
+
+  def testClassifySparseOutputs(self):
+    rng = np.random.RandomState(3)
+    targets = (rng.rand(30, 64) < 0.2).astype("uint32")
+    targets[3] = targets[5]
+    outputs = (rng.rand(50, 64) < 0.2).astype("uint32")
+    outputs[0] = 0
+    outputs[1] = targets[5]
+
+    expected = [classifySPoutput(targets, output) for output in outputs]
+    np.testing.assert_array_equal(
+      classifySparseOutputs(scipy.sparse.csr_matrix(targets),
+                            scipy.sparse.csr_matrix(outputs)),
+      expected)
+
+
+  def testEvaluateWithoutSP(self):
+    evaluator = NoiseRobustnessEvaluator(None, self.inputVectors,
+                                         noiseLevelList=[0.0, 0.5],
+                                         chunkSize=16)
+    inputOverlapScore, outputOverlapScore, accuracy = evaluator.evaluate()
+
+    self.assertEqual(inputOverlapScore.shape, (40, 2))
+    np.testing.assert_array_equal(inputOverlapScore, outputOverlapScore)
+    np.testing.assert_array_equal(inputOverlapScore[1:, 0], 1.0)
+    # Without noise, only the inputs contained in another input with a lower
+    # index are misclassified.
+    self.assertEqual(
+      accuracy[0],
+      np.mean([classifySPoutput(self.inputVectors, inputVector) == j
+               for j, inputVector in enumerate(self.inputVectors)]))
+
+    numActive = self.inputVectors[2:].sum(axis=1)
+    np.testing.assert_allclose(
+      inputOverlapScore[2:, 1],
+      (numActive - (0.5 * numActive).astype("int64")).astype("float") /
+      numActive)
+
+    _, _, accuracy = evaluator.evaluate(classify=False)
+    self.assertIsNone(accuracy)
+
+
+  def testEvaluateWithSP(self):
+    sp = SpatialPooler(inputDimensions=(100,),
+                       columnDimensions=(128,),
+                       potentialRadius=100,
+                       potentialPct=0.5,
+                       globalInhibition=True,
+                       numActiveColumnsPerInhArea=8,
+                       stimulusThreshold=1,
+                       seed=7)
+
+    evaluator = NoiseRobustnessEvaluator(sp, self.inputVectors,
+                                         noiseLevelList=[0.0, 1.0], seed=5)
+    np.testing.assert_array_equal(evaluator.targetOutputColumns.toarray(),
+                                  computeSPOutputs(sp, self.inputVectors))
+
+    inputOverlapScore, outputOverlapScore, accuracy = evaluator.evaluate()
+    np.testing.assert_array_equal(outputOverlapScore[1:, 0], 1.0)
+    self.assertEqual(accuracy[0], 1.0)
+    self.assertLess(accuracy[1], 1.0)
+
+    # The same seed gives the same results.
+    np.testing.assert_array_equal(evaluator.evaluate()[1], outputOverlapScore)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,197 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Test the mutual information and batched inference metrics of the SP paper
+"""
+import copy
+import unittest
+
+import numpy as np
+import scipy.sparse
+
+from nupic.algorithms.spatial_pooler import SpatialPooler
+
+from htmresearch.frameworks.sp_paper.inference_spatial_pooler import (
+  InferenceSpatialPooler)
+from htmresearch.frameworks.sp_paper.sp_metrics import (
+  calculateOverlapCurve, classificationAccuracyVsNoise, corruptSparseVector,
+  meanMutualInformation, mutualInformation, mutualInformationMatrix,
+  percentOverlap)
+
+
+
+def _mutualInformationFromProbabilities(activity, i, j):
+  """
+  Mutual information computed from the probabilities of the four joint
+  activations, one pair of columns at a time.
+  """
+  mutualInfo = 0.
+  for a in (0, 1):
+    for b in (0, 1):
+      pij = np.mean((activity[:, i] == a) & (activity[:, j] == b))
+      pi = np.mean(activity[:, i] == a)
+      pj = np.mean(activity[:, j] == b)
+      if pij > 0:
+        mutualInfo += pij * np.log2(pij / (pi * pj))
+  return mutualInfo
+
+
+
+class FakeSP(object):
+  def __init__(self, numColumns):
+    self.numColumns = numColumns
+
+  def getColumnDimensions(self):
+    return [self.numColumns]
+
+
+
+class SPMetricsMutualInformationTest(unittest.TestCase):
+
+  def setUp(self):
+    rng = np.random.RandomState(42)
+    self.activity = (rng.rand(200, 24) < 0.2).astype("int32")
+    # Silent, always active and identical columns
+    self.activity[:, 3] = 0
+    self.activity[:, 4] = 1
+    self.activity[:, 5] = self.activity[:, 6]
+    self.expected = np.array(
+      [[_mutualInformationFromProbabilities(self.activity, i, j)
+        for j in xrange(24)]
+       for i in xrange(24)])
+
+
+  def testMutualInformation(self):
+    for i, j in ((0, 1), (3, 7), (4, 4), (5, 6), (6, 6)):
+      self.assertAlmostEqual(mutualInformation(None, self.activity, i, j),
+                             self.expected[i, j])
+
+
+  def testMutualInformationMatrix(self):
+    np.testing.assert_allclose(mutualInformationMatrix(self.activity),
+                               self.expected, atol=1e-12)
+    np.testing.assert_allclose(
+      mutualInformationMatrix(self.activity, dtype="float32"),
+      self.expected, atol=1e-5)
+
+    columns = [2, 5, 6, 11]
+    np.testing.assert_allclose(
+      mutualInformationMatrix(self.activity, columns),
+      self.expected[np.ix_(columns, columns)], atol=1e-12)
+
+
+  def testMeanMutualInformation(self):
+    expectedMean = self.expected[np.triu_indices(24, 1)].mean()
+    for chunkSize in (1, 5, 1024):
+      self.assertAlmostEqual(
+        meanMutualInformation(FakeSP(24), self.activity, chunkSize=chunkSize),
+        expectedMean)
+
+    columns = [0, 5, 6, 20]
+    expectedMean = self.expected[np.ix_(columns, columns)][
+      np.triu_indices(4, 1)].mean()
+    self.assertAlmostEqual(
+      meanMutualInformation(FakeSP(24), self.activity, columns, chunkSize=3),
+      expectedMean)
+
+
+
+class SPMetricsBatchInferenceTest(unittest.TestCase):
+
+  def setUp(self):
+    self.sp = SpatialPooler(inputDimensions=(100,),
+                            columnDimensions=(128,),
+                            potentialRadius=100,
+                            potentialPct=0.5,
+                            globalInhibition=True,
+                            numActiveColumnsPerInhArea=8,
+                            stimulusThreshold=1,
+                            seed=7)
+    rng = np.random.RandomState(1)
+    outputColumns = np.zeros(128, dtype="uint32")
+    for _ in xrange(20):
+      self.sp.compute((rng.rand(100) < 0.1).astype("uint32"), True,
+                      outputColumns)
+    self.inputVectors = (rng.rand(30, 100) < 0.1).astype("uint32")
+
+
+  def _computeOneByOne(self, sp, inputVectors):
+    outputColumns = np.zeros((len(inputVectors), 128), dtype="uint32")
+    for i in xrange(len(inputVectors)):
+      sp.compute(inputVectors[i], False, outputColumns[i])
+    return outputColumns
+
+
+  def testComputeBatch(self):
+    # Include an empty input and inputs with many tied overlaps.
+    inputVectors = np.vstack([self.inputVectors,
+                              np.zeros((1, 100), dtype="uint32"),
+                              np.ones((2, 100), dtype="uint32")])
+    expected = self._computeOneByOne(copy.deepcopy(self.sp), inputVectors)
+
+    inferenceSP = InferenceSpatialPooler(self.sp)
+    for batchSize in (1, 7, 1024):
+      np.testing.assert_array_equal(
+        inferenceSP.computeBatch(inputVectors, batchSize=batchSize), expected)
+      np.testing.assert_array_equal(
+        inferenceSP.computeBatch(scipy.sparse.csr_matrix(inputVectors),
+                                 batchSize=batchSize),
+        expected)
+
+
+  def testCalculateOverlapCurve(self):
+    sp = copy.deepcopy(self.sp)
+    np.random.seed(3)
+    noiseLevelList = np.linspace(0, 1.0, 21)
+    expectedInput = np.zeros((30, 21))
+    expectedOutput = np.zeros((30, 21))
+    for i in xrange(30):
+      for j, noiseLevel in enumerate(noiseLevelList):
+        corrupted = copy.deepcopy(self.inputVectors[i])
+        corruptSparseVector(corrupted, noiseLevel)
+        outputs = self._computeOneByOne(
+          sp, np.array([self.inputVectors[i], corrupted]))
+        expectedInput[i, j] = percentOverlap(self.inputVectors[i], corrupted)
+        expectedOutput[i, j] = percentOverlap(outputs[0], outputs[1])
+
+    np.random.seed(3)
+    _, inputOverlapScore, outputOverlapScore = calculateOverlapCurve(
+      copy.deepcopy(self.sp), self.inputVectors)
+    np.testing.assert_array_equal(inputOverlapScore, expectedInput)
+    np.testing.assert_array_equal(outputOverlapScore, expectedOutput)
+
+
+  def testClassificationAccuracyVsNoise(self):
+    np.random.seed(5)
+    accuracy = classificationAccuracyVsNoise(copy.deepcopy(self.sp),
+                                             self.inputVectors, [0.0, 1.0])
+    self.assertEqual(accuracy[0], 1.0)
+    self.assertLess(accuracy[1], 1.0)
+
+    np.random.seed(5)
+    self.assertEqual(
+      classificationAccuracyVsNoise(None, self.inputVectors, [0.0])[0], 1.0)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
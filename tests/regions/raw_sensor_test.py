@@ -27,6 +27,7 @@ import unittest
 
 from nupic.engine import Network
 from htmresearch.support.register_regions import registerAllResearchRegions
+from htmresearch.support.sparse_links import getSparseInput, sparseToDense
 
 
 
@@ -105,6 +106,29 @@ class RawSensorTest(unittest.TestCase):
                       "Value of sequenceIdOut incorrect")
 
 
+  def testSparseLinks(self):
+    net = Network()
+    rawSensor = net.addRegion("raw", "py.RawSensor",
+                              json.dumps({"outputWidth": 1029,
+                                          "sparseLinks": True}))
+    rawSensorPy = rawSensor.getSelf()
+    rawSensorPy.addDataToQueue([1023, 2, 42], 0, 42)
+    rawSensorPy.addResetToQueue(43)
+    net.initialize()
+
+    # The output holds the number of active bits, then their sorted indices.
+    net.run(1)
+    dataOut = rawSensor.getOutputData("dataOut")
+    self.assertEqual(len(dataOut), 1030)
+    self.assertEqual(list(getSparseInput(dataOut)), [2, 42, 1023])
+    self.assertEqual(list(sparseToDense(dataOut).nonzero()[0]), [2, 42, 1023])
+
+    net.run(1)
+    self.assertEqual(len(getSparseInput(rawSensor.getOutputData("dataOut"))),
+                     0)
+    self.assertEqual(rawSensor.getOutputData("resetOut").sum(), 1)
+
+
 if __name__ == "__main__":
   unittest.main()
 
@@ -0,0 +1,464 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2018, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Test the repetition scheduling, the checkpoints and the history queries of
+PyExperimentSuite.
+"""
+
+import json
+import optparse
+import os
+import shutil
+import tempfile
+import unittest
+
+from htmresearch.support.expsuite import PyExperimentSuite
+
+
+
+class RecordingSuite(PyExperimentSuite):
+  """
+  An experiment suite that records the repetitions and iterations it runs.
+  """
+
+  def __init__(self, delete=False):
+    super(RecordingSuite, self).__init__()
+    self.options = optparse.Values({"ncores": 1, "delete": delete})
+    self.iterations = []
+
+
+  def iterate(self, params, rep, n):
+    self.iterations.append((params["name"], rep, n))
+    return {"value": params.get("value", 0) * n}
+
+
+  def estimate_cost(self, params):
+    return params["value"]
+
+
+  def getRepetitions(self):
+    return sorted(set((name, rep) for name, rep, _ in self.iterations))
+
+
+
+class SparseTagSuite(RecordingSuite):
+  """
+  An experiment suite whose log lines don't all have the same tags.
+  """
+
+  def iterate(self, params, rep, n):
+    super(SparseTagSuite, self).iterate(params, rep, n)
+    result = {"value": rep * 10 + n, "name": params["name"]}
+    if n % 2 == 0:
+      result["even"] = [n, rep]
+    else:
+      result["odd"] = n
+    return result
+
+
+
+class Crash(Exception):
+  pass
+
+
+
+class RunningSumSuite(PyExperimentSuite):
+  """
+  An experiment suite that logs the running sum of the iteration numbers,
+  crashes in iteration crashAt, and saves its sum in its own state file.
+  """
+
+  restore_supported = True
+
+  def __init__(self, crashAt=None):
+    super(RunningSumSuite, self).__init__()
+    self.crashAt = crashAt
+    self.iterations = []
+    self.restored = []
+
+
+  def reset(self, params, rep):
+    self.total = 0
+
+
+  def iterate(self, params, rep, n):
+    if n == self.crashAt:
+      raise Crash()
+    self.iterations.append(n)
+    self.total += n
+    return {"total": self.total}
+
+
+  def _getStateName(self, params, rep):
+    return os.path.join(params["path"], params["name"], "%i.sum" % rep)
+
+
+  def save_state(self, params, rep, n):
+    with open(self._getStateName(params, rep), "w") as f:
+      json.dump({"iterations": n + 1, "total": self.total}, f)
+
+
+  def restore_state(self, params, rep, n):
+    with open(self._getStateName(params, rep)) as f:
+      state = json.load(f)
+    self.assertCompleted(n, state["iterations"])
+    self.total = state["total"]
+    self.restored.append(n)
+
+
+  def assertCompleted(self, n, iterations):
+    if n != iterations:
+      raise AssertionError("restored %i iterations from a checkpoint of %i"
+                           % (n, iterations))
+
+
+
+class BackgroundRunningSumSuite(RunningSumSuite):
+  """
+  A RunningSumSuite whose checkpoints are snapshots written in the background.
+  """
+
+  def save_state(self, params, rep, n):
+    raise AssertionError("save_state is replaced by get_checkpoint")
+
+
+  def restore_state(self, params, rep, n):
+    raise AssertionError("restore_state is replaced by restore_checkpoint")
+
+
+  def get_checkpoint(self, params, rep, n):
+    return {"iterations": n, "total": self.total}
+
+
+  def restore_checkpoint(self, params, rep, n, checkpoint):
+    self.assertCompleted(n, checkpoint["iterations"])
+    self.total = checkpoint["total"]
+    self.restored.append(n)
+
+
+
+class ExperimentSuiteTest(unittest.TestCase):
+
+  def setUp(self):
+    self.path = tempfile.mkdtemp()
+
+
+  def tearDown(self):
+    shutil.rmtree(self.path)
+
+
+  def _createParams(self, name="exp", value=1, repetitions=3):
+    return {"name": name, "path": self.path, "iterations": 4,
+            "repetitions": repetitions, "value": value}
+
+
+  def _readManifest(self, name="exp"):
+    with open(os.path.join(self.path, name, "manifest.log")) as f:
+      return [json.loads(line) for line in f]
+
+
+  def testFinishedRepetitionsAreSkipped(self):
+    params = self._createParams()
+
+    suite = RecordingSuite()
+    self.assertTrue(suite.do_experiment(params))
+    self.assertEqual(suite.getRepetitions(),
+                     [("exp", 0), ("exp", 1), ("exp", 2)])
+    self.assertEqual(sorted(entry["repetition"]
+                            for entry in self._readManifest()), [0, 1, 2])
+    self.assertEqual(sorted(suite.read_manifest(params).keys()), [0, 1, 2])
+
+    # Nothing is run again.
+    suite = RecordingSuite()
+    suite.do_experiment(params)
+    self.assertEqual(suite.iterations, [])
+    self.assertEqual(len(self._readManifest()), 3)
+
+    # A repetition that isn't in the manifest runs again.
+    entries = self._readManifest()
+    with open(os.path.join(self.path, "exp", "manifest.log"), "w") as f:
+      # An entry cut short by a killed sweep is ignored.
+      f.write('{"repetition": 2, "iter\n')
+      for entry in entries:
+        if entry["repetition"] != 2:
+          f.write(json.dumps(entry) + "\n")
+    os.remove(os.path.join(self.path, "exp", "2.log"))
+
+    suite = RecordingSuite()
+    suite.do_experiment(params)
+    self.assertEqual(suite.getRepetitions(), [("exp", 2)])
+    self.assertEqual(sorted(suite.read_manifest(params).keys()), [0, 1, 2])
+
+    # Repetitions completed with another number of iterations are run again.
+    params["iterations"] = 5
+    suite = RecordingSuite()
+    suite.do_experiment(params)
+    self.assertEqual(suite.getRepetitions(),
+                     [("exp", 0), ("exp", 1), ("exp", 2)])
+
+
+  def testDeleteClearsManifest(self):
+    params = self._createParams()
+    RecordingSuite().do_experiment(params)
+
+    suite = RecordingSuite(delete=True)
+    suite.do_experiment(params)
+    self.assertEqual(suite.getRepetitions(),
+                     [("exp", 0), ("exp", 1), ("exp", 2)])
+    self.assertEqual(len(self._readManifest()), 3)
+
+
+  def testMostExpensiveRepetitionsFirst(self):
+    paramlist = [self._createParams("cheap", value=1, repetitions=1),
+                 self._createParams("expensive", value=3, repetitions=2),
+                 self._createParams("medium", value=2, repetitions=1)]
+
+    suite = RecordingSuite()
+    suite.do_experiment(paramlist)
+    order = []
+    for name, rep, _ in suite.iterations:
+      if (name, rep) not in order:
+        order.append((name, rep))
+    self.assertEqual(order, [("expensive", 0), ("expensive", 1),
+                             ("medium", 0), ("cheap", 0)])
+
+
+  def testEstimateCosts(self):
+    paramlist = [self._createParams("a", value=1),
+                 self._createParams("b", value=2),
+                 self._createParams("c", value=4)]
+    manifests = [{0: {"duration": 10.0}, 1: {"duration": 30.0}},
+                 {0: {"duration": None}},
+                 {}]
+
+    # Measured experiments use their mean run time, and the others are scaled
+    # by the seconds per cost unit of the measured ones.
+    suite = RecordingSuite()
+    self.assertEqual(suite.estimate_costs(paramlist, manifests),
+                     [20.0, 40.0, 80.0])
+    self.assertEqual(suite.estimate_costs(paramlist, [{}, {}, {}]),
+                     [1.0, 2.0, 4.0])
+
+
+
+class CheckpointTest(unittest.TestCase):
+
+  def setUp(self):
+    self.path = tempfile.mkdtemp()
+    self.params = {"name": "exp", "path": self.path, "iterations": 10,
+                   "checkpoint_interval": 3}
+    self.exp = os.path.join(self.path, "exp")
+    os.mkdir(self.exp)
+
+
+  def tearDown(self):
+    shutil.rmtree(self.path)
+
+
+  def _readLog(self, rep=0):
+    with open(os.path.join(self.exp, "%i.log" % rep)) as f:
+      return [json.loads(line) for line in f]
+
+
+  def _checkCompleteLog(self, rep=0):
+    totals = [sum(xrange(n + 1)) for n in xrange(self.params["iterations"])]
+    self.assertEqual(self._readLog(rep),
+                     [{"iteration": n, "total": total}
+                      for n, total in enumerate(totals)])
+    # The checkpoints of a complete repetition are deleted.
+    for extension in ("state", "checkpoint"):
+      self.assertFalse(os.path.exists(
+        os.path.join(self.exp, "%i.%s" % (rep, extension))))
+
+
+  def _checkResume(self, suiteClass):
+    suite = suiteClass(crashAt=7)
+    self.assertRaises(Crash, suite.run_rep, self.params, 0)
+    self.assertEqual(suite.iterations, range(7))
+    self.assertEqual(len(self._readLog()), 7)
+
+    # The iterations after the checkpoint of iteration 6 are run again.
+    suite = suiteClass()
+    suite.run_rep(self.params, 0)
+    self.assertEqual(suite.restored, [6])
+    self.assertEqual(suite.iterations, range(6, 10))
+    self._checkCompleteLog()
+
+    # A complete repetition isn't run again.
+    suite = suiteClass()
+    self.assertFalse(suite.run_rep(self.params, 0))
+    self.assertEqual(suite.iterations, [])
+
+
+  def testResumeFromSavedState(self):
+    self._checkResume(RunningSumSuite)
+
+
+  def testResumeFromBackgroundCheckpoint(self):
+    self._checkResume(BackgroundRunningSumSuite)
+
+
+  def testCrashBeforeFirstCheckpoint(self):
+    for suiteClass in (RunningSumSuite, BackgroundRunningSumSuite):
+      suite = suiteClass(crashAt=2)
+      self.assertRaises(Crash, suite.run_rep, self.params, 0)
+
+      suite = suiteClass()
+      suite.run_rep(self.params, 0)
+      self.assertEqual(suite.restored, [])
+      self.assertEqual(suite.iterations, range(10))
+      self._checkCompleteLog()
+      os.remove(os.path.join(self.exp, "0.log"))
+
+
+  def testRepeatedCrashes(self):
+    for crashAt in (4, 5, 9):
+      self.assertRaises(Crash, BackgroundRunningSumSuite(crashAt).run_rep,
+                        self.params, 0)
+
+    suite = BackgroundRunningSumSuite()
+    suite.run_rep(self.params, 0)
+    self.assertEqual(suite.restored, [9])
+    self.assertEqual(suite.iterations, [9])
+    self._checkCompleteLog()
+
+
+  def testCheckpointAheadOfLog(self):
+    for suiteClass in (RunningSumSuite, BackgroundRunningSumSuite):
+      self.assertRaises(Crash, suiteClass(crashAt=7).run_rep, self.params, 0)
+
+      # The log lost the lines after the checkpoint, so it starts over.
+      logName = os.path.join(self.exp, "0.log")
+      with open(logName) as f:
+        lines = f.readlines()
+      with open(logName, "w") as f:
+        f.writelines(lines[:5])
+
+      suite = suiteClass()
+      suite.run_rep(self.params, 0)
+      self.assertEqual(suite.restored, [])
+      self.assertEqual(suite.iterations, range(10))
+      self._checkCompleteLog()
+      os.remove(logName)
+
+
+  def testResumeLegacyLog(self):
+    # Before checkpoints were tracked, the state was saved after every
+    # iteration and the repetition resumed after the last line of the log.
+    self.params["checkpoint_interval"] = 1
+    self.assertRaises(Crash, RunningSumSuite(crashAt=4).run_rep,
+                      self.params, 0)
+    os.remove(os.path.join(self.exp, "0.checkpoint"))
+
+    suite = RunningSumSuite()
+    suite.run_rep(self.params, 0)
+    self.assertEqual(suite.restored, [4])
+    self.assertEqual(suite.iterations, range(4, 10))
+    self._checkCompleteLog()
+
+
+
+class HistoryIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.path = tempfile.mkdtemp()
+    params = {"name": "exp", "path": self.path, "iterations": 5,
+              "repetitions": 2, "value": 1}
+    SparseTagSuite().do_experiment(params)
+    self.exp = os.path.join(self.path, "exp")
+
+
+  def tearDown(self):
+    shutil.rmtree(self.path)
+
+
+  def _getHistories(self, suite):
+    queries = ["value", "even", "missing", ["value", "odd"],
+               ["value", "missing"], ["missing"], "all"]
+    return [suite.get_history(self.exp, rep, tags)
+            for rep in (0, 1, 2) for tags in queries]
+
+
+  def _checkIndexedHistories(self):
+    """
+    Check that get_history gives the same results with and without the index,
+    and with a new index or an existing one.
+    """
+    suite = SparseTagSuite()
+    suite.index_history = False
+    expected = self._getHistories(suite)
+
+    suite = SparseTagSuite()
+    self.assertEqual(self._getHistories(suite), expected)
+    self.assertTrue(os.path.exists(os.path.join(self.exp, "history.sqlite")))
+    self.assertEqual(self._getHistories(suite), expected)
+    self.assertEqual(self._getHistories(SparseTagSuite()), expected)
+    return expected
+
+
+  def testIndexedHistoryMatchesLog(self):
+    suite = SparseTagSuite()
+    suite.index_history = False
+    self.assertEqual(suite.get_history(self.exp, 1, "value"),
+                     [10, 11, 12, 13, 14])
+    self.assertEqual(suite.get_history(self.exp, 1, ["even", "odd"]),
+                     {"even": [[0, 1], None, [2, 1], None, [4, 1]],
+                      "odd": [None, 1, None, 3, None]})
+    self.assertEqual(suite.get_history(self.exp, 0, "missing"), [None] * 5)
+    self.assertEqual(suite.get_history(self.exp, 2, "value"), [])
+    self.assertEqual(suite.get_history(self.exp, 2, "all"), {})
+    self.assertFalse(os.path.exists(os.path.join(self.exp, "history.sqlite")))
+
+    self._checkIndexedHistories()
+    self.assertEqual(SparseTagSuite().get_history(self.exp, 1, "value"),
+                     [10, 11, 12, 13, 14])
+    self.assertEqual(sorted(SparseTagSuite().get_history_tags(self.exp)),
+                     ["even", "iteration", "name", "odd", "value"])
+    self.assertEqual(SparseTagSuite().get_value(self.exp, 0, "value"), 4)
+
+
+  def testHistoryAfterAppend(self):
+    self._checkIndexedHistories()
+
+    # The index is refreshed when a log grows, even within the resolution of
+    # the modification time.
+    with open(os.path.join(self.exp, "0.log"), "a") as f:
+      f.write(json.dumps({"value": 5, "new": "tag"}) + "\n")
+    expected = self._checkIndexedHistories()
+    self.assertEqual(SparseTagSuite().get_history(self.exp, 0, "value"),
+                     [0, 1, 2, 3, 4, 5])
+    self.assertEqual(SparseTagSuite().get_history(self.exp, 0, "new"),
+                     [None] * 5 + ["tag"])
+    self.assertEqual(SparseTagSuite().get_history(self.exp, 0, "odd"),
+                     [None, 1, None, 3, None, None])
+
+    # A log that didn't exist when the index was built
+    shutil.copy(os.path.join(self.exp, "1.log"),
+                os.path.join(self.exp, "2.log"))
+    self.assertNotEqual(self._checkIndexedHistories(), expected)
+    self.assertEqual(SparseTagSuite().get_history(self.exp, 2, "value"),
+                     [10, 11, 12, 13, 14])
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,184 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2018, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Test the eviction, the namespaces and the keys of ModelCache.
+"""
+
+import collections
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from htmresearch.support.model_cache import ModelCache
+
+
+
+class ModelCacheTest(unittest.TestCase):
+
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+
+  def _ageEntries(self):
+    """
+    Move the stored models back in time, so that the next one stored or read
+    is the most recently used one regardless of the timestamp resolution.
+    """
+    for name in os.listdir(self.directory):
+      filename = os.path.join(self.directory, name)
+      mtime = os.stat(filename).st_mtime - 100
+      os.utime(filename, (mtime, mtime))
+
+
+  def _put(self, cache, name, size=10):
+    self._ageEntries()
+    cache.put(name, {"name": name, "payload": "x" * size})
+
+
+  def _get(self, cache, name):
+    self._ageEntries()
+    return cache.get(name)
+
+
+  def _getStoredNames(self):
+    return sorted(os.path.splitext(name)[0]
+                  for name in os.listdir(self.directory))
+
+
+  def testMaxEntries(self):
+    cache = ModelCache(self.directory, maxEntries=2)
+    self._put(cache, "a")
+    self._put(cache, "b")
+    self.assertEqual(self._getStoredNames(), ["a", "b"])
+
+    self._put(cache, "c")
+    self.assertEqual(self._getStoredNames(), ["b", "c"])
+    self._put(cache, "d")
+    self.assertEqual(self._getStoredNames(), ["c", "d"])
+
+    model, randomState = self._get(cache, "d")
+    self.assertEqual(model["name"], "d")
+    self.assertIsNone(randomState)
+    self.assertIsNone(self._get(cache, "a"))
+    self.assertEqual(cache.getStatistics()["hits"], 1)
+    self.assertEqual(cache.getStatistics()["misses"], 1)
+
+
+  def testGetRefreshesRecency(self):
+    cache = ModelCache(self.directory, maxEntries=2)
+    self._put(cache, "a")
+    self._put(cache, "b")
+    self._get(cache, "a")
+
+    self._put(cache, "c")
+    self.assertEqual(self._getStoredNames(), ["a", "c"])
+    self._get(cache, "a")
+    self._put(cache, "d")
+    self.assertEqual(self._getStoredNames(), ["a", "d"])
+
+
+  def testMaxBytes(self):
+    cache = ModelCache(self.directory)
+    self._put(cache, "a", size=1000)
+    entryBytes = cache.getStatistics()["bytes"]
+    cache.clear()
+
+    cache = ModelCache(self.directory, maxBytes=2 * entryBytes)
+    self._put(cache, "a", size=1000)
+    self._put(cache, "b", size=1000)
+    self.assertEqual(self._getStoredNames(), ["a", "b"])
+    self._get(cache, "a")
+    self._put(cache, "c", size=1000)
+    self.assertEqual(self._getStoredNames(), ["a", "c"])
+
+    # A small model fits next to one big one.
+    self._put(cache, "d", size=10)
+    self.assertEqual(self._getStoredNames(), ["c", "d"])
+
+    # The model that was just stored is kept even if it doesn't fit.
+    self._put(cache, "e", size=3000)
+    self.assertEqual(self._getStoredNames(), ["e"])
+    self.assertEqual(cache.getStatistics()["entries"], 1)
+
+
+  def testNamespaces(self):
+    trained = []
+    def train():
+      trained.append(len(trained))
+      return trained[-1]
+
+    config = {"numCells": 10}
+    caches = [ModelCache(self.directory, namespace=namespace)
+              for namespace in ("first", "second", "first")]
+    self.assertNotEqual(caches[0].getKey(config), caches[1].getKey(config))
+    self.assertEqual(caches[0].getKey(config), caches[2].getKey(config))
+
+    models = [cache.getOrTrain(config, train, restoreRandomState=False)
+              for cache in caches]
+    self.assertEqual(models, [0, 1, 0])
+    self.assertEqual(cache.getStatistics()["entries"], 2)
+
+
+  def testKeys(self):
+    cache = ModelCache(self.directory)
+    getKey = lambda config: cache.getKey(config, includeRandomState=False)
+
+    self.assertEqual(
+      getKey(collections.OrderedDict([("a", 1), ("b", [2, 3])])),
+      getKey(collections.OrderedDict([("b", [2, 3]), ("a", 1)])))
+    self.assertNotEqual(getKey({"a": 1, "b": 2}), getKey({"a": 2, "b": 1}))
+    self.assertEqual(getKey({"pair": (1, 2)}), getKey({"pair": [1, 2]}))
+    self.assertNotEqual(getKey((1, 2)), getKey((2, 1)))
+    self.assertEqual(getKey({1, 2, 3}), getKey({3, 2, 1}))
+    self.assertEqual(getKey(np.int64(3)), getKey(3))
+    self.assertNotEqual(getKey(1), getKey(1.0))
+    self.assertNotEqual(getKey(0.1), getKey(0.1 + 1e-15))
+
+    array = np.arange(12, dtype="int32").reshape(3, 4)
+    self.assertEqual(getKey(array), getKey(array.copy()))
+    self.assertEqual(getKey(array), getKey(np.asfortranarray(array)))
+    self.assertEqual(getKey(array[:, 1:3]), getKey(array[:, 1:3].copy()))
+    self.assertNotEqual(getKey(array), getKey(array.astype("int64")))
+    self.assertNotEqual(getKey(array), getKey(array.reshape(4, 3)))
+    self.assertNotEqual(getKey(array), getKey(array[::-1]))
+
+
+  def testUnsupportedTypes(self):
+    cache = ModelCache(self.directory)
+    for config in [object(),
+                   {"cells": np.array([1, "a"], dtype="object")},
+                   np.zeros(2, dtype=[("a", "int32"), ("b", "object")])]:
+      with self.assertRaises(TypeError):
+        cache.getKey(config)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
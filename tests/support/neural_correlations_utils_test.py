@@ -0,0 +1,131 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2018, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Check the pairwise correlations against np.corrcoef, one pair of cells at a
+time.
+"""
+
+import unittest
+import warnings
+
+import numpy as np
+
+from htmresearch.support.neural_correlations_utils import (
+  computePWCorrelations, computePWCorrelationsWithinCol)
+
+
+
+def _getPairCorrelations(spikeTrains, removeAutoCorr, pairs):
+  """
+  Compute the correlations of the given pairs of cells with np.corrcoef.
+  """
+  numCells = spikeTrains.shape[0]
+  corrMatrix = np.zeros((numCells, numCells))
+  numNegPCC = 0
+  with warnings.catch_warnings():
+    # Constant spike trains have a NaN correlation.
+    warnings.simplefilter("ignore")
+    for i, j in pairs:
+      if i == j and removeAutoCorr == True:
+        continue
+      if not all(spikeTrains[i,:] == 0) and not all(spikeTrains[j,:] == 0):
+        corrMatrix[i,j] = np.corrcoef(spikeTrains[i,:], spikeTrains[j,:])[0,1]
+        if corrMatrix[i,j] < 0:
+          numNegPCC += 1
+  return (corrMatrix, numNegPCC)
+
+
+
+class PWCorrelationsTest(unittest.TestCase):
+
+
+  def setUp(self):
+    # No two of these spike trains are exactly uncorrelated.
+    np.random.seed(3)
+    self.spikeTrains = (np.random.rand(14, 30) < 0.3).astype("uint32")
+    # A silent cell, a cell that always spikes and two anticorrelated cells.
+    self.spikeTrains[1] = 0
+    self.spikeTrains[6] = 1
+    self.spikeTrains[10] = 1 - self.spikeTrains[9]
+    self.spikeTrains[13] = 0
+
+
+  def _checkCorrelations(self, actual, expected, rtol=1e-7, atol=1e-12):
+    # Rounding decides the sign of correlations that should be zero, so the
+    # spike trains mustn't have any.
+    with np.errstate(invalid="ignore"):
+      nearZero = (expected[0] != 0) & (np.abs(expected[0]) < 1e-6)
+    self.assertFalse(nearZero.any())
+    np.testing.assert_allclose(actual[0], expected[0], rtol=rtol, atol=atol)
+    self.assertEqual(actual[1], expected[1])
+
+
+  def testAllPairs(self):
+    numCells = self.spikeTrains.shape[0]
+    pairs = [(i, j) for i in xrange(numCells) for j in xrange(numCells)]
+
+    for removeAutoCorr in (True, False):
+      expected = _getPairCorrelations(self.spikeTrains, removeAutoCorr, pairs)
+      self.assertTrue(np.isnan(expected[0]).any())
+      self.assertEqual(expected[0][9, 10], -1)
+
+      self._checkCorrelations(
+        computePWCorrelations(self.spikeTrains, removeAutoCorr), expected)
+      self._checkCorrelations(
+        computePWCorrelations(self.spikeTrains, removeAutoCorr, chunkSize=4),
+        expected)
+
+      corrMatrix, numNegPCC = computePWCorrelations(
+        self.spikeTrains, removeAutoCorr, chunkSize=5, dtype="float32")
+      self.assertEqual(corrMatrix.dtype, np.float32)
+      self._checkCorrelations((corrMatrix, numNegPCC), expected,
+                              rtol=1e-5, atol=1e-6)
+
+
+  def testWithinColumns(self):
+    cellsPerColumn = 4
+    # The last two cells aren't part of a whole column.
+    pairs = [(i, j)
+             for col in xrange(3)
+             for i in xrange(col*cellsPerColumn, (col + 1)*cellsPerColumn)
+             for j in xrange(col*cellsPerColumn, (col + 1)*cellsPerColumn)]
+
+    for removeAutoCorr in (True, False):
+      expected = _getPairCorrelations(self.spikeTrains, removeAutoCorr, pairs)
+      corrMatrix, numNegPCC = computePWCorrelationsWithinCol(
+        self.spikeTrains, removeAutoCorr, cellsPerColumn)
+      self._checkCorrelations((corrMatrix, numNegPCC), expected)
+
+      inColumn = np.zeros(corrMatrix.shape, dtype="bool")
+      for i, j in pairs:
+        inColumn[i, j] = True
+      np.testing.assert_array_equal(corrMatrix[~inColumn], 0)
+
+      self._checkCorrelations(
+        computePWCorrelationsWithinCol(self.spikeTrains, removeAutoCorr,
+                                       cellsPerColumn, dtype="float32"),
+        expected, rtol=1e-5, atol=1e-6)
+
+
+
+if __name__ == "__main__":
+  unittest.main()